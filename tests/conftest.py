@@ -0,0 +1,22 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+WSB_DIR = Path(__file__).resolve().parents[1] / "wsb"
+# wsb modules import each other as top level scripts. ie - from base import ...
+sys.path.insert(0, str(WSB_DIR))
+
+
+@pytest.fixture
+def wsb_dir(monkeypatch):
+    """models read listing csvs / templates relative to the wsb folder
+    """
+    monkeypatch.chdir(WSB_DIR)
+    return WSB_DIR
+
+
+@pytest.fixture
+def fake_subreddit():
+    from tests.fakes import make_subreddit
+    return make_subreddit(submissions=20, comments=5)
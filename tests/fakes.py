@@ -0,0 +1,326 @@
+"""Offline stand-ins for the PRAW objects that ModelBase.submissions touches.
+Used by the unit tests and tools/benchmark.py. No credentials needed.
+"""
+import random
+import time
+from datetime import datetime as dt
+
+FILLER = [
+    "to", "the", "moon", "tendies", "yolo", "calls", "puts", "hold",
+    "diamond", "hands", "apes", "strong", "together", "short", "squeeze",
+    "I", "AM", "NOT", "A", "FINANCIAL", "ADVISOR", "DD", "YOLO", "ELON",
+    "BUY", "THE", "DIP", "CEO", "EOD", "HODL",
+]
+PUNCT = [" ", " ", " ", ". ", "! ", ", ", "? "]
+TICKERS = ["GME", "AMC", "BB", "NOK", "PLTR", "TSLA", "AAPL", "SPY", "F",
+           "RH", "NIO", "SNDL", "TLRY", "MSFT", "AMD", "NVDA"]
+FLAIRS = ["DD", "Discussion", "YOLO", "Gain", "Loss", "Meme", "Daily Discussion"]
+EMOJIS = ["🚀", "💎", "🙌", "🦍", "🌙", "📈", "📉", "🤡", "🍗"]
+TITLES = [
+    "{t} YOLO update {e}{e}",
+    "{t} to the moon {e}{e}{e}",
+    "Why {t} is going to {n} - DD",
+    "{t} {n}c {m}/{d} 🤡",
+    "Loss porn: down {n}% on {t}",
+    "Gain porn. {t} printed {e}",
+    "What are your moves tomorrow, {month} {d}, 2021",
+    "is {t} still a buy??",
+    "${t} short interest is {n}% {e}",
+    "Daily Discussion Thread for {month} {d}, 2021",
+]
+DELETED = ["[removed]", "[deleted]", ""]
+MONTHS = ["January", "February", "March"]
+
+
+def synthetic_text(rng, tickers=TICKERS, n_words=30):
+    """one WSB-ish blurb with a few tickers sprinkled in
+    """
+    out = []
+    for _ in range(n_words):
+        r = rng.random()
+        if r < 0.08:
+            word = rng.choice(tickers)
+        elif r < 0.1:
+            word = "$" + rng.choice(tickers)
+        else:
+            word = rng.choice(FILLER)
+        out.append(word + rng.choice(PUNCT))
+    return "".join(out)
+
+
+def synthetic_title(rng, tickers=TICKERS):
+    """WSB-ish post title from TITLES
+    """
+    return rng.choice(TITLES).format(
+        t=rng.choice(tickers), e=rng.choice(EMOJIS), n=rng.randint(1, 900),
+        m=rng.randint(1, 12), d=rng.randint(1, 28), month=rng.choice(MONTHS))
+
+
+def synthetic_body(rng, n_words=80):
+    """self text. some are removed / deleted / link posts, the rest vary in length
+    """
+    if rng.random() < 0.1:
+        return rng.choice(DELETED)
+    text = synthetic_text(rng, n_words=rng.randint(n_words // 8, n_words * 2))
+    if rng.random() < 0.2:
+        text += rng.choice(EMOJIS) * rng.randint(1, 6)
+    return text
+
+
+def synthetic_comment(rng):
+    """short comments, a long one now and then
+    """
+    if rng.random() < 0.05:
+        return rng.choice(DELETED[:2])
+    n_words = rng.randint(3, 25) if rng.random() < 0.9 else rng.randint(50, 200)
+    return synthetic_text(rng, n_words=n_words)
+
+
+class FakeComment:
+    def __init__(self, id, body, created_utc, score=1, author="ape", link_id=None):
+        self.id = id
+        self.link_id = link_id
+        self.body = body
+        self.author = author
+        self.total_awards_received = 0
+        self.downs = 0
+        self.ups = score
+        self.score = score
+        self.created_utc = created_utc
+        self.permalink = f"/r/wallstreetbets/comments/{id}/"
+
+
+class FakeCommentForest:
+    """replace_more + list, like praw.models.comment_forest.CommentForest
+    comments: a list, or a function that builds the list on every list() call.
+    a million comments are never all in memory at once
+    """
+
+    def __init__(self, comments):
+        self._comments = comments
+        self.replace_more_calls = 0
+        self.list_calls = 0
+
+    def replace_more(self, limit=32, threshold=0):
+        self.replace_more_calls += 1
+        return []
+
+    def list(self):
+        self.list_calls += 1
+        if callable(self._comments):
+            return self._comments()
+        return list(self._comments)
+
+
+class FakeSubmission:
+    def __init__(self, id, title, selftext, created_utc, flair="DD",
+                 score=1, comments=(), num_comments=None):
+        self.id = id
+        self.name = f"t3_{id}"
+        self.title = title
+        self.selftext = selftext
+        self.upvote_ratio = 0.9
+        self.ups = score
+        self.score = score
+        self.created_utc = created_utc
+        self.author = "ape"
+        self.link_flair_text = flair
+        self.permalink = f"/r/wallstreetbets/comments/{id}/"
+        self.url = f"https://www.reddit.com{self.permalink}"
+        if not callable(comments):
+            comments = list(comments)
+        self.comments = FakeCommentForest(comments)
+        self.num_comments = len(comments) if num_comments is None else num_comments
+
+
+class FakeStream:
+    """subreddit.stream. submissions() / comments() yield every item once, oldest first.
+    then nothing new ever arrives: None every poll_seconds with pause_after, like praw.
+    stop() ends the generators, ie - to tear a test down
+    """
+
+    def __init__(self, subreddit, poll_seconds=0.01):
+        self.subreddit = subreddit
+        self.poll_seconds = poll_seconds
+        self.stopped = False
+
+    def _stream(self, items, pause_after):
+        for item in items:
+            if self.stopped:
+                return
+            yield item
+        while not self.stopped:
+            time.sleep(self.poll_seconds)
+            if pause_after is not None:
+                yield None
+
+    def _new(self):
+        return sorted(self.subreddit._submissions, key=lambda s: s.created_utc)
+
+    def submissions(self, pause_after=None, skip_existing=False):
+        return self._stream(self._new(), pause_after)
+
+    def comments(self, pause_after=None, skip_existing=False):
+        comments = (comment for submission in self._new()
+                    for comment in submission.comments.list())
+        return self._stream(comments, pause_after)
+
+    def stop(self):
+        self.stopped = True
+
+
+class FakeSubreddit:
+    """hot/top/new/controversial/search over an in memory list of submissions
+    every listing call is recorded in self.calls.
+    page_latency sleeps once per page of 100, like a real listing request.
+    limiter (ie - ratelimit.TokenBucket) is acquired once per page, like RateLimitedRequestor.
+    """
+
+    def __init__(self, submissions, display_name="wallstreetbets",
+                 page_latency=0, limiter=None):
+        self.display_name = display_name
+        self._submissions = list(submissions)
+        self.page_latency = page_latency
+        self.limiter = limiter
+        self.calls = []
+        self.stream = FakeStream(self)
+
+    def _listing(self, name, items, limit):
+        self.calls.append(name)
+        for i, submission in enumerate(items):
+            if limit is not None and i >= limit:
+                return
+            if i % 100 == 0:
+                if self.limiter is not None:
+                    self.limiter.acquire()
+                if self.page_latency:
+                    time.sleep(self.page_latency)
+            yield submission
+
+    def hot(self, limit=None):
+        items = sorted(self._submissions, key=lambda s: -s.score)
+        return self._listing("hot", items, limit)
+
+    def new(self, limit=None):
+        items = sorted(self._submissions, key=lambda s: -s.created_utc)
+        return self._listing("new", items, limit)
+
+    def top(self, time_filter="all", limit=None):
+        items = sorted(self._submissions, key=lambda s: -s.score)
+        return self._listing("top", items, limit)
+
+    def controversial(self, time_filter="all", limit=None):
+        items = sorted(self._submissions, key=lambda s: s.upvote_ratio)
+        return self._listing("controversial", items, limit)
+
+    def search(self, query, sort="relevance", time_filter="all", limit=None):
+        items = self._submissions
+        if query.startswith("flair:"):
+            flair = query[len("flair:"):].strip('"')
+            items = [s for s in items if s.link_flair_text == flair]
+        if sort == "new":
+            items = sorted(items, key=lambda s: -s.created_utc)
+        else:
+            items = sorted(items, key=lambda s: -s.score)
+        return self._listing("search", items, limit)
+
+
+def score(rng, top=10000):
+    """heavy tailed. most posts / comments go nowhere, a few blow up
+    """
+    return min(int(rng.paretovariate(1.2)) - 1, top)
+
+
+def make_subreddit(submissions=100, comments=0, seed=42, start_utc=None,
+                   page_latency=0, display_name="wallstreetbets", limiter=None,
+                   text_pool=None):
+    """seeded synthetic subreddit
+
+    :param submissions: number of submissions
+    :type submissions: int
+    :param comments: comments per submission. built on every comments.list() call
+    :type comments: int
+    :param seed: random seed
+    :type seed: int
+    :param page_latency: seconds per page of 100 listing items
+    :type page_latency: float
+    :param limiter: shared rate limiter, acquired once per page
+    :type limiter: ratelimit.TokenBucket
+    :param text_pool: draw comment bodies from this many distinct comments.
+                    None writes every comment. ie - 1M row benchmarks
+    :type text_pool: int
+    """
+    rng = random.Random(seed)
+    start_utc = start_utc or dt(2021, 2, 1).timestamp()
+    pool = None
+    if text_pool:
+        pool_rng = random.Random(f"{seed}-pool")
+        pool = [synthetic_comment(pool_rng) for _ in range(text_pool)]
+
+    def forest(i, created):
+        def build():
+            # same comments on every call
+            comment_rng = random.Random(f"{seed}-{i}")
+            return [
+                FakeComment(
+                    id=f"c{i:05d}{j:05d}",
+                    body=comment_rng.choice(pool) if pool else synthetic_comment(comment_rng),
+                    created_utc=created + j,
+                    score=score(comment_rng, top=5000),
+                    link_id=f"t3_s{i:06d}",
+                )
+                for j in range(comments)
+            ]
+        return build
+
+    posts = []
+    for i in range(submissions):
+        created = start_utc + i * 60
+        posts.append(FakeSubmission(
+            id=f"s{i:06d}",
+            title=synthetic_title(rng),
+            selftext=synthetic_body(rng),
+            created_utc=created,
+            flair=rng.choice(FLAIRS),
+            score=score(rng),
+            comments=forest(i, created),
+            num_comments=comments,
+        ))
+    return FakeSubreddit(posts, display_name=display_name,
+                         page_latency=page_latency, limiter=limiter)
+
+
+def synthetic_curated(rows, seed=42, last_updated=None):
+    """seeded curated frame. same columns as the DueDiligence curated file
+
+    :param rows: number of submissions
+    :type rows: int
+    :param seed: random seed
+    :type seed: int
+    :param last_updated: model run time (default: 2021-02-01)
+    :type last_updated: datetime obj
+    """
+    import pandas as pd
+
+    rng = random.Random(seed)
+    start = dt(2021, 1, 1).timestamp()
+    ids = [f"s{i:07d}" for i in range(rows)]
+    titles = [synthetic_text(rng, n_words=8) for _ in range(rows)]
+
+    def tickers():
+        return [rng.choice(TICKERS) for _ in range(rng.randint(0, 4))]
+
+    return pd.DataFrame({
+        "id": ids,
+        "title": titles,
+        "score": [rng.randint(0, 10000) for _ in range(rows)],
+        "created": pd.to_datetime(
+            [start + rng.randint(0, 90 * 86400) for _ in range(rows)], unit="s"),
+        "permalink": [f"/r/wallstreetbets/comments/{id}/" for id in ids],
+        "built_url": [f"https://www.reddit.com/r/wallstreetbets/comments/{id}/" for id in ids],
+        "submission_text": "",
+        "last_updated": last_updated or dt(2021, 2, 1),
+        "model": "DueDiligence",
+        "title_ticker": [tickers() for _ in range(rows)],
+        "submission_text_ticker": [tickers() for _ in range(rows)],
+    })
@@ -0,0 +1,714 @@
+from pathlib import Path
+
+import pandas as pd
+
+from tickers import TickerMatcher
+
+
+def test_ticker_matcher_strips_dollar_and_stopwords():
+    matcher = TickerMatcher(["GME", "AMC", "BB", "A", "CEO"], words=["A", "CEO"])
+    series = pd.Series([
+        "$GME to the MOON! buy AMC, BB. ok",
+        "A CEO said nothing ",
+        "",
+    ])
+    candidates, tickers = matcher.extract(series)
+
+    assert candidates[0] == ["$GME", "MOON", "AMC", "BB"]
+    assert tickers == [["GME", "AMC", "BB"], [], []]
+    assert "A" not in matcher
+    assert len(matcher) == 3
+
+
+def test_ticker_matcher_handles_missing_text():
+    matcher = TickerMatcher(["GME"])
+    _, tickers = matcher.extract(pd.Series(["GME ", None]))
+    assert tickers == [["GME"], []]
+
+
+def test_load_universe_is_shared_and_snapshotted(tmp_path):
+    import tickers
+
+    nyse = tmp_path / "nyse.csv"
+    nasdaq = tmp_path / "nasdaq.csv"
+    nyse.write_text("ACT Symbol,Company Name\nF,Ford\nGME,GameStop\n")
+    nasdaq.write_text("Symbol,Company Name\nAMC,AMC\n")
+    snapshot = tmp_path / "tickers.pkl"
+
+    universe = tickers.load_universe(nyse, nasdaq, snapshot)
+    assert universe is tickers.load_universe(nyse, nasdaq, snapshot)
+    assert universe.tickers == ("F", "GME", "AMC")
+    assert universe.matcher(["F"]) is universe.matcher(["F"])
+    assert snapshot.exists()
+
+    # warm start from the snapshot without parsing the csvs
+    tickers._UNIVERSES.clear()
+    paths = (str(nyse.resolve()), str(nasdaq.resolve()))
+    assert tickers._read_snapshot(snapshot, paths) == (["F", "GME"], ["AMC"])
+
+    # changed listing invalidates the snapshot
+    nasdaq.write_text("Symbol,Company Name\nAMC,AMC\nBB,BlackBerry\n")
+    assert tickers._read_snapshot(snapshot, paths) is None
+    assert tickers.load_universe(nyse, nasdaq, snapshot).nasdaq_tickers == ("AMC", "BB")
+
+
+def test_submissions_share_one_raw_file(wsb_dir, fake_subreddit, tmp_path):
+    from models import StockTicker
+
+    model = StockTicker(subreddit=fake_subreddit, timefilter="day",
+                        limit=None, output=str(tmp_path))
+    df = model.submissions(sort="hot")
+
+    assert len(df) == 20
+    assert df["raw_filename"].nunique() == 1
+    assert df["raw_filename"].iloc[0] == model.raw_output
+    assert Path(model.raw_output).exists()
+
+
+def test_fetches_in_the_same_second_keep_their_own_raw_file(wsb_dir, fake_subreddit, tmp_path):
+    from datetime import datetime as dt
+    from base import RunContext
+    from models import StockTicker
+
+    model = StockTicker(subreddit=fake_subreddit, timefilter="day",
+                        limit=None, output=str(tmp_path))
+    sorts = ["hot", "top", "new", "controversial"]
+    dfs = [model.submissions(sort=sort) for sort in sorts]
+    for sort, df in zip(sorts, dfs):
+        assert df["raw_filename"].nunique() == 1
+        assert f"StockTicker_{sort}_" in df["raw_filename"].iloc[0]
+        raw = pd.read_csv(df["raw_filename"].iloc[0], sep="|", index_col=0)
+        assert raw["id"].tolist() == df["id"].tolist()
+
+    now = dt(2021, 2, 1, 10, 15)
+    names = [RunContext(str(tmp_path), "2021/02/01", "StockTicker", now).raw_filename
+             for _ in range(3)]
+    assert [Path(name).name for name in names] == [
+        "StockTicker_101500.csv", "StockTicker_2_101500.csv", "StockTicker_3_101500.csv"]
+
+
+def test_concurrent_submissions_match_serial(wsb_dir, fake_subreddit, tmp_path):
+    from models import StockTicker
+
+    model = StockTicker(subreddit=fake_subreddit, timefilter="day",
+                        limit=15, output=str(tmp_path))
+    sorts = ["hot", "top", "new", "controversial"]
+    serial = pd.concat([model.submissions(sort=sort) for sort in sorts],
+                       ignore_index=True).drop_duplicates(subset=["id"])
+    concurrent = model.concurrent_submissions(sorts, max_workers=4)
+
+    cols = ["id", "sort", "title", "score"]
+    pd.testing.assert_frame_equal(serial[cols].reset_index(drop=True),
+                                  concurrent[cols])
+    assert concurrent["raw_filename"].nunique() == 1
+
+
+def test_comment_rows_expand_each_forest_once(wsb_dir, fake_subreddit, tmp_path):
+    from models import DailyDiscussion
+
+    model = DailyDiscussion(subreddit=fake_subreddit, timefilter="day",
+                            limit=None, output=str(tmp_path), max_workers=4,
+                            replace_more_limit=0)
+    model.search_query = ""
+    df = model.submissions(sort="new", comments=True)
+
+    assert len(df) == 20 * 5
+    assert df["id"].is_unique
+    for submission in fake_subreddit._submissions:
+        assert submission.comments.replace_more_calls == 1
+        assert submission.comments.list_calls == 1
+
+
+def test_synthetic_subreddit_is_seeded(wsb_dir, tmp_path):
+    from models import DailyDiscussion
+    from tests.fakes import make_subreddit
+
+    def fetch(**kwargs):
+        model = DailyDiscussion(subreddit=make_subreddit(submissions=3, comments=200, **kwargs),
+                                timefilter="day", limit=None, output=str(tmp_path))
+        model.search_query = ""
+        return model.submissions(sort="new", comments=True)
+
+    cols = ["id", "comment", "score", "created"]
+    first, again = fetch(), fetch()
+    pd.testing.assert_frame_equal(first[cols], again[cols])
+    assert len(first) == 600
+    assert not first["comment"].equals(fetch(seed=7)["comment"])
+    # comment bodies drawn from a small pool, for 1M row benchmarks
+    assert fetch(text_pool=10)["comment"].nunique() <= 10
+
+
+def test_comment_budget_stops_new_submissions(wsb_dir, fake_subreddit, tmp_path):
+    from models import DailyDiscussion
+
+    model = DailyDiscussion(subreddit=fake_subreddit, timefilter="day",
+                            limit=None, output=str(tmp_path), comment_budget=0)
+    rows = list(model.comment_rows(fake_subreddit.new(), "new", "raw.csv"))
+    assert rows == []
+
+
+def test_incremental_fetch_stops_at_known_content(wsb_dir, fake_subreddit, tmp_path):
+    from models import StockTicker
+    from tests.fakes import FakeSubmission
+
+    def model():
+        return StockTicker(subreddit=fake_subreddit, timefilter="day",
+                           limit=None, output=str(tmp_path), incremental=True)
+
+    assert len(model().submissions(sort="new")) == 20
+
+    newest = max(s.created_utc for s in fake_subreddit._submissions)
+    fake_subreddit._submissions.append(
+        FakeSubmission(id="fresh", title="GME ", selftext="",
+                       created_utc=newest + 60))
+    df = model().submissions(sort="new")
+    assert df["id"].tolist() == ["fresh"]
+
+
+def test_incremental_comments_skip_unchanged_submissions(wsb_dir, fake_subreddit, tmp_path):
+    from models import DailyDiscussion
+
+    def model():
+        m = DailyDiscussion(subreddit=fake_subreddit, timefilter="day",
+                            limit=None, output=str(tmp_path), incremental=True)
+        m.search_query = ""
+        return m
+
+    assert len(model().submissions(sort="new", comments=True)) == 100
+
+    changed = fake_subreddit._submissions[3]
+    changed.num_comments += 1
+    df = model().submissions(sort="new", comments=True)
+    assert set(df["id"].str[:6]) == {"c00003"}
+
+
+def test_sqlite_store_upserts_only_newer_rows(tmp_path):
+    from datetime import datetime as dt
+    from storage import SqliteStore
+    from tests.fakes import synthetic_curated
+
+    store = SqliteStore(str(tmp_path / "curated.sqlite"),
+                        ["title_ticker", "submission_text_ticker"])
+    history = synthetic_curated(50)
+    store.write(history)
+
+    newer = synthetic_curated(3, seed=1, last_updated=dt(2021, 2, 2))
+    newer["id"] = ["s0000001", "s0000002", "new"]
+    older = synthetic_curated(1, seed=2, last_updated=dt(2021, 1, 1))
+    older["id"] = ["s0000003"]
+    store.upsert(newer)
+    store.upsert(older)
+
+    df = store.read().set_index("id")
+    assert len(df) == 51
+    assert df.loc["s0000001", "title"] == newer.loc[0, "title"]
+    assert df.loc["new", "title_ticker"] == newer.loc[2, "title_ticker"]
+    assert df.loc["s0000003", "title"] == history.loc[3, "title"]
+    assert df.loc["s0000004", "title_ticker"] == history.loc[4, "title_ticker"]
+    assert df["created"].dtype.kind == "M"
+
+
+def test_csv_store_round_trips_ticker_lists(tmp_path):
+    from storage import CsvStore, decode_list_column
+    from tests.fakes import synthetic_curated
+
+    ticker_cols = ["title_ticker", "submission_text_ticker"]
+    store = CsvStore(str(tmp_path / "curated.csv"), ticker_cols)
+    history = synthetic_curated(30)
+    store.write(history)
+
+    assert "['" not in (tmp_path / "curated.csv").read_text()
+    df = store.read()
+    assert df["title_ticker"].tolist() == history["title_ticker"].tolist()
+    assert df["created"].dtype.kind == "M"
+
+    legacy = pd.Series(["['GME', 'AMC']", "[]", "['\"BB']", None, "GME;NOK"])
+    assert decode_list_column(legacy) == [["GME", "AMC"], [], ["BB"], [], ["GME", "NOK"]]
+
+
+def test_model_reads_and_writes_curated_once(wsb_dir, fake_subreddit, tmp_path):
+    from unittest import mock
+    from models import StockTicker
+
+    def run():
+        model = StockTicker(subreddit=fake_subreddit, timefilter="day",
+                            limit=None, output=str(tmp_path))
+        df = model.submissions(sort="hot")
+        with mock.patch.object(model.store, "read", wraps=model.store.read) as read, \
+                mock.patch.object(model.store, "write", wraps=model.store.write) as write, \
+                mock.patch.object(model, "chart") as chart:
+            model.model(df)
+        return model, read.call_count, write.call_count, chart
+
+    model, reads, writes, chart = run()
+    assert (reads, writes) == (0, 1)
+    model, reads, writes, chart = run()
+    assert (reads, writes) == (1, 1)
+    assert len(chart.call_args[0][0]) == 20
+    assert set(model.stage_timings) == {
+        "extract_tickers", "clean", "read", "merge", "save", "chart"}
+
+
+def test_chunked_model_times_fetch_apart_from_extract(wsb_dir, fake_subreddit, tmp_path):
+    from unittest import mock
+    from metrics import Metrics
+    from models import StockTicker
+
+    requests = []
+    model = StockTicker(subreddit=fake_subreddit, timefilter="day", limit=None,
+                        output=str(tmp_path), raw_chunk_rows=6,
+                        metrics=Metrics(requests=lambda: len(requests)))
+    extract = model.extract_tickers
+
+    def fetching_chunks():
+        for chunk in model.submission_chunks(sort="hot"):
+            requests.append(1)
+            yield chunk
+
+    with mock.patch.object(model, "chart"), \
+            mock.patch.object(model, "extract_tickers", wraps=extract) as extracted:
+        model.model(fetching_chunks())
+
+    records = {r["stage"]: r for r in model.metrics.records}
+    assert [r["stage"] for r in model.metrics.records][:2] == ["fetch", "extract_tickers"]
+    assert extracted.call_count == 4
+    assert records["fetch"]["rows_out"] == records["extract_tickers"]["rows_out"] == 20
+    assert records["fetch"]["api_requests"] == 4
+    assert records["extract_tickers"]["api_requests"] == 0
+    assert {"fetch", "extract_tickers"} <= set(model.stage_timings)
+
+
+def test_sqlite_curate_writes_back_recleaned_history(wsb_dir, tmp_path):
+    from unittest import mock
+    from models import DueDiligence
+    from tests.fakes import synthetic_curated
+
+    model = DueDiligence(subreddit=None, timefilter="day", limit=None,
+                         output=str(tmp_path), storage="sqlite")
+    history = synthetic_curated(50)
+    model.store.write(history)
+    banned = history["title_ticker"].explode().dropna().iloc[0]
+
+    # the stoplist grew since the history was saved
+    model.ticker_matcher = model.ticker_universe.matcher([*model.words, banned])
+    batch = synthetic_curated(2, seed=1)
+    batch["id"] = ["new1", "new2"]
+    with mock.patch.object(model, "chart"):
+        model.curate(batch)
+
+    df = model.store.read()
+    assert len(df) == 52
+    assert not df["title_ticker"].explode().eq(banned).any()
+    changed = history["title_ticker"].apply(lambda x: banned in x) | \
+        history["submission_text_ticker"].apply(lambda x: banned in x)
+    save = [r for r in model.metrics.records if r["stage"] == "save"][0]
+    assert save["rows_out"] == 2 + changed.sum()
+
+
+def test_ticker_matcher_clean_matches_legacy_lambda():
+    words = ["", "A", "CEO"]
+    matcher = TickerMatcher(["GME", "AMC"], words=words)
+    series = pd.Series([["GME", "'AMC'", ' "CEO" ', "A"], [], ["''"], ["GME"]],
+                       index=["x", "y", "z", "w"])
+
+    legacy = series.apply(lambda x: [
+        i.replace("'", "").replace('"', "").strip() for i in x
+        if i.replace("'", "").replace('"', "").strip() not in words
+    ]).tolist()
+    assert matcher.clean(series) == legacy == [["GME", "AMC"], [], [], ["GME"]]
+
+
+def test_transform_explodes_ticker_columns_independently(wsb_dir, tmp_path):
+    from models import DueDiligence
+    from tests.fakes import synthetic_curated
+
+    model = DueDiligence(subreddit=None, timefilter="day", limit=None,
+                         output=str(tmp_path))
+    df = synthetic_curated(1)
+    df.at[0, "title_ticker"] = ["GME", "AMC", "GME"]
+    df.at[0, "submission_text_ticker"] = ["BB", "NOK", "PLTR"]
+
+    out = model.transform(df, min_count=0)
+    assert out[["ticker", "category"]].values.tolist() == [
+        ["GME", "title_ticker"], ["AMC", "title_ticker"],
+        ["BB", "submission_text_ticker"], ["NOK", "submission_text_ticker"],
+        ["PLTR", "submission_text_ticker"],
+    ]
+
+
+def test_aggregate_chart_keeps_filters_and_top_rows(wsb_dir, tmp_path):
+    import json
+    from models import DueDiligence
+    from tests.fakes import synthetic_curated
+
+    df = synthetic_curated(2000)
+    # squeeze 90 days into 3 so every ticker / day has more than the top rows
+    df["created"] = df["created"].min() + (df["created"] - df["created"].min()) / 30
+
+    specs = {}
+    for mode in ["rows", "aggregate"]:
+        model = DueDiligence(subreddit=None, timefilter="day", limit=None,
+                             output=str(tmp_path), chart_mode=mode)
+        Path(model.semantic_folder).mkdir(parents=True, exist_ok=True)
+        model.chart(df.copy())
+        with open(model.semantic_output, "r", encoding="utf-8") as f:
+            specs[mode] = json.load(f)
+
+    def selections(spec):
+        # the click selector name is auto numbered per chart
+        views = [spec["vconcat"][0], *spec["vconcat"][1]["hconcat"]]
+        return sorted(json.dumps(selection, sort_keys=True)
+                      for view in views for selection in view["selection"].values())
+
+    assert selections(specs["rows"]) == selections(specs["aggregate"])
+
+    rows = pd.DataFrame(*specs["rows"]["datasets"].values())
+    bars, table = [pd.DataFrame(specs["aggregate"]["datasets"][view["data"]["name"]])
+                   for view in [specs["aggregate"]["vconcat"][0],
+                                specs["aggregate"]["vconcat"][1]]]
+    assert len(bars) + len(table) < len(rows)
+    assert bars.groupby("ticker")["mentions"].sum().to_dict() == \
+        rows.groupby("ticker").size().to_dict()
+
+    # the top rows of any ticker / day range are in the table data
+    top = rows.sort_values(["score", "created"], ascending=False)\
+        .groupby("ticker").head(19)
+    assert set(zip(top["ticker"], top["built_url"])) <= \
+        set(zip(table["ticker"], table["built_url"]))
+
+
+def test_external_chart_data_is_content_addressed(wsb_dir, tmp_path):
+    import json
+    from unittest import mock
+    from models import DueDiligence
+    from tests.fakes import synthetic_curated
+
+    model = DueDiligence(subreddit=None, timefilter="day", limit=None,
+                         output=str(tmp_path), semantic_data="external",
+                         data_url="https://example.com/data")
+    df = synthetic_curated(200)
+    model.chart(df.copy())
+
+    with open(model.semantic_output, "r", encoding="utf-8") as f:
+        spec = json.load(f)
+    files = sorted(p.name for p in Path(model.semantic_data_folder).iterdir())
+    urls = {spec["vconcat"][0]["data"]["url"], spec["vconcat"][1]["data"]["url"]}
+    assert "datasets" not in spec
+    assert urls == {f"https://example.com/data/{name}" for name in files}
+    assert all(name.startswith("DueDiligence-") for name in files)
+
+    # same rows in another order -> nothing is rebuilt
+    with mock.patch.object(model, "save_semantic_chart") as save:
+        model.chart(df.sample(frac=1, random_state=1))
+    assert not save.called
+
+    # changed rows -> new data files, the old ones are removed
+    df.loc[0, "score"] += 1
+    model.chart(df)
+    new_files = sorted(p.name for p in Path(model.semantic_data_folder).iterdir())
+    assert new_files != files and len(new_files) == len(files)
+
+
+def test_data_url_follows_the_output_folder(wsb_dir, tmp_path):
+    import base
+    from models import DueDiligence
+
+    model = DueDiligence(subreddit=None, timefilter="day", limit=None,
+                         output="../output/r/stocks", semantic_data="external")
+    assert model.data_url == f"{base.REPO_URL}/output/r/stocks/semantic/data"
+    assert model.worker_kwargs["data_url"] == model.data_url
+
+    model = DueDiligence(subreddit=None, timefilter="day", limit=None,
+                         output=str(tmp_path), semantic_data="external")
+    assert model.data_url == (tmp_path / "semantic" / "data").as_uri()
+
+
+def test_vectorized_chart_dates_keep_the_spec(wsb_dir, tmp_path):
+    import re
+    from contextlib import nullcontext
+    from unittest import mock
+    from models import DueDiligence
+    from tests.fakes import synthetic_curated
+
+    def legacy_dates(df):
+        df["date_str"] = df["created"].map(lambda x: x.strftime("%Y-%m-%d %H:%M"))
+        df["date"] = df["created"].map(lambda x: x.strftime("%Y-%m-%d"))
+        df["date2"] = df["created"].map(lambda x: x.strftime("%Y-%m-%d"))
+        return df
+
+    df = synthetic_curated(300)
+    for mode in ["rows", "aggregate"]:
+        specs = []
+        for patch in [False, True]:
+            model = DueDiligence(subreddit=None, timefilter="day", limit=None,
+                                 output=str(tmp_path / mode / str(patch)), chart_mode=mode)
+            with mock.patch.object(model, "chart_dates", legacy_dates) if patch \
+                    else nullcontext():
+                model.chart(df.copy())
+            # the click selector name is auto numbered per chart
+            specs.append(re.sub(r"selector\d+", "selector",
+                                Path(model.semantic_output).read_text()))
+        assert specs[0] == specs[1]
+
+
+def test_raw_writer_chunks_match_one_shot_csv(tmp_path):
+    from raw import RawWriter
+
+    rows = [{"id": f"c{i}", "comment": f"GME {i}|x", "score": i} for i in range(7)]
+    pd.DataFrame(rows).to_csv(tmp_path / "full.csv", sep="|")
+
+    writer = RawWriter(tmp_path / "chunked.csv", chunk_rows=3)
+    chunks = list(writer.chunks(iter(rows)))
+
+    assert [len(chunk) for chunk in chunks] == [3, 3, 1]
+    assert chunks[2].index.tolist() == [6]
+    assert (tmp_path / "chunked.csv").read_bytes() == (tmp_path / "full.csv").read_bytes()
+    assert not writer.partial_path.exists()
+
+
+def test_crashed_fetch_leaves_partial_raw_file(wsb_dir, fake_subreddit, tmp_path):
+    from models import DailyDiscussion
+
+    model = DailyDiscussion(subreddit=fake_subreddit, timefilter="day", limit=None,
+                            output=str(tmp_path), incremental=True, raw_chunk_rows=10)
+    model.search_query = ""
+
+    rows = model._comment_row
+    calls = []
+
+    def flaky_row(*args, **kwargs):
+        calls.append(1)
+        if len(calls) > 25:
+            raise ConnectionError("reddit is down")
+        return rows(*args, **kwargs)
+
+    model._comment_row = flaky_row
+    try:
+        model.model(model.submission_chunks(sort="new", comments=True))
+    except ConnectionError:
+        pass
+
+    partial = Path(f"{model.raw_output}.part")
+    assert not Path(model.raw_output).exists()
+    assert len(pd.read_csv(partial, sep="|")) == 20
+    # the checkpoint did not move. the next run fetches everything again
+    assert not Path(model.checkpoint.path).exists()
+
+    model._comment_row = rows
+    df = model.submissions(sort="new", comments=True)
+    assert len(df) == 100
+
+
+def test_compact_raw_archives_one_file_per_model_per_day(tmp_path):
+    import archive
+
+    def snapshot(day, name, ids, last_updated, score):
+        folder = tmp_path / "raw" / day
+        folder.mkdir(parents=True, exist_ok=True)
+        path = folder / name
+        pd.DataFrame({
+            "id": ids, "score": score, "comment": "GME | to the\nmoon",
+            "last_updated": last_updated, "raw_filename": str(path),
+        }).to_csv(path, sep="|")
+        return path
+
+    first = snapshot("2021/02/01", "StockTicker_101500.csv", ["a", "b"],
+                     "2021-02-01 10:15:00.000000", 1)
+    snapshot("2021/02/01", "StockTicker_103000.csv", ["b", "c"],
+             "2021-02-01 10:30:00.000000", 2)
+    snapshot("2021/02/01", "DueDiligence_flair_DD_103000.csv", ["a"],
+             "2021-02-01 10:30:00.000000", 3)
+    snapshot("2021/02/02", "StockTicker_090000.csv.part", ["d"],
+             "2021-02-02 09:00:00.000000", 4)
+
+    entries = archive.compact(str(tmp_path), max_workers=2, before="2021/02/03")
+    assert len(entries) == 4
+
+    day = tmp_path / "raw" / "2021" / "02" / "01"
+    assert sorted(p.name for p in day.iterdir()) == ["DueDiligence.csv.gz",
+                                                     "StockTicker.csv.gz"]
+    df = archive.read_day(day)["StockTicker"]
+    assert df[["id", "score"]].values.tolist() == [["a", "1"], ["b", "2"], ["c", "2"]]
+    assert df["comment"].iloc[0] == "GME | to the\nmoon"
+
+    assert archive.locate(str(tmp_path), str(first)) == \
+        str(tmp_path / "raw" / "2021/02/01/StockTicker.csv.gz")
+    assert archive.locate(str(tmp_path), "../output/raw/2021/02/02/StockTicker_090000.csv") \
+        .endswith("2021/02/02/StockTicker.csv.gz")
+
+    # a later compaction folds new snapshots into the existing archive
+    snapshot("2021/02/01", "StockTicker_110000.csv", ["a"],
+             "2021-02-01 11:00:00.000000", 5)
+    # a model filter only reads that model's archive + snapshots
+    assert list(archive.read_day(day, "DueDiligence")) == ["DueDiligence"]
+    assert [p.name for p in archive.raw_files(day, "StockTicker")["StockTicker"]] == \
+        ["StockTicker_110000.csv"]
+    assert archive.raw_files(day, "DueDiligence") == {}
+    archive.compact(str(tmp_path), max_workers=1, before="2021/02/03")
+    df = archive.read_day(day)["StockTicker"]
+    assert df[["id", "score"]].values.tolist() == [["b", "2"], ["c", "2"], ["a", "5"]]
+    assert len(archive.read_index(str(tmp_path))) == 5
+
+
+def test_replay_rebuilds_curated_from_raw(wsb_dir, fake_subreddit, tmp_path):
+    import archive
+    import replay
+    from models import DueDiligence
+
+    model = DueDiligence(subreddit=fake_subreddit, timefilter="day", limit=None,
+                         output=str(tmp_path))
+    model.search_query = ""
+    model.model(model.submission_chunks(sort="top"))
+    curated = model.read_curated().set_index("id").sort_index()
+    model.store.write(curated.iloc[:5])
+    archive.compact(str(tmp_path), max_workers=1, before="9999/12/31")
+
+    rows = replay.replay("DueDiligence", {"output": str(tmp_path)}, max_workers=2)
+    rebuilt = model.read_curated().set_index("id").sort_index()
+
+    assert rows == len(curated) == 20
+    cols = ["title", "score", "created", "last_updated", *model.ticker_cols]
+    pd.testing.assert_frame_equal(rebuilt[cols], curated[cols])
+
+
+def test_merge_latest_matches_full_sort_reference():
+    import random
+    from storage import merge_latest
+
+    def frame(rng, ids):
+        return pd.DataFrame({
+            "id": ids,
+            "last_updated": pd.to_datetime([f"2021-02-0{rng.randint(1, 3)}" for _ in ids]),
+            "score": [rng.randint(0, 3) for _ in ids],
+            "title_ticker": [[rng.choice("ABC")] for _ in ids],
+            "batch": [rng.random() for _ in ids],
+        })
+
+    for seed in range(200):
+        rng = random.Random(seed)
+        old = frame(rng, rng.sample(range(30), rng.randint(0, 20))).set_index("id")
+        # the batch can repeat ids. ie - the same post in hot and top
+        new = frame(rng, [rng.randrange(40) for _ in range(rng.randint(0, 15))])
+
+        # the pre-merge_latest algorithm, sorted so the latest row is last.
+        # stable sort: full ties go to the new batch, then the later batch row
+        reference = pd.concat([old, new.set_index("id")])\
+            .sort_values(["last_updated", "score"], kind="mergesort")
+        reference = reference[~reference.index.duplicated(keep="last")]
+
+        merged = merge_latest(old, new)
+        assert not merged.index.has_duplicates
+        # updated rows keep their place in the history
+        assert merged.index[:len(old)].tolist() == old.index.tolist()
+        pd.testing.assert_frame_equal(merged.sort_index(), reference.sort_index(),
+                                      check_index_type=False, check_dtype=False)
+
+
+def test_warm_flushes_append_without_rereading_history(wsb_dir, tmp_path):
+    from datetime import datetime as dt
+    from unittest import mock
+    from models import DueDiligence
+    from tests.fakes import synthetic_curated
+
+    model = DueDiligence(subreddit=None, timefilter="day", limit=None,
+                         output=str(tmp_path))
+    # written by a cron run. dates without the microseconds of later appends
+    model.store.write(synthetic_curated(50))
+    (tmp_path / "curated" / "DueDiligence.csv").write_text(
+        (tmp_path / "curated" / "DueDiligence.csv").read_text().replace(".000000", ""))
+    model.load_history()
+
+    first = synthetic_curated(3, seed=1, last_updated=dt(2021, 2, 2, 10, 0, 0, 5))
+    first["id"] = ["new1", "new2", "s0000001"]
+    second = synthetic_curated(2, seed=2, last_updated=dt(2021, 2, 2, 11))
+    second["id"] = ["new3", "new1"]
+    with mock.patch.object(model.store, "read", wraps=model.store.read) as read, \
+            mock.patch.object(model.store, "write", wraps=model.store.write) as write, \
+            mock.patch.object(model, "chart") as chart:
+        model.curate_new(first)
+        model.curate_new(second)
+    assert (read.call_count, write.call_count) == (0, 0)
+    assert len(chart.call_args[0][0]) == len(model.history) == 53
+    assert chart.call_args[1] == {"skip_unchanged": False}
+
+    # each flush appended only its rows. read keeps the latest row per id
+    assert len(open(model.curated_output).read().splitlines()) == 1 + 50 + 3 + 2
+    # history order: updated ids keep their position, new ids go last. same as merge_latest
+    assert model.read_curated()["id"].tolist() == model.history.index.tolist()
+    df = model.read_curated().set_index("id")
+    assert len(df) == 53 and df.index.is_unique
+    assert df.loc["new1", "title"] == second.loc[1, "title"]
+    assert df.loc["s0000001", "title"] == first.loc[2, "title"]
+    assert df["created"].dtype.kind == "M"
+    history = model.history.loc[df.index]
+    assert df["title"].tolist() == history["title"].tolist()
+    assert df["title_ticker"].tolist() == history["title_ticker"].tolist()
+
+
+def test_warm_flush_rewrites_a_legacy_curated_file_once(wsb_dir, tmp_path):
+    import shutil
+    from datetime import datetime as dt
+    from models import DueDiligence
+    from tests.fakes import synthetic_curated
+
+    model = DueDiligence(subreddit=None, timefilter="day", limit=None,
+                         output=str(tmp_path))
+    # blank index column, then id, then Unnamed: 0... columns
+    Path(model.curated_output).parent.mkdir(parents=True)
+    shutil.copy("../output/curated/DueDiligence.csv", model.curated_output)
+    legacy = model.read_curated()
+    model.load_history()
+
+    for i, seed in enumerate([1, 2]):
+        batch = synthetic_curated(2, seed=seed, last_updated=dt(2030, 1, 1))
+        batch["id"] = [f"new{i}a", f"new{i}b"]
+        model.curate_new(batch)
+
+    df = model.read_curated()
+    assert len(df) == len(legacy) + 4
+    assert df["id"].notna().all() and df["id"].is_unique
+    assert df["id"].tolist()[-4:] == ["new0a", "new0b", "new1a", "new1b"]
+    assert not any(col.startswith("Unnamed:") for col in
+                   pd.read_csv(model.curated_output, sep="|", nrows=0).columns)
+
+
+def test_daemon_streams_into_curated_and_flushes_on_stop(wsb_dir, fake_subreddit, tmp_path):
+    import threading
+    import time
+    import models
+    from daemon import Daemon
+
+    pairs = {("wallstreetbets", m): getattr(models, m)(
+        subreddit=fake_subreddit, timefilter="day", limit=None, output=str(tmp_path))
+        for m in ["StockTicker", "DueDiligence", "DailyDiscussion"]}
+    flushed = []
+    # tiny queue: the streams are held back while items wait for extraction
+    daemon = Daemon(pairs, flush_interval=3600, flush_rows=10**6, queue_size=2,
+                    on_flush=flushed.extend)
+    thread = threading.Thread(target=daemon.run)
+    thread.start()
+
+    posts = fake_subreddit._submissions
+    deadline = time.monotonic() + 30
+    while daemon.received < len(posts) * 6 and time.monotonic() < deadline:
+        time.sleep(0.05)
+    # nothing is flushed before the interval / row threshold
+    assert flushed == []
+    daemon.stop()
+    thread.join(timeout=30)
+    fake_subreddit.stream.stop()
+
+    assert not thread.is_alive()
+    assert daemon.received == len(posts) * 6
+    assert sorted(m for _, m in flushed) == ["DailyDiscussion", "DueDiligence", "StockTicker"]
+    daily = sum(post.link_flair_text == "Daily Discussion" for post in posts)
+    expected = {"StockTicker": len(posts),
+                "DueDiligence": sum(post.link_flair_text == "DD" for post in posts),
+                "DailyDiscussion": daily * 5}
+    for (_, m), model in pairs.items():
+        curated = model.read_curated()
+        assert len(curated) == expected[m], m
+        assert (curated["sort"] == "stream").all()
+        assert Path(model.semantic_output).exists()
+        raw = pd.read_csv(curated["raw_filename"].iloc[0], sep="|", index_col=0)
+        assert len(raw) == expected[m]
@@ -0,0 +1,321 @@
+import subprocess
+import sys
+
+from tests.conftest import WSB_DIR
+
+HEAVY_MODULES = {"altair", "matplotlib", "jinja2", "praw"}
+
+
+def imported_modules(statement):
+    """top level modules imported by a statement, from python -X importtime
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", statement],
+        cwd=WSB_DIR, capture_output=True, text=True, check=True,
+    )
+    modules = set()
+    for line in result.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if line.startswith("import time:") and "|" in line:
+            name = line.rsplit("|", 1)[1].strip()
+            modules.add(name.split(".")[0])
+    return modules
+
+
+def test_cli_import_skips_heavy_modules():
+    modules = imported_modules("import moneyprinter")
+    assert not modules & (HEAVY_MODULES | {"pandas", "models"})
+
+
+def test_base_import_skips_plotting_stack():
+    modules = imported_modules("import base")
+    assert "pandas" in modules
+    assert not modules & HEAVY_MODULES
+
+
+def test_help_does_not_import_models():
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "moneyprinter.py", "-h"],
+        cwd=WSB_DIR, capture_output=True, text=True, check=True,
+    )
+    assert "usage: moneyprinter.py" in result.stdout
+    assert "pandas" not in result.stderr
+
+
+def test_replace_more_accepts_unbounded(monkeypatch):
+    import moneyprinter
+
+    limits = []
+    for value in ["none", "None", "-1", "0", "8"]:
+        monkeypatch.setattr(sys, "argv", ["moneyprinter.py", "--replace-more", value])
+        limits.append(moneyprinter.parse_args().replace_more)
+    assert limits == [None, None, None, 0, 8]
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+def test_token_bucket_follows_ratelimit_headers():
+    from ratelimit import TokenBucket
+
+    clock = FakeClock()
+    bucket = TokenBucket(rate=2, capacity=3, clock=clock, sleep=clock.sleep)
+    for _ in range(5):
+        bucket.acquire()
+    # 3 token burst, then 2 per second
+    assert clock.now == 1.0
+
+    # window exhausted: wait for the reset instead of hitting a 429
+    bucket.update_from_headers({"x-ratelimit-remaining": "0.0",
+                                "x-ratelimit-reset": "30"})
+    bucket.acquire()
+    assert clock.now == 31.0
+
+    bucket.update_from_headers({})
+    assert bucket.acquired == 6
+
+
+def test_requestor_takes_a_token_per_request():
+    from types import SimpleNamespace
+    from ratelimit import RateLimitedRequestor, TokenBucket
+
+    class FakeSession:
+        headers = {}
+
+        def request(self, *args, **kwargs):
+            return SimpleNamespace(headers={"x-ratelimit-remaining": "100",
+                                            "x-ratelimit-reset": "50"})
+
+    bucket = TokenBucket()
+    requestor = RateLimitedRequestor(user_agent="wsb unit tests", session=FakeSession(),
+                                     limiter=bucket)
+    requestor.request("GET", "https://oauth.reddit.com/r/wallstreetbets/hot")
+    assert bucket.acquired == 1
+    assert bucket.rate == 2
+
+
+def test_http_cache_against_stub_server(tmp_path):
+    import json
+    import threading
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    from httpcache import ResponseCache
+    from ratelimit import RateLimitedRequestor, TokenBucket
+
+    seen = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            seen.append((self.path, self.headers.get("If-None-Match")))
+            if self.headers.get("If-None-Match") == '"v1"':
+                self.send_response(304)
+                self.send_header("x-ratelimit-remaining", "90")
+                self.send_header("x-ratelimit-reset", "60")
+                self.end_headers()
+                return
+
+            body = json.dumps({"kind": "Listing", "path": self.path}).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.send_header("x-ratelimit-remaining", "99")
+            self.send_header("x-ratelimit-reset", "60")
+            if "/top" in self.path:
+                self.send_header("ETag", '"v1"')
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_port}/r/wallstreetbets"
+    clock = FakeClock()
+    bucket = TokenBucket()
+
+    def client(**kwargs):
+        cache = ResponseCache(str(tmp_path / "cache.sqlite"), ttls={"top": 60, "new": 60},
+                              clock=clock, **kwargs)
+        requestor = RateLimitedRequestor(user_agent="wsb unit tests", limiter=bucket,
+                                         cache=cache)
+        return cache, lambda path, **params: requestor.request("GET", base + path,
+                                                               params=params)
+
+    try:
+        cache, get = client()
+        first = get("/top", t="day")
+        assert get("/top", t="day").json() == first.json()
+        get("/top", t="week")
+        get("/about")
+        get("/about")
+        assert len(seen) == 4 and bucket.acquired == 4
+
+        # stale: conditional request, the body comes from disk
+        clock.now += 61
+        stale = get("/top", t="day")
+        assert seen[-1] == ("/r/wallstreetbets/top?t=day", '"v1"')
+        assert stale.json() == first.json()
+        assert stale.headers["x-ratelimit-remaining"] == "90"
+
+        # the next run reads the same file
+        cache, get = client()
+        get("/top", t="day")
+        assert len(seen) == 5
+        assert cache.stats()["hits"] == 1
+
+        # room for two pages: the least recently used one goes
+        size = len(first.content)
+        cache, get = client(max_bytes=2 * size + 8)
+        for page in ["a", "b", "a", "c"]:
+            clock.now += 1
+            get("/new", after=page)
+        get("/new", after="a")
+        get("/new", after="b")
+        assert [path[-1] for path, _ in seen[-4:]] == ["a", "b", "c", "b"]
+        stats = cache.stats()
+        assert (stats["hits"], stats["misses"]) == (2, 4)
+        assert stats["evictions"] >= 2 and stats["bytes"] <= 2 * size + 8
+    finally:
+        server.shutdown()
+
+
+def test_http_cache_skips_stream_polls(tmp_path):
+    from httpcache import ResponseCache, endpoint
+
+    api = "https://oauth.reddit.com"
+    assert endpoint(f"{api}/comments/abc123/") == "comments"
+    assert endpoint(f"{api}/r/wallstreetbets/comments/abc123/title_slug") == "comments"
+    assert endpoint(f"{api}/r/wallstreetbets/comments/") == "comment_listing"
+    assert endpoint(f"{api}/r/wallstreetbets/new.json") == "new"
+
+    cache = ResponseCache(str(tmp_path / "cache.sqlite"))
+    assert cache.ttl(f"{api}/comments/abc123/") == 600
+    # subreddit.stream.comments() / submissions() polls
+    assert cache.ttl(f"{api}/r/wallstreetbets/comments/", {"limit": 100}) == 0
+    assert cache.ttl(f"{api}/r/wallstreetbets/new", {"limit": 100, "before": "t3_x"}) == 0
+    assert cache.ttl(f"{api}/r/wallstreetbets/new", {"limit": 100}) == 60
+
+
+def test_every_subreddit_model_pair_is_scheduled(tmp_path, monkeypatch):
+    import json
+    import threading
+    import moneyprinter
+
+    credentials = tmp_path / "credentials.json"
+    credentials.write_text(json.dumps({"client_id": "x", "client_secret": "y",
+                                       "refresh_token": "z", "user_agent": "test"}))
+    # output_for paths are relative to --output
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(sys, "argv", [
+        "moneyprinter.py", "-c", str(credentials), "-o", "out", "-j", "3",
+        "-r", "wallstreetbets", "stocks", "-st", "-dd"])
+    mp = moneyprinter.MoneyPrinter(moneyprinter.parse_args())
+
+    runs = []
+    monkeypatch.setattr(mp, "pump", lambda: None)
+    monkeypatch.setattr(mp, "run_model", lambda name, m: runs.append(
+        (name, m, mp.output_for(name), threading.current_thread().name)))
+    html = []
+
+    class FakeHTML:
+        def __init__(self, metrics=None):
+            pass
+
+        def tendies(self):
+            html.append(1)
+
+    monkeypatch.setattr("models.HTML", FakeHTML)
+    mp.go_brrr()
+
+    assert sorted(run[:3] for run in runs) == [
+        ("stocks", "DueDiligence", "out/r/stocks"),
+        ("stocks", "StockTicker", "out/r/stocks"),
+        ("wallstreetbets", "DueDiligence", "out"),
+        ("wallstreetbets", "StockTicker", "out"),
+    ]
+    assert all(run[3] != threading.current_thread().name for run in runs)
+    assert html == [1]
+    assert mp.reddit._core._authorizer._authenticator._requestor.limiter is mp.limiter
+
+
+def test_models_run_in_process_pool_and_failures_are_isolated(wsb_dir, tmp_path, monkeypatch):
+    import json
+    import base
+    import models
+    import moneyprinter
+    from tests.fakes import make_subreddit
+
+    credentials = tmp_path / "credentials.json"
+    credentials.write_text(json.dumps({"client_id": "x", "client_secret": "y",
+                                       "refresh_token": "z", "user_agent": "test"}))
+    output = tmp_path / "out"
+    monkeypatch.setattr(sys, "argv", [
+        "moneyprinter.py", "-c", str(credentials), "-o", str(output),
+        "-j", "3", "-p", "2", "-w", "1", "-l", "20", "--all"])
+    mp = moneyprinter.MoneyPrinter(moneyprinter.parse_args())
+    mp.subreddits = {"wallstreetbets": make_subreddit(submissions=20, comments=5)}
+    monkeypatch.setattr(mp, "pump", lambda: None)
+
+    def crash(self):
+        raise RuntimeError("boom")
+
+    monkeypatch.setattr(models.DueDiligence, "tendies", crash)
+    timings = {}
+    in_pool = base.ModelBase._model_in_pool
+
+    def spy(self, df):
+        in_pool(self, df)
+        timings[self._get_name()] = self.stage_timings
+
+    monkeypatch.setattr(base.ModelBase, "_model_in_pool", spy)
+    html = []
+
+    class FakeHTML:
+        def __init__(self, metrics=None):
+            pass
+
+        def tendies(self):
+            html.append(1)
+
+    monkeypatch.setattr(models, "HTML", FakeHTML)
+    import concurrent.futures
+    pools = []
+    pool_class = concurrent.futures.ProcessPoolExecutor
+
+    def pool(*args, **kwargs):
+        pools.append(kwargs.get("mp_context"))
+        return pool_class(*args, **kwargs)
+
+    monkeypatch.setattr(concurrent.futures, "ProcessPoolExecutor", pool)
+    failed = mp.go_brrr()
+
+    # not forked while the model threads hold locks
+    assert [context.get_start_method() for context in pools] == ["spawn"]
+    assert failed == [("wallstreetbets", "DueDiligence")]
+    # the other models ran to the end in the worker processes
+    assert sorted(timings) == ["DailyDiscussion", "StockTicker"]
+    assert all({"fetch", "extract_tickers", "save", "chart"} <= set(stages)
+               for stages in timings.values())
+    assert (output / "semantic" / "StockTicker.json").exists()
+    assert (output / "semantic" / "DailyDiscussion.json").exists()
+    assert not (output / "semantic" / "DueDiligence.json").exists()
+    assert html == [1]
+    assert mp.cpu_pool is None
+
+    report = json.loads((tmp_path / "out" / "metrics" / f"{mp.metrics.started:%Y/%m/%d}" /
+                         f"{mp.metrics_name}.json").read_text())
+    stages = {(r["model"], r["stage"]): r for r in report["stages"]}
+    # worker stages are labelled with the subreddit of the thread that sent them
+    chart = stages[("StockTicker", "chart")]
+    assert chart["subreddit"] == "wallstreetbets" and chart["rows_in"] == 20
+    assert chart["pid"] != stages[("StockTicker", "fetch")]["pid"]
+    assert stages[("DueDiligence", "model")]["wall_s"] >= 0
+    assert {"wall_s", "cpu_s", "api_requests", "peak_rss_mb"} <= set(chart)
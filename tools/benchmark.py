@@ -0,0 +1,750 @@
+"""Offline benchmarks for the wsb pipeline.
+
+Run from the tools folder:
+    python benchmark.py tickers --rows 100000
+    python benchmark.py suite --rows 1000000 --check
+"""
+import argparse
+import csv
+import functools
+import os
+import platform
+import random
+import subprocess
+import sys
+from datetime import datetime as dt
+from pathlib import Path
+from timeit import default_timer as timer
+
+ROOT_DIR = Path(__file__).resolve().parents[1]
+WSB_DIR = ROOT_DIR / "wsb"
+sys.path.insert(0, str(WSB_DIR))
+sys.path.insert(0, str(ROOT_DIR))
+# models read the listing csvs relative to the wsb folder
+os.chdir(WSB_DIR)
+
+import pandas as pd  # noqa: E402
+from tests.fakes import (make_subreddit, synthetic_curated,  # noqa: E402
+                         synthetic_text)
+
+
+def synthetic_comments(rows, seed=42):
+    """seeded comment frame, same columns as DailyDiscussion raw output
+    """
+    rng = random.Random(seed)
+    return pd.DataFrame({
+        "id": [f"c{i:07d}" for i in range(rows)],
+        "comment": [synthetic_text(rng) for _ in range(rows)],
+    })
+
+
+def legacy_extract_tickers(df, col, tickers):
+    """the pre-TickerMatcher implementation of ModelBase.extract_tickers
+    """
+    ticker_pattern = r"(\$*[A-Z]{1,5})(?=[\s\.\?\!\,])+"
+    regex = df[col].str.findall(ticker_pattern)
+    return [
+        [val.lstrip("$")
+         for val in sublist if val.lstrip("$") in set(tickers)]
+        for sublist in regex.values
+    ]
+
+
+def bench_tickers(args):
+    from models import DailyDiscussion
+
+    model = DailyDiscussion(subreddit=None, timefilter="day",
+                            limit=None, output="../output")
+    df = synthetic_comments(args.rows)
+    print(f"corpus: {len(df):,} comments")
+
+    start = timer()
+    new = model.extract_tickers(df.copy())["comment_ticker"].tolist()
+    new_time = timer() - start
+    print(f"TickerMatcher: {new_time:.3f}s")
+
+    legacy_rows = min(args.rows, args.legacy_rows)
+    start = timer()
+    old = legacy_extract_tickers(df.head(legacy_rows), "comment",
+                                 sorted(model.tickers))
+    old_time = (timer() - start) * args.rows / legacy_rows
+    print(f"legacy (extrapolated from {legacy_rows:,} rows): {old_time:.3f}s")
+
+    assert old == new[:legacy_rows], "TickerMatcher output differs from legacy"
+    print(f"speedup: {old_time / new_time:.1f}x")
+
+
+class CallCounter:
+    """wrap a method and count how often it runs
+    """
+
+    def __init__(self, func):
+        self.func = func
+        self.calls = 0
+
+    def __get__(self, obj, objtype=None):
+        return functools.partial(self, obj)
+
+    def __call__(self, *args, **kwargs):
+        self.calls += 1
+        return self.func(*args, **kwargs)
+
+
+def legacy_raw_output(model):
+    """the pre-RunContext ModelBase.raw_output property, evaluated per row
+    """
+    folder = f"{model._output}/raw/{model.date_folder}"
+    model._make_dir(folder)
+    time_str = dt.now().strftime("%H%M%S")
+    return f"{folder}/{model.raw_prefix}_{time_str}.csv"
+
+
+def bench_raw(args):
+    import tempfile
+    from unittest import mock
+    from models import DailyDiscussion
+
+    comments = max(args.rows // 10, 1)
+    subreddit = make_subreddit(submissions=10, comments=comments)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        model = DailyDiscussion(subreddit=subreddit, timefilter="day",
+                                limit=None, output=tmp)
+        # DailyDiscussion searches by flair. every fake post matches
+        model.search_query = ""
+
+        mkdir = CallCounter(Path.mkdir)
+        with mock.patch.object(Path, "mkdir", mkdir):
+            start = timer()
+            df = model.submissions(sort="new", comments=True)
+            new_time = timer() - start
+        new_calls = mkdir.calls
+
+        mkdir = CallCounter(Path.mkdir)
+        with mock.patch.object(Path, "mkdir", mkdir):
+            start = timer()
+            names = {legacy_raw_output(model) for _ in range(len(df))}
+            old_time = timer() - start
+        old_calls = mkdir.calls
+
+    print(f"rows: {len(df):,}")
+    print(f"legacy raw_output per row: {old_calls:,} mkdir calls, "
+          f"{len(names)} distinct file names, {old_time:.3f}s")
+    print(f"RunContext: {new_calls:,} mkdir calls, "
+          f"{df['raw_filename'].nunique()} distinct file names, "
+          f"{new_time:.3f}s for the whole fetch")
+
+
+def bench_listings(args):
+    import tempfile
+    from models import StockTicker
+
+    sorts = ["hot", "top", "new", "controversial"]
+    subreddit = make_subreddit(submissions=args.rows,
+                               page_latency=args.latency)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        model = StockTicker(subreddit=subreddit, timefilter="day",
+                            limit=1000, output=tmp)
+
+        start = timer()
+        serial = pd.concat([model.submissions(sort=sort) for sort in sorts],
+                           ignore_index=True).drop_duplicates(subset=["id"])
+        serial_time = timer() - start
+
+        start = timer()
+        concurrent = model.concurrent_submissions(sorts, max_workers=4)
+        concurrent_time = timer() - start
+
+    assert serial["id"].tolist() == concurrent["id"].tolist()
+    print(f"{len(serial):,} unique submissions, {args.latency}s per page")
+    print(f"serial: {serial_time:.3f}s")
+    print(f"concurrent: {concurrent_time:.3f}s")
+    print(f"speedup: {serial_time / concurrent_time:.1f}x")
+
+
+def bench_store(args):
+    import tempfile
+    from storage import STORES, merge_latest as merge
+
+    ticker_cols = ["title_ticker", "submission_text_ticker"]
+    sizes = sorted({max(args.rows // 100, 1), max(args.rows // 10, 1), args.rows})
+    batch = synthetic_curated(1000, seed=7, last_updated=dt(2021, 2, 2))
+
+    print(f"{'backend':>8} {'history':>10} {'upsert 1k':>10} {'read':>8}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in sizes:
+            history = synthetic_curated(size)
+            for name, store_class in STORES.items():
+                store = store_class(f"{tmp}/{name}_{size}.{store_class.extension}",
+                                    ticker_cols)
+                store.write(history)
+
+                start = timer()
+                store.upsert(batch, merge)
+                upsert_time = timer() - start
+
+                start = timer()
+                store.read()
+                read_time = timer() - start
+                print(f"{name:>8} {size:>10,} {upsert_time:>9.3f}s {read_time:>7.3f}s")
+
+
+def bench_codec(args):
+    import random
+    from ast import literal_eval
+    from storage import decode_list_column, encode_list_column
+    from tests.fakes import TICKERS
+
+    rng = random.Random(42)
+    lists = pd.Series([[rng.choice(TICKERS) for _ in range(rng.randint(0, 4))]
+                       for _ in range(args.rows)])
+    legacy = lists.astype(str)
+    print(f"{args.rows:,} ticker lists")
+
+    start = timer()
+    old = [literal_eval(v) for v in legacy]
+    print(f"literal_eval python repr: {timer() - start:.3f}s")
+
+    start = timer()
+    assert decode_list_column(legacy) == old
+    print(f"decode python repr: {timer() - start:.3f}s")
+
+    start = timer()
+    encoded = encode_list_column(lists)
+    print(f"encode ; delimited: {timer() - start:.3f}s")
+
+    start = timer()
+    assert decode_list_column(encoded) == old
+    print(f"decode ; delimited: {timer() - start:.3f}s")
+
+
+def bench_clean(args):
+    from models import DueDiligence
+
+    model = DueDiligence(subreddit=None, timefilter="day",
+                         limit=None, output="../output")
+    df = synthetic_curated(args.rows)
+    print(f"{args.rows:,} curated rows, {len(model.words)} stoplist words")
+
+    start = timer()
+    legacy = {
+        col: df[col].apply(
+            lambda x: [
+                i.replace("'", "").replace('"', "").strip() for i in x
+                if i.replace("'", "").replace('"', "").strip() not in model.words
+            ]
+        ).tolist()
+        for col in model.ticker_cols
+    }
+    legacy_time = timer() - start
+    print(f"legacy per row lambda + list lookup: {legacy_time:.3f}s")
+
+    start = timer()
+    cleaned = model.clean_curated(df.copy())
+    new_time = timer() - start
+    print(f"vectorized isin: {new_time:.3f}s")
+
+    for col in model.ticker_cols:
+        assert cleaned[col].tolist() == legacy[col], col
+    print(f"speedup: {legacy_time / new_time:.1f}x")
+
+
+def legacy_transform(model, df, min_count=1):
+    """the pre user-011 ModelBase.transform. explodes the cross product
+    """
+    df = model.explode(df, model.ticker_cols)
+    main_cols = ["id", "title", "permalink", "built_url", "score", "created"]
+
+    all_dfs = []
+    for col in model.ticker_cols:
+        temp_df = df[[*main_cols, col]].drop_duplicates(subset=['id', col])
+        temp_df["category"] = col
+        temp_df = temp_df.rename({col: "ticker"}, axis=1)
+        all_dfs.append(temp_df)
+
+    transformed_df = pd.concat(all_dfs, ignore_index=True)
+    return model.filter_count(transformed_df, "ticker", min_count)
+
+
+def bench_transform(args):
+    import random
+    import tracemalloc
+    from models import DueDiligence
+    from tests.fakes import TICKERS
+
+    model = DueDiligence(subreddit=None, timefilter="day",
+                         limit=None, output="../output")
+    rows = max(args.rows // 100, 1)
+    rng = random.Random(42)
+    df = synthetic_curated(rows)
+    # big DD posts: lots of tickers in both the title and the text
+    df["title_ticker"] = [rng.choices(TICKERS, k=20) for _ in range(rows)]
+    df["submission_text_ticker"] = [rng.choices(TICKERS, k=40) for _ in range(rows)]
+    print(f"{rows:,} posts, 20 title + 40 text tickers each")
+
+    results = {}
+    for name, func in [("legacy cross product", lambda d: legacy_transform(model, d)),
+                       ("per column explode", model.transform)]:
+        tracemalloc.start()
+        start = timer()
+        results[name] = func(df.copy())
+        elapsed = timer() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(f"{name}: {elapsed:.3f}s, peak {peak / 2**20:.1f} MiB")
+
+    legacy, new = results.values()
+    pd.testing.assert_frame_equal(legacy, new)
+
+
+def bench_chart(args):
+    import json
+    import tempfile
+    from models import DueDiligence
+
+    rows = max(args.rows // 10, 1)
+    df = synthetic_curated(rows)
+    print(f"{rows:,} curated rows")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for mode in ["rows", "aggregate"]:
+            model = DueDiligence(subreddit=None, timefilter="day", limit=None,
+                                 output=tmp, chart_mode=mode)
+            Path(model.semantic_folder).mkdir(parents=True, exist_ok=True)
+            start = timer()
+            model.chart(df.copy())
+            elapsed = timer() - start
+
+            size = Path(model.semantic_output).stat().st_size
+            with open(model.semantic_output, "r", encoding="utf-8") as f:
+                datasets = json.load(f)["datasets"]
+            data_rows = sum(len(values) for values in datasets.values())
+            print(f"{mode:>9}: {elapsed:.3f}s, {size / 2**20:.2f} MiB json, "
+                  f"{data_rows:,} data rows")
+
+
+def bench_dates(args):
+    from base import ModelBase
+
+    created = synthetic_curated(args.rows)["created"]
+    print(f"{args.rows:,} exploded mention rows")
+
+    start = timer()
+    legacy = [
+        created.map(lambda x: x.strftime("%Y-%m-%d %H:%M")),
+        created.map(lambda x: x.strftime("%Y-%m-%d")),
+        created.map(lambda x: x.strftime("%Y-%m-%d")),
+    ]
+    legacy_time = timer() - start
+    print(f"legacy map(strftime) x3: {legacy_time:.3f}s")
+
+    start = timer()
+    new = [
+        ModelBase.format_dates(created, "min", "%Y-%m-%d %H:%M"),
+        ModelBase.format_dates(created, "D", "%Y-%m-%d"),
+    ]
+    new_time = timer() - start
+    print(f"strftime per distinct minute / day: {new_time:.3f}s")
+
+    assert legacy[0].tolist() == new[0].tolist()
+    assert legacy[1].tolist() == new[1].tolist()
+    print(f"speedup: {legacy_time / new_time:.1f}x")
+
+
+def legacy_submissions(model, sort=None, comments=False):
+    """the pre-RawWriter ModelBase.submissions. every row dict, then the frame
+    """
+    search, sort, search_kwargs = model._search(sort)
+    raw_filename = model.new_run_context().raw_filename
+    listing = model._incremental(search(**search_kwargs), sort, comments)
+    data = list(model.comment_rows(listing, sort, raw_filename))
+    df = pd.DataFrame(data)
+    model._raw_save(df)
+    return df
+
+
+def bench_stream(args):
+    import tempfile
+    import tracemalloc
+    from models import DailyDiscussion
+
+    comments = max(args.rows // 10, 1)
+    subreddit = make_subreddit(submissions=10, comments=comments)
+    print(f"{comments * 10:,} comments")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        model = DailyDiscussion(subreddit=subreddit, timefilter="day",
+                                limit=None, output=tmp)
+        # DailyDiscussion searches by flair. every fake post matches
+        model.search_query = ""
+
+        def stream():
+            for chunk in model.submission_chunks(sort="new", comments=True):
+                model.extract_tickers(chunk)
+
+        for name, func in [
+                ("legacy list + frame", lambda: legacy_submissions(model, "new", True)),
+                ("submissions (chunks + concat)", lambda: model.submissions("new", True)),
+                ("submission_chunks + extract_tickers per chunk", stream)]:
+            tracemalloc.start()
+            start = timer()
+            func()
+            elapsed = timer() - start
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            print(f"{name}: {elapsed:.3f}s, peak {peak / 2**20:.1f} MiB")
+
+
+def bench_compact(args):
+    import shutil
+    import tempfile
+    from archive import compact
+
+    days, snapshots = 8, 24
+    rows = max(args.rows // (days * snapshots), 1)
+    history = synthetic_curated(rows * 4)
+    print(f"{days} days x {snapshots} snapshots x {rows:,} rows")
+
+    def files(folder):
+        paths = [p for p in Path(folder).rglob("*") if p.is_file()]
+        return len(paths), sum(p.stat().st_size for p in paths) / 2**20
+
+    with tempfile.TemporaryDirectory() as tmp:
+        source = Path(tmp, "source")
+        for day in range(days):
+            folder = source / "raw" / f"2021/02/{day + 1:02d}"
+            folder.mkdir(parents=True)
+            for snapshot in range(snapshots):
+                # 15 minute runs see mostly the same posts again
+                df = history.sample(rows, random_state=day * snapshots + snapshot)
+                df["last_updated"] = dt(2021, 2, day + 1, snapshot)
+                df.to_csv(folder / f"DueDiligence_flair_DD_{snapshot:02d}0000.csv",
+                          sep="|")
+
+        count, size = files(source)
+        print(f"before: {count:,} files, {size:.1f} MiB")
+        for workers in sorted({1, os.cpu_count() or 1, 4}):
+            target = Path(tmp, f"workers_{workers}")
+            shutil.copytree(source, target)
+            start = timer()
+            compact(str(target), max_workers=workers, before="2021/03/01")
+            elapsed = timer() - start
+            count, size = files(target)
+            print(f"{workers} workers: {elapsed:.3f}s -> {count:,} files, {size:.1f} MiB")
+
+
+def bench_replay(args):
+    import tempfile
+    import replay
+    from archive import compact
+
+    days = 30
+    rows = max(args.rows // days, 1)
+    print(f"{days} days x {rows:,} raw DueDiligence rows")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for day in range(days):
+            folder = Path(tmp, "raw", f"2021/01/{day + 1:02d}")
+            folder.mkdir(parents=True)
+            df = synthetic_curated(rows, seed=day)
+            df["id"] = [f"d{day:02d}{i:07d}" for i in range(rows)]
+            df["last_updated"] = dt(2021, 1, day + 1)
+            df.drop(columns=["title_ticker", "submission_text_ticker"])\
+                .to_csv(folder / "DueDiligence_flair_DD_000000.csv", sep="|")
+        compact(tmp, before="2021/02/01")
+
+        for workers in sorted({1, os.cpu_count() or 1, 4}):
+            start = timer()
+            curated = replay.replay("DueDiligence", {"output": tmp}, max_workers=workers)
+            print(f"{workers} workers: {timer() - start:.3f}s for {curated:,} curated rows")
+
+
+def legacy_merge(old, new):
+    """the pre-merge_latest ModelBase.merge. sorts the whole history every run
+    """
+    return pd.concat([old, new.set_index("id")]).sort_values(
+        ["last_updated", "score"], ascending=False).groupby(level=0).last()
+
+
+def bench_merge(args):
+    from storage import merge_latest
+
+    history = synthetic_curated(args.rows).set_index("id")
+    # half updates of known ids, half new ids
+    batch = synthetic_curated(1000, seed=7, last_updated=dt(2021, 2, 2))
+    batch["id"] = [f"s{i:07d}" for i in range(0, 1000, 2)] + \
+        [f"n{i:07d}" for i in range(500)]
+    print(f"{len(history):,} history rows + {len(batch):,} batch rows")
+
+    start = timer()
+    legacy = legacy_merge(history, batch)
+    print(f"legacy concat + sort + groupby.last: {timer() - start:.3f}s")
+
+    start = timer()
+    merged = merge_latest(history, batch)
+    print(f"merge_latest: {timer() - start:.3f}s")
+    assert len(merged) == len(legacy)
+
+
+def bench_fanout(args):
+    import tempfile
+    from concurrent.futures import ThreadPoolExecutor
+    import models
+    from ratelimit import TokenBucket
+
+    names = ["wallstreetbets", "stocks", "options", "investing"]
+    model_names = ["StockTicker", "DueDiligence"]
+    rate = 20
+    print(f"{len(names)} subreddits x {len(model_names)} models, {args.rows:,} posts each, "
+          f"{args.latency}s per page, api cap {rate} pages/s")
+
+    def run(jobs):
+        limiter = TokenBucket(rate=rate, capacity=rate)
+        subreddits = {name: make_subreddit(submissions=args.rows, display_name=name,
+                                           page_latency=args.latency, limiter=limiter)
+                      for name in names}
+        with tempfile.TemporaryDirectory() as tmp:
+            def run_model(name, m):
+                model = getattr(models, m)(subreddit=subreddits[name], timefilter="day",
+                                           limit=1000, output=f"{tmp}/r/{name}")
+                model.tendies()
+
+            start = timer()
+            with ThreadPoolExecutor(max_workers=jobs) as pool:
+                for future in [pool.submit(run_model, name, m)
+                               for name in names for m in model_names]:
+                    future.result()
+            elapsed = timer() - start
+        print(f"{jobs} jobs: {elapsed:.3f}s, {limiter.acquired} pages, "
+              f"{limiter.acquired / elapsed:.1f} pages/s")
+
+    for jobs in [1, len(names) * len(model_names)]:
+        run(jobs)
+
+
+SUITE_STAGES = ["fetch", "extract_tickers", "save", "merge", "transform", "chart"]
+HISTORY_FIELDS = ["recorded", "commit", "dirty", "rows", "stage", "seconds", "peak_mib",
+                  "python", "pandas", "machine"]
+
+
+def suite_pass(rows, output):
+    """one pass of the pipeline over synthetic DailyDiscussion threads.
+    one function per stage, in SUITE_STAGES order. each needs the ones before it
+
+    :param rows: comment rows
+    :type rows: int
+    :param output: empty output folder
+    :type output: str
+    """
+    from models import DailyDiscussion
+
+    # one daily thread per 10k comments, like the busy days
+    submissions = max(rows // 10000, 1)
+    subreddit = make_subreddit(submissions=submissions, comments=max(rows // submissions, 1),
+                               text_pool=min(rows, 50000))
+    model = DailyDiscussion(subreddit=subreddit, timefilter="day", limit=None,
+                            output=output, chart_mode="aggregate")
+    # DailyDiscussion searches by flair. every fake post matches
+    model.search_query = ""
+    state = {}
+
+    def fetch():
+        state["raw"] = model.submissions(sort="new", comments=True)
+
+    def extract_tickers():
+        df = model.extract_tickers(state["raw"])
+        state["curated"] = model.clean_curated(df.set_index("id"))
+
+    def save():
+        # 90% of the thread is the history of earlier runs
+        curated = state["curated"]
+        model.save(curated.iloc[:len(curated) * 9 // 10], overwrite=True)
+
+    def merge():
+        # the next run: the last 10% is new, the 10% before it is re-scored
+        curated = state["curated"]
+        batch = curated.iloc[len(curated) * 8 // 10:].copy()
+        batch["score"] += 1
+        batch["last_updated"] = batch["last_updated"] + pd.Timedelta(minutes=15)
+        model.save(batch.reset_index())
+
+    def transform():
+        model.transform(state["curated"].reset_index())
+
+    def chart():
+        Path(model.semantic_folder).mkdir(parents=True, exist_ok=True)
+        model.chart(state["curated"].reset_index())
+
+    return [fetch, extract_tickers, save, merge, transform, chart]
+
+
+def run_suite(rows, repeat=1):
+    """time every stage (best of repeat), then one more pass for the tracemalloc peaks.
+    tracemalloc slows python allocations down, so it stays out of the timed passes
+
+    :return: dict of stage -> (seconds, peak MiB)
+    """
+    import tempfile
+    import tracemalloc
+
+    seconds = {}
+    peaks = {}
+    for run in range(repeat + 1):
+        with tempfile.TemporaryDirectory() as tmp:
+            traced = run == repeat
+            for func in suite_pass(rows, tmp):
+                if traced:
+                    tracemalloc.start()
+                start = timer()
+                func()
+                elapsed = timer() - start
+                if traced:
+                    peaks[func.__name__] = tracemalloc.get_traced_memory()[1] / 2**20
+                    tracemalloc.stop()
+                else:
+                    seconds[func.__name__] = min(elapsed, seconds.get(func.__name__, elapsed))
+
+    return {stage: (seconds[stage], peaks[stage]) for stage in SUITE_STAGES}
+
+
+def git_commit():
+    """(short sha, dirty) of the checkout. ("unknown", False) outside git
+    """
+    def git(*cmd):
+        return subprocess.run(["git", *cmd], cwd=ROOT_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    try:
+        return git("rev-parse", "--short", "HEAD"), \
+            bool(git("status", "--porcelain", "--untracked-files=no"))
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown", False
+
+
+def read_history(path):
+    if not Path(path).exists():
+        return []
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        return list(csv.DictReader(f))
+
+
+def baseline(history, rows, commit):
+    """latest record of each stage from another commit, same size + machine
+
+    :return: dict of stage -> history row
+    """
+    found = {}
+    for row in history:
+        if row["rows"] == str(rows) and row["machine"] == platform.node() and \
+                row["commit"] != commit:
+            found[row["stage"]] = row
+    return found
+
+
+def regressions(results, base, tolerance, floor=0.05):
+    """stages slower than the baseline by more than tolerance.
+    differences under floor seconds are noise
+
+    :param results: dict of stage -> (seconds, peak MiB)
+    :param base: see baseline
+    :param tolerance: ie - 0.25 is 25% slower
+    :return: list of stage names
+    """
+    slow = []
+    for stage, (seconds, peak) in results.items():
+        if stage not in base:
+            continue
+        before = float(base[stage]["seconds"])
+        if seconds - before > max(floor, before * tolerance):
+            slow.append(stage)
+    return slow
+
+
+def bench_suite(args):
+    """fetch -> extract_tickers -> save -> merge -> transform -> chart.
+    every run is appended to --history and compared with the last other commit
+    """
+    commit, dirty = git_commit()
+    print(f"{args.rows:,} comment rows, commit {commit}{' (dirty)' if dirty else ''}")
+    results = run_suite(args.rows, repeat=args.repeat)
+
+    history = read_history(args.history)
+    base = baseline(history, args.rows, commit)
+    slow = regressions(results, base, args.tolerance)
+
+    def change(now, row, field):
+        if row is None:
+            return ""
+        before = float(row[field])
+        return f"{(now - before) / before:+.0%}" if before else ""
+
+    print(f"{'stage':>16} {'time':>9} {'vs base':>8} {'peak':>10} {'vs base':>8}")
+    for stage, (seconds, peak) in results.items():
+        row = base.get(stage)
+        flag = "  REGRESSION" if stage in slow else ""
+        print(f"{stage:>16} {seconds:>8.3f}s {change(seconds, row, 'seconds'):>8} "
+              f"{peak:>6.1f} MiB {change(peak, row, 'peak_mib'):>8}{flag}")
+    if base:
+        print(f"base: commit {next(iter(base.values()))['commit']}")
+
+    Path(args.history).parent.mkdir(parents=True, exist_ok=True)
+    new_file = not Path(args.history).exists()
+    with open(args.history, "a", encoding="utf-8", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=HISTORY_FIELDS)
+        if new_file:
+            writer.writeheader()
+        recorded = dt.now().isoformat(timespec="seconds")
+        for stage, (seconds, peak) in results.items():
+            writer.writerow({"recorded": recorded, "commit": commit, "dirty": dirty,
+                             "rows": args.rows, "stage": stage,
+                             "seconds": round(seconds, 4), "peak_mib": round(peak, 2),
+                             "python": platform.python_version(),
+                             "pandas": pd.__version__, "machine": platform.node()})
+
+    if slow and args.check:
+        sys.exit(f"regressions over {args.tolerance:.0%}: {', '.join(slow)}")
+
+
+BENCHMARKS = {
+    "tickers": bench_tickers,
+    "raw": bench_raw,
+    "listings": bench_listings,
+    "store": bench_store,
+    "codec": bench_codec,
+    "clean": bench_clean,
+    "transform": bench_transform,
+    "chart": bench_chart,
+    "dates": bench_dates,
+    "stream": bench_stream,
+    "compact": bench_compact,
+    "replay": bench_replay,
+    "merge": bench_merge,
+    "fanout": bench_fanout,
+    "suite": bench_suite,
+}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='wsb offline benchmarks')
+    parser.add_argument('benchmark', choices=sorted(BENCHMARKS),
+                        help='benchmark to run')
+    parser.add_argument('-r', '--rows', type=int, default=100000,
+                        help='synthetic corpus size. Default is 100000')
+    parser.add_argument('--legacy-rows', type=int, default=2000,
+                        help='rows to run through the slow legacy path. Default is 2000')
+    parser.add_argument('--latency', type=float, default=0.2,
+                        help='fake seconds per listing page of 100. Default is 0.2')
+    parser.add_argument('--repeat', type=int, default=1,
+                        help='suite: timed passes, the best one counts. Default is 1')
+    parser.add_argument('--history', type=str, default=str(ROOT_DIR / ".benchmarks" / "history.csv"),
+                        help='suite: results of every run, per commit. Default is ../.benchmarks/history.csv')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='suite: slowdown vs the last other commit that counts as a regression. Default is 0.25')
+    parser.add_argument('--check', action='store_true',
+                        help='suite: exit 1 on regressions. Default is False')
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    BENCHMARKS[args.benchmark](args)
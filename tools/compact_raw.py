@@ -0,0 +1,39 @@
+"""Compact output/raw/YYYY/MM/DD snapshots into one archive per model per day.
+
+Run from the tools folder:
+    python compact_raw.py
+"""
+import argparse
+import sys
+from pathlib import Path
+from timeit import default_timer as timer
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "wsb"))
+
+from archive import ARCHIVE_FORMATS, compact  # noqa: E402
+
+
+def main(args):
+    start = timer()
+    entries = compact(args.output, fmt=args.format, max_workers=args.workers,
+                      remove=not args.keep, before=args.before)
+    days = {entry["archive"].rsplit("/", 1)[0] for entry in entries}
+    rows = sum(entry["rows"] for entry in entries)
+    print(f"compacted {len(entries):,} raw files ({rows:,} rows) "
+          f"from {len(days):,} days in {timer() - start:.2f}s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='compact raw snapshots')
+    parser.add_argument('-o', '--output', type=str, default="../output",
+                        help='output folder. Default is ../output')
+    parser.add_argument('-f', '--format', type=str, default="csv.gz",
+                        choices=ARCHIVE_FORMATS,
+                        help='archive format. parquet needs pyarrow. Default is csv.gz')
+    parser.add_argument('-w', '--workers', type=int, default=None,
+                        help='days compacted in parallel. Default is the cpu count')
+    parser.add_argument('--keep', action='store_true',
+                        help='keep the raw snapshots after archiving. Default is False')
+    parser.add_argument('--before', type=str, default=None,
+                        help='only compact days before YYYY/MM/DD. Default is today')
+    main(parser.parse_args())
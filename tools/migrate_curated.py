@@ -0,0 +1,45 @@
+"""Migrate curated csv files to another storage backend.
+
+Run from the tools folder:
+    python migrate_curated.py --to sqlite
+"""
+import argparse
+import sys
+from pathlib import Path
+from timeit import default_timer as timer
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "wsb"))
+
+from storage import STORES, CsvStore  # noqa: E402
+
+
+def migrate(csv_path, to):
+    """copy one curated csv into the target backend. the csv is left in place
+    """
+    with open(csv_path, "r", encoding="utf-8") as f:
+        header = f.readline().rstrip("\n").split("|")
+    ticker_cols = [col for col in header if col.endswith("_ticker")]
+
+    df = CsvStore(csv_path, ticker_cols).read()
+    target = STORES[to](str(Path(csv_path).with_suffix(f".{STORES[to].extension}")),
+                        ticker_cols)
+    target.write(df)
+    return target.path, len(df)
+
+
+def main(output, to):
+    for csv_path in sorted(Path(output, "curated").glob("*.csv")):
+        start = timer()
+        path, rows = migrate(csv_path, to)
+        print(f"{csv_path} -> {path}: {rows:,} rows in {timer() - start:.2f}s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='migrate curated csv files')
+    parser.add_argument('-o', '--output', type=str, default="../output",
+                        help='output folder. Default is ../output')
+    parser.add_argument('--to', type=str, default="sqlite",
+                        choices=[s for s in STORES if s != "csv"],
+                        help='target storage backend. Default is sqlite')
+    args = parser.parse_args()
+    main(args.output, args.to)
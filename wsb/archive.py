@@ -0,0 +1,241 @@
+# RAW ARCHIVE COMPACTION
+
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime as dt
+from pathlib import Path
+
+import pandas as pd
+
+from raw import PARTIAL_SUFFIX
+
+RAW_DELIM = "|"
+# one archive per model per day: {day folder}/{Model}.{format}
+# parquet needs pyarrow, which is not in requirements.txt
+ARCHIVE_FORMATS = ["csv.gz", "parquet"]
+INDEX_FILE = "index.csv"
+DAY_PATTERN = re.compile(r"\d{4}/\d{2}/\d{2}$")
+
+
+def raw_key(path):
+    """YYYY/MM/DD/{file}. the same key whatever the output folder was.
+    partial files are keyed by the raw file they were meant to become
+    """
+    key = "/".join(Path(str(path)).parts[-4:])
+    if key.endswith(PARTIAL_SUFFIX):
+        key = key[:-len(PARTIAL_SUFFIX)]
+    return key
+
+
+def model_name(path):
+    """ie - StockTicker_hot_101500.csv -> StockTicker
+    """
+    return Path(path).name.split("_", 1)[0]
+
+
+def read_raw(path):
+    """one raw snapshot. every column as str, so the archive round trip is lossless
+    """
+    df = pd.read_csv(path, sep=RAW_DELIM, index_col=0, dtype=str,
+                     keep_default_na=False)
+    return df.reset_index(drop=True)
+
+
+def read_archive(path):
+    if str(path).endswith(".parquet"):
+        return pd.read_parquet(path)
+    return pd.read_csv(path, sep=RAW_DELIM, dtype=str, keep_default_na=False,
+                       compression="gzip")
+
+
+def write_archive(df, path):
+    """atomic write. a crashed compaction never leaves a half archive
+    """
+    path = Path(path)
+    tmp_path = path.with_name(f"{path.name}.tmp")
+    if path.name.endswith(".parquet"):
+        df.to_parquet(tmp_path, index=False)
+    else:
+        df.to_csv(tmp_path, sep=RAW_DELIM, index=False, compression="gzip")
+    os.replace(tmp_path, path)
+
+
+def dedupe(df):
+    """one row per id. the latest snapshot wins
+    """
+    if "id" not in df.columns:
+        return df
+    if "last_updated" in df.columns:
+        # stable sort. same run -> the snapshot read last wins
+        df = df.sort_values("last_updated", kind="mergesort")
+    return df.drop_duplicates(subset="id", keep="last").reset_index(drop=True)
+
+
+def raw_files(day_folder, model=None):
+    """loose raw snapshots of one day per model, oldest first.
+    includes .part files of crashed fetches
+
+    :param day_folder: output/raw/YYYY/MM/DD
+    :type day_folder: str
+    :param model: only this model's snapshots. None is every model
+    :type model: str
+    :return: dict of model -> list of paths
+    """
+    pattern = "*" if model is None else f"{model}_*"
+    paths = [path for path in Path(day_folder).glob(pattern)
+             if (path.name.endswith(".csv") or
+                 path.name.endswith(f".csv{PARTIAL_SUFFIX}")) and
+             (model is None or model_name(path) == model)]
+    files = {}
+    # file names end in _HHMMSS.csv
+    for path in sorted(paths, key=lambda p: (p.name.rsplit("_", 1)[-1], p.name)):
+        files.setdefault(model_name(path), []).append(path)
+    return files
+
+
+def archives(day_folder, model=None):
+    """existing archives of one day
+
+    :param model: only this model's archive. None is every model
+    :type model: str
+    :return: dict of model -> path
+    """
+    found = {}
+    for fmt in ARCHIVE_FORMATS:
+        for path in Path(day_folder).glob(f"{model or '*'}.{fmt}"):
+            found[path.name[:-len(fmt) - 1]] = path
+    return found
+
+
+def read_day(day_folder, model=None):
+    """every raw row of one day per model. the archive + snapshots not compacted yet.
+    one row per id, latest snapshot wins
+
+    :param day_folder: output/raw/YYYY/MM/DD
+    :type day_folder: str
+    :param model: only read this model's files. None is every model
+    :type model: str
+    :return: dict of model -> df of str columns
+    """
+    frames = {name: [read_archive(path)]
+              for name, path in archives(day_folder, model).items()}
+    for name, paths in raw_files(day_folder, model).items():
+        frames.setdefault(name, []).extend(read_raw(path) for path in paths)
+
+    return {name: dedupe(pd.concat(dfs, ignore_index=True))
+            for name, dfs in frames.items()}
+
+
+def compact_day(day_folder, fmt="csv.gz", remove=True):
+    """roll the loose raw snapshots of one day into one archive per model
+
+    :param day_folder: output/raw/YYYY/MM/DD
+    :type day_folder: str
+    :param fmt: one of ARCHIVE_FORMATS
+    :type fmt: str
+    :param remove: delete the snapshots once they are archived
+    :type remove: bool
+    :return: index rows. raw_filename -> archive
+    """
+    existing = archives(day_folder)
+    entries = []
+    for model, paths in raw_files(day_folder).items():
+        archive = Path(day_folder) / f"{model}.{fmt}"
+        frames = []
+        if model in existing:
+            frames.append(read_archive(existing[model]))
+
+        for path in paths:
+            df = read_raw(path)
+            frames.append(df)
+            entries.append({"raw_filename": raw_key(path),
+                            "archive": raw_key(archive),
+                            "rows": len(df)})
+
+        write_archive(dedupe(pd.concat(frames, ignore_index=True)), archive)
+        if model in existing and existing[model] != archive:
+            # format changed since the last compaction
+            existing[model].unlink()
+        if remove:
+            for path in paths:
+                path.unlink()
+
+    return entries
+
+
+def day_folders(output, before=None):
+    """output/raw/YYYY/MM/DD folders, oldest first
+
+    :param output: output folder
+    :type output: str
+    :param before: only days before this YYYY/MM/DD. None is every day
+    :type before: str
+    """
+    raw = Path(output, "raw")
+    folders = []
+    for path in sorted(raw.glob("*/*/*")):
+        day = "/".join(path.parts[-3:])
+        if path.is_dir() and DAY_PATTERN.match(day) and \
+                (before is None or day < before):
+            folders.append(path)
+    return folders
+
+
+def read_index(output):
+    """raw_filename -> archive lineage index
+    """
+    path = Path(output, "raw", INDEX_FILE)
+    if not path.exists():
+        return pd.DataFrame(columns=["raw_filename", "archive", "rows"])
+    return pd.read_csv(path, sep=RAW_DELIM, dtype={"rows": int})
+
+
+def locate(output, raw_filename):
+    """archive that holds the rows of a raw snapshot. None if it is not compacted
+
+    :param output: output folder
+    :type output: str
+    :param raw_filename: raw_filename column of a curated row
+    :type raw_filename: str
+    """
+    index = read_index(output)
+    match = index[index["raw_filename"] == raw_key(raw_filename)]
+    if match.empty:
+        return None
+    return str(Path(output, "raw", match["archive"].iloc[-1]))
+
+
+def compact(output, fmt="csv.gz", max_workers=None, remove=True, before=None):
+    """compact every day folder in a process pool and update the index
+
+    :param output: output folder
+    :type output: str
+    :param fmt: one of ARCHIVE_FORMATS
+    :type fmt: str
+    :param max_workers: process pool size. None is the cpu count
+    :type max_workers: int
+    :param remove: delete the snapshots once they are archived
+    :type remove: bool
+    :param before: only days before this YYYY/MM/DD. (default: today, still being written)
+    :type before: str
+    :return: new index rows
+    """
+    before = before or dt.now().strftime("%Y/%m/%d")
+    folders = day_folders(output, before)
+    entries = []
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        for day_entries in pool.map(compact_day, folders,
+                                    [fmt] * len(folders), [remove] * len(folders)):
+            entries.extend(day_entries)
+
+    if entries:
+        index = pd.concat([read_index(output), pd.DataFrame(entries)],
+                          ignore_index=True)
+        index = index.drop_duplicates(subset="raw_filename", keep="last")
+        path = Path(output, "raw", INDEX_FILE)
+        tmp_path = path.with_name(f"{path.name}.tmp")
+        index.to_csv(tmp_path, sep=RAW_DELIM, index=False)
+        os.replace(tmp_path, path)
+
+    return entries
@@ -1,24 +1,27 @@
 # SUPER CLASSES
 
 import pandas as pd
-# import numpy as np
+import numpy as np
 from datetime import datetime as dt
+import json
 import pprint
+import threading
+import time
+from contextlib import contextmanager
+from concurrent.futures import (ThreadPoolExecutor, FIRST_COMPLETED,
+                                as_completed, wait)
 from pathlib import Path
-from matplotlib import pyplot as plt
-from jinja2 import Template
-import altair as alt
-from ast import literal_eval
+from tickers import load_universe
+from checkpoint import Checkpoint
+from storage import STORES, encode_list_column, latest, merge_latest
+from raw import CHUNK_ROWS, PARTIAL_SUFFIX, RawWriter
+from semantic import (compact_json, content_hash, externalize_datasets,
+                      read_hash, write_hash)
+from workers import run_model
+from metrics import Metrics
 
-# use with caution:
-# https://altair-viz.github.io/user_guide/faq.html#maxrowserror-how-can-i-plot-large-datasets
-alt.data_transformers.disable_max_rows()
-
-# https://github.com/altair-viz/altair/issues/742
-# alt.renderers.set_embed_options(theme='dark')  # only for jupyter
-
-# alt.themes.enable("fivethirtyeight")
-# alt.themes.enable("dark")
+# altair, jinja2 and matplotlib are slow to import.
+# they are only loaded once a chart / html page is actually built. see load_altair
 
 
 def dark_href():
@@ -35,24 +38,131 @@ def dark_href():
     }
 
 
-# register the custom theme under a chosen name
-alt.themes.register('dark_href', dark_href)
+_altair_lock = threading.Lock()
+_altair = None
+
+
+def load_altair():
+    """import and configure altair on first use
+    """
+    global _altair
+    with _altair_lock:
+        if _altair is None:
+            import altair as alt
+
+            # use with caution:
+            # https://altair-viz.github.io/user_guide/faq.html#maxrowserror-how-can-i-plot-large-datasets
+            alt.data_transformers.disable_max_rows()
+
+            # https://github.com/altair-viz/altair/issues/742
+            # alt.renderers.set_embed_options(theme='dark')  # only for jupyter
+
+            # alt.themes.enable("fivethirtyeight")
+            # alt.themes.enable("dark")
+
+            # register the custom theme under a chosen name
+            alt.themes.register('dark_href', dark_href)
+
+            # enable the newly registered theme
+            alt.themes.enable('dark_href')
+            _altair = alt
+
+    return _altair
 
-# enable the newly registered theme
-alt.themes.enable('dark_href')
 
 pp = pprint.PrettyPrinter(indent=4)
 
+# rows shown in the chart data tables
+CHART_TOP_N = 20
+# aggregate: pre-aggregated counts + top rows per ticker per day. small json
+# rows: every exploded mention row inline. the original chart data
+CHART_MODES = ["aggregate", "rows"]
+# inline: datasets embedded in the semantic json
+# external: content addressed dataset files referenced by url. see semantic.py
+SEMANTIC_DATA = ["inline", "external"]
+
+# github pages loads the semantic charts + data from the raw repo files
+REPO_URL = "https://raw.githubusercontent.com/kennybui-data-ai/wallstreetbets/master"
+# the checkout REPO_URL mirrors
+REPO_DIR = Path(__file__).resolve().parent.parent
+
+
+def repo_url(folder):
+    """raw repo url of a local folder. ie - ../output/r/stocks/semantic/data ->
+    {REPO_URL}/output/r/stocks/semantic/data.
+    a folder outside the repo is never pushed, so it gets a file:// url instead
+
+    :param folder: folder, relative to the working directory
+    :type folder: str
+    """
+    path = Path(folder).resolve()
+    try:
+        return f"{REPO_URL}/{path.relative_to(REPO_DIR).as_posix()}"
+    except ValueError:
+        return path.as_uri()
+
+
+class RunContext:
+    """per fetch context. resolved once per ModelBase.submissions call
+    so every row of a fetch shares the same raw file name,
+    and the raw folder is only created once.
+
+    raw file names are never reused. two fetches in the same second
+    (ie - a cache hit, an incremental early stop) get {prefix}_2_{HHMMSS}.csv
+    instead of replacing the first snapshot.
+    """
+    # raw files handed out by this process. their .part files may not exist yet
+    _claimed = set()
+    _lock = threading.Lock()
+
+    def __init__(self, output, date_folder, file_prefix, now=None):
+        """init
+
+        :param output: output folder
+        :type output: str
+        :param date_folder: YYYY/MM/DD
+        :type date_folder: str
+        :param file_prefix: model name + search query + sort
+        :type file_prefix: str
+        :param now: fetch time (default: dt.now())
+        :type now: datetime obj
+        """
+        self.started = now or dt.now()
+        self.raw_folder = f"{output}/raw/{date_folder}"
+        self.time_str = self.started.strftime("%H%M%S")
+        ModelBase._make_dir(self.raw_folder)
+        self.raw_filename = self._claim(file_prefix)
+
+    def _claim(self, file_prefix):
+        """first free raw file name. the time stays last, archive.raw_files sorts on it
+        """
+        with self._lock:
+            n = 1
+            while True:
+                prefix = file_prefix if n == 1 else f"{file_prefix}_{n}"
+                path = f"{self.raw_folder}/{prefix}_{self.time_str}.csv"
+                if path not in self._claimed and not Path(path).exists() and \
+                        not Path(f"{path}{PARTIAL_SUFFIX}").exists():
+                    self._claimed.add(path)
+                    return path
+                n += 1
+
 
 class ModelBase:
     """Superclass for models.py
     PRAW Subreddit:
     https://praw.readthedocs.io/en/latest/code_overview/models/subreddit.html#praw.models.Subreddit
     """
+    # rows are the comments of matching submissions, not the submissions. see daemon.py
+    from_comments = False
 
     def __init__(self, subreddit, timefilter, limit, output,
                  sort="hot", search_query=None,
-                 cols_with_ticker=["title", "submission_text"]):
+                 cols_with_ticker=["title", "submission_text"],
+                 max_workers=1, replace_more_limit=32, comment_budget=None,
+                 incremental=False, storage="csv", chart_mode="aggregate",
+                 semantic_data="inline", data_url=None, raw_chunk_rows=CHUNK_ROWS,
+                 cpu_pool=None, metrics=None):
         """init
 
         :param subreddit: subreddit client
@@ -70,6 +180,30 @@ class ModelBase:
         :type search_query: str
         :param cols_with_ticker: columns with ticker. used for explode, extract, clean
         :type cols_with_ticker: list
+        :param max_workers: concurrent listing / comment fetches. 1 is serial (default: 1)
+        :type max_workers: int
+        :param replace_more_limit: MoreComments to expand per submission.
+                    None expands all, 0 only drops the stubs (default: 32)
+        :type replace_more_limit: int
+        :param comment_budget: seconds to spend expanding comments. None is unbounded
+        :type comment_budget: float
+        :param incremental: only pull content newer than the last run's checkpoint
+        :type incremental: bool
+        :param storage: curated storage backend. one of storage.STORES (default: csv)
+        :type storage: str
+        :param chart_mode: semantic chart data. one of CHART_MODES (default: aggregate)
+        :type chart_mode: str
+        :param semantic_data: one of SEMANTIC_DATA (default: inline)
+        :type semantic_data: str
+        :param data_url: url of the external dataset files.
+                    (default: repo_url of {output}/semantic/data)
+        :type data_url: str
+        :param raw_chunk_rows: rows buffered before they are appended to the raw file
+        :type raw_chunk_rows: int
+        :param cpu_pool: process pool for extract -> chart. None runs them in this thread
+        :type cpu_pool: concurrent.futures.ProcessPoolExecutor obj
+        :param metrics: run metrics shared with the other models. see metrics.py
+        :type metrics: metrics.Metrics obj
         """
         self.subreddit = subreddit
         self.timefilter = timefilter
@@ -78,16 +212,27 @@ class ModelBase:
         self._output = output
         self.semantic_folder = f"{self._output}/semantic"
         self.search_query = search_query
+        self.max_workers = max_workers
+        self.replace_more_limit = replace_more_limit
+        self.comment_budget = comment_budget
+        self.incremental = incremental
+        self.chart_mode = chart_mode
+        self.semantic_data = semantic_data
+        self.data_url = data_url or repo_url(self.semantic_data_folder)
+        self.raw_chunk_rows = raw_chunk_rows
+        self.cpu_pool = cpu_pool
+        self.metrics = metrics or Metrics()
+        self._checkpoint = None
         self.delim = "|"
 
         # should be fine to hardcode
         self.nyse_ticker_path = "./nyse-listed.csv"
-        self.nyse_ticker_df = pd.read_csv(self.nyse_ticker_path)
-        self.nyse_tickers = self.nyse_ticker_df["ACT Symbol"].tolist()
-
         self.nasdaq_ticker_path = "./nasdaq-listed.csv"
-        self.nasdaq_ticker_df = pd.read_csv(self.nasdaq_ticker_path)
-        self.nasdaq_tickers = self.nasdaq_ticker_df["Symbol"].tolist()
+        # loaded once per process and shared by every model
+        self.ticker_universe = load_universe(self.nyse_ticker_path,
+                                             self.nasdaq_ticker_path)
+        self.nyse_tickers = self.ticker_universe.nyse_tickers
+        self.nasdaq_tickers = self.ticker_universe.nasdaq_tickers
 
         self.words = [
             "",
@@ -123,14 +268,20 @@ class ModelBase:
             "Z",
         ]
 
-        self.tickers = [x for x in self.nyse_tickers +
-                        self.nasdaq_tickers if x not in set(self.words)]
+        self.ticker_matcher = self.ticker_universe.matcher(self.words)
+        self.tickers = self.ticker_matcher.tickers
         self.cols_with_ticker = list(cols_with_ticker)
         self.ticker_cols = [f"{col}_ticker" for col in self.cols_with_ticker]
+        self.storage = storage
+        self.store = STORES[storage](self.curated_output, self.ticker_cols,
+                                     self.delim)
 
-        self.datetime_now = dt.now()
-        self.date_folder = self.datetime_now.strftime("%Y/%m/%d")
+        self.set_run_time()
         # self.time_str = self.datetime_now.strftime("%H%M%S")
+        self.run_context = None
+        self.stage_timings = {}
+        # curated history kept in memory by a long running process. see load_history
+        self.history = None
 
     def _get_name(self):
         """get class name
@@ -149,20 +300,65 @@ class ModelBase:
         return
 
     @property
-    def raw_output(self):
+    def raw_prefix(self):
         file_prefix = self._get_name()
         if self.search_query:
             file_prefix += "_" + \
                 self.search_query.replace(":", "_").replace('"', "")
+        return file_prefix
+
+    def set_run_time(self, now=None):
+        """last_updated + raw date folder of the rows fetched from now on.
+        a long running process (daemon.py) moves it forward every flush
+        """
+        self.datetime_now = now or dt.now()
+        self.date_folder = self.datetime_now.strftime("%Y/%m/%d")
+
+    def matches(self, submission):
+        """stream filter with the same meaning as search_query.
+        no query matches every submission. only flair:X queries are supported
+
+        :param submission: praw submission
+        :type submission: praw.models.Submission obj
+        """
+        if not self.search_query:
+            return True
+        if self.search_query.startswith("flair:"):
+            flair = self.search_query[len("flair:"):].strip('"')
+            return submission.link_flair_text == flair
+        return False
+
+    def new_run_context(self, sort=None):
+        """resolve raw file naming for a new fetch
+
+        :param sort: listing of the fetch, part of the file name. ie - StockTicker_hot_101500.csv
+        :type sort: str
+        """
+        file_prefix = self.raw_prefix if sort is None else f"{self.raw_prefix}_{sort}"
+        self.run_context = RunContext(self._output, self.date_folder, file_prefix)
+        return self.run_context
+
+    @property
+    def raw_output(self):
+        """raw file of the current fetch
+        """
+        if self.run_context is None:
+            self.new_run_context()
+        return self.run_context.raw_filename
 
-        folder = f"{self._output}/raw/{self.date_folder}"
-        self._make_dir(folder)
-        time_str = dt.now().strftime("%H%M%S")
-        return f"{folder}/{file_prefix}_{time_str}.csv"
+    @property
+    def checkpoint(self):
+        """high-water marks of previous runs. None unless incremental
+        """
+        if self.incremental and self._checkpoint is None:
+            self._checkpoint = Checkpoint(
+                f"{self._output}/checkpoints/{self.raw_prefix}.json")
+        return self._checkpoint
 
     @property
     def curated_output(self):
-        return f"{self._output}/curated/{self._get_name()}.csv"
+        extension = STORES[self.storage].extension
+        return f"{self._output}/curated/{self._get_name()}.{extension}"
 
     @property
     def semantic_output(self):
@@ -170,26 +366,47 @@ class ModelBase:
         # return f"{self.semantic_folder}/{self._get_name()}.png"
         return f"{self.semantic_folder}/{self._get_name()}.json"
 
-    def submissions(self, sort=None, comments=False):
-        """get all submissions that match the attributes
+    @property
+    def metric_labels(self):
+        return {"subreddit": getattr(self.subreddit, "display_name", None),
+                "model": self._get_name()}
 
-        :param sort: sort type for search, optional
-        :type sort: str
-        :param comments: include comments, optional
-        :type comments: bool
+    @property
+    def worker_kwargs(self):
+        """settings to rebuild this model in a worker process. see workers.py
         """
+        return {"output": self._output, "storage": self.storage,
+                "chart_mode": self.chart_mode, "semantic_data": self.semantic_data,
+                "data_url": self.data_url}
+
+    @property
+    def semantic_data_folder(self):
+        return f"{self.semantic_folder}/data"
+
+    @property
+    def chart_hash_output(self):
+        return f"{self.semantic_folder}/{self._get_name()}.sha1"
+
+    def _print_query(self, sort=None):
         pp.pprint(
             {
                 "subreddit": self.subreddit.display_name,
                 "timefilter": self.timefilter,
                 "limit": self.limit,
-                "sort": self.sort,
+                "sort": sort or self.sort,
                 "search_query": self.search_query,
                 "cols_with_ticker": self.cols_with_ticker,
                 "ticker_cols": self.ticker_cols,
             }
         )
 
+    def _search(self, sort=None):
+        """resolve the subreddit listing method for a sort
+
+        :param sort: sort type for search, optional
+        :type sort: str
+        :return: tuple of (listing method, sort, listing kwargs)
+        """
         # https://praw.readthedocs.io/en/latest/code_overview/models/subreddit.html?highlight=subreddit#praw.models.Subreddit.search
         search_kwargs = {
             "time_filter": self.timefilter,
@@ -206,72 +423,254 @@ class ModelBase:
             if sort in ["new", "hot"]:
                 search_kwargs.pop("time_filter")
 
-        data = []
-        for submission in search(**search_kwargs):
-            # https://praw.readthedocs.io/en/latest/code_overview/models/submission.html#praw.models.Submission
+        return search, sort, search_kwargs
+
+    def _submission_row(self, submission, sort, raw_filename):
+        # https://praw.readthedocs.io/en/latest/code_overview/models/submission.html#praw.models.Submission
+        return {
+            "id": submission.id,
+            "title": submission.title,
+            "name": submission.name,
+            "upvote_ratio": submission.upvote_ratio,
+            "ups": submission.ups,
+            "score": submission.score,
+            "sort": sort,
+            # .strftime('%c'),  # epoch
+            "created": dt.fromtimestamp(submission.created_utc),
+            "author": submission.author,
+            "num_comments": submission.num_comments,
+            "flair": submission.link_flair_text,
+            "permalink": submission.permalink,
+            "built_url": f"https://www.reddit.com{submission.permalink}",
+            "url": submission.url,
+            "submission_text": submission.selftext,
+            "last_updated": self.datetime_now,
+            "raw_filename": raw_filename,
+            "model": self._get_name(),
+        }
+
+    def _comment_row(self, comment, sort, raw_filename):
+        return {
+            "id": comment.id,
+            "author": comment.author,
+            # "title": submission.title,
+            "total_awards_received": comment.total_awards_received,
+            "downs": comment.downs,
+            "ups": comment.ups,
+            "score": comment.score,
+            "comment": comment.body,
+            "created": dt.fromtimestamp(comment.created_utc),
+            "permalink": comment.permalink,
+            "built_url":  f"https://www.reddit.com{comment.permalink}",
+            "sort": sort,
+            "last_updated": self.datetime_now,
+            "raw_filename": raw_filename,
+            "model": self._get_name(),
+        }
+
+    def submissions(self, sort=None, comments=False):
+        """get all submissions that match the attributes
+
+        :param sort: sort type for search, optional
+        :type sort: str
+        :param comments: include comments, optional
+        :type comments: bool
+        """
+        with self.metrics.stage(f"fetch_{sort or self.sort}",
+                                **self.metric_labels) as record:
+            df = pd.concat(list(self.submission_chunks(sort, comments)),
+                           ignore_index=True)
+            record["rows_out"] = len(df)
+        return df
+
+    def submission_chunks(self, sort=None, comments=False):
+        """stream the fetch into the raw file in chunks of raw_chunk_rows.
+        only one chunk of row dicts is in memory at a time.
+        yields each chunk df once it is written. see raw.RawWriter
+
+        a crash leaves {raw file}.part with every chunk written so far.
+        the checkpoint only moves once the raw file is complete,
+        so the next incremental run fetches the rest again.
+
+        :param sort: sort type for search, optional
+        :type sort: str
+        :param comments: include comments, optional
+        :type comments: bool
+        """
+        self._print_query(sort)
+        search, sort, search_kwargs = self._search(sort)
+
+        raw_filename = self.new_run_context(sort).raw_filename
+        listing = self._incremental(search(**search_kwargs), sort, comments)
+        if comments:
+            rows = self.comment_rows(listing, sort, raw_filename)
+        else:
+            rows = (self._submission_row(submission, sort, raw_filename)
+                    for submission in listing)
+
+        writer = RawWriter(raw_filename, self.delim, self.raw_chunk_rows)
+        yield from writer.chunks(rows)
+        self._save_checkpoint()
+
+    def _incremental(self, listing, sort, comments=False):
+        """skip content that previous runs already pulled
+
+        chronological listings (new) stop paging at the first known submission.
+        for comments, submissions whose num_comments did not change are skipped.
+        hot / top / controversial are re-ranked every run so they are always fully paged.
+
+        :param listing: submissions
+        :type listing: iterable
+        :param sort: sort type
+        :type sort: str
+        :param comments: listing is used for comments
+        :type comments: bool
+        """
+        checkpoint = self.checkpoint
+        if checkpoint is None:
+            yield from listing
+            return
+
+        skipped = 0
+        for submission in listing:
             if comments:
-                # https://praw.readthedocs.io/en/latest/tutorials/comments.html
-                print("====================")
-                print("getting comments")
-
-                # https://praw.readthedocs.io/en/latest/tutorials/comments.html#the-replace-more-method
-                # replace_more(limit=None) is infinite top level comments.
-                # leave as default 32 cuz it's SUPEERRRR slow.
-                submission.comments.replace_more()
-                max_length = len(submission.comments.list())
-                # i = 1
-                print(f"number of comments in submission: {max_length}")
-                print("extracting comments now")
-
-                # submission.comments.list() gives the entire comment forest
-                for comment in submission.comments.list():
-                    # print(f"{i} in {max_length}")
-                    # i += 1
-                    # print(vars(comment))
-                    row = {
-                        "id": comment.id,
-                        "author": comment.author,
-                        # "title": submission.title,
-                        "total_awards_received": comment.total_awards_received,
-                        "downs": comment.downs,
-                        "ups": comment.ups,
-                        "score": comment.score,
-                        "comment": comment.body,
-                        "created": dt.fromtimestamp(comment.created_utc),
-                        "permalink": comment.permalink,
-                        "built_url":  f"https://www.reddit.com{comment.permalink}",
-                        "sort": sort,
-                        "last_updated": self.datetime_now,
-                        "raw_filename": self.raw_output,
-                        "model": self._get_name(),
-                    }
-                    data.append(row)
+                # observed in comment_rows once the forest is actually fetched
+                if not checkpoint.comments_changed(submission):
+                    skipped += 1
+                    continue
+            elif sort == "new" and checkpoint.is_known(submission, sort):
+                print(f"incremental: reached known content at {submission.id}")
+                break
             else:
-                row = {
-                    "id": submission.id,
-                    "title": submission.title,
-                    "name": submission.name,
-                    "upvote_ratio": submission.upvote_ratio,
-                    "ups": submission.ups,
-                    "score": submission.score,
-                    "sort": sort,
-                    # .strftime('%c'),  # epoch
-                    "created": dt.fromtimestamp(submission.created_utc),
-                    "author": submission.author,
-                    "num_comments": submission.num_comments,
-                    "flair": submission.link_flair_text,
-                    "permalink": submission.permalink,
-                    "built_url": f"https://www.reddit.com{submission.permalink}",
-                    "url": submission.url,
-                    "submission_text": submission.selftext,
-                    "last_updated": self.datetime_now,
-                    "raw_filename": self.raw_output,
-                    "model": self._get_name(),
-                }
-                data.append(row)
-
-        df = pd.DataFrame(data)
-        self._raw_save(df)
+                checkpoint.observe(submission, sort)
+
+            yield submission
+
+        if skipped:
+            print(f"incremental: skipped {skipped} submissions with no new comments")
+
+    def _save_checkpoint(self):
+        if self.checkpoint is not None:
+            self.checkpoint.save()
+
+    def _ratelimit_pause(self):
+        """back off when the shared PRAW client is about to run out of requests.
+        PRAW updates auth.limits from the ratelimit headers of every response.
+        """
+        reddit = getattr(self.subreddit, "_reddit", None)
+        limits = getattr(getattr(reddit, "auth", None), "limits", None) or {}
+        remaining = limits.get("remaining")
+        reset = limits.get("reset_timestamp")
+        if remaining is not None and reset and remaining < self.max_workers:
+            wait_seconds = max(0, reset - time.time())
+            print(f"ratelimit: {remaining} requests left. sleeping {wait_seconds:.0f}s")
+            time.sleep(wait_seconds)
+
+    def _expand_comments(self, submission):
+        """expand MoreComments and flatten the forest once
+        """
+        self._ratelimit_pause()
+        # https://praw.readthedocs.io/en/latest/tutorials/comments.html#the-replace-more-method
+        # replace_more(limit=None) is infinite top level comments.
+        # default 32 cuz it's SUPEERRRR slow.
+        submission.comments.replace_more(limit=self.replace_more_limit)
+        # submission.comments.list() gives the entire comment forest
+        return submission, submission.comments.list()
+
+    def comment_rows(self, listing, sort, raw_filename):
+        """stream comment rows for every submission in a listing
+
+        comment forests are expanded concurrently in a pool of max_workers.
+        rows are yielded as soon as a forest is done.
+        once comment_budget seconds are spent, no new submissions are started.
+
+        :param listing: submissions
+        :type listing: iterable
+        :param sort: sort type, stored on every row
+        :type sort: str
+        :param raw_filename: raw file of this fetch
+        :type raw_filename: str
+        """
+        # https://praw.readthedocs.io/en/latest/tutorials/comments.html
+        deadline = None
+        if self.comment_budget is not None:
+            deadline = time.monotonic() + self.comment_budget
+
+        def rows(futures):
+            for future in futures:
+                submission, forest = future.result()
+                if self.checkpoint is not None:
+                    self.checkpoint.observe(submission, sort, comments=True)
+                print("====================")
+                print(f"number of comments in submission {submission.id}: {len(forest)}")
+                for comment in forest:
+                    yield self._comment_row(comment, sort, raw_filename)
+
+        workers = max(1, self.max_workers)
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            pending = set()
+            for submission in listing:
+                if deadline is not None and time.monotonic() >= deadline:
+                    print("comment budget spent. skipping remaining submissions")
+                    break
+
+                pending.add(pool.submit(self._expand_comments, submission))
+                if len(pending) >= workers:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    yield from rows(done)
+
+            yield from rows(as_completed(pending))
+
+    def concurrent_submissions(self, sorts, max_workers=4):
+        """fetch several listings at once. ie - hot, top, new, controversial
+
+        each listing pages in its own thread.
+        submissions are de-duplicated on id as they come in, so a post that
+        shows up in every listing is only turned into a row once.
+        same result as concat + drop_duplicates(subset=["id"]) of serial fetches:
+        the earlier sort in sorts wins and rows keep the listing order.
+
+        PRAW sleeps on its own ratelimit headers, so max_workers only bounds
+        how many listings are in flight on the shared client.
+
+        :param sorts: listing sorts, in priority order
+        :type sorts: list
+        :param max_workers: thread pool size (default: 4)
+        :type max_workers: int
+        """
+        self._print_query(", ".join(sorts))
+        raw_filename = self.new_run_context().raw_filename
+        priority = {sort: i for i, sort in enumerate(sorts)}
+        # id -> (priority, position in listing, row)
+        rows = {}
+        lock = threading.Lock()
+
+        def fetch(sort):
+            search, sort, search_kwargs = self._search(sort)
+            rank = priority[sort]
+            listing = self._incremental(search(**search_kwargs), sort)
+            for position, submission in enumerate(listing):
+                with lock:
+                    seen = rows.get(submission.id)
+                    if seen is not None and seen[0] <= rank:
+                        continue
+                    rows[submission.id] = (
+                        rank, position,
+                        self._submission_row(submission, sort, raw_filename)
+                    )
+
+        workers = max(1, min(max_workers, len(sorts)))
+        with self.metrics.stage("fetch", **self.metric_labels) as record:
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                # list() to raise worker exceptions here
+                list(pool.map(fetch, sorts))
+
+            data = [row for _, _, row in sorted(rows.values(),
+                                                key=lambda x: x[:2])]
+            df = pd.DataFrame(data)
+            self._raw_save(df)
+            record["rows_out"] = len(df)
+        self._save_checkpoint()
         return df
 
     def _raw_save(self, df):
@@ -282,24 +681,19 @@ class ModelBase:
         """
         df.to_csv(
             self.raw_output,
-            self.delim
+            sep=self.delim
         )
         return
 
     def merge(self, old, new):
-        """replicate SQL merge
+        """replicate SQL merge. see storage.merge_latest
 
         :param old: pandas df
         :type old: obj
         :param new: pandas df:
         :type new: obj
         """
-        df = old.append(new.set_index("id")
-                        ).sort_values(
-            ['last_updated', 'score'],
-            ascending=False
-        ).groupby(level=0).last()
-        return df
+        return merge_latest(old, new)
 
     def save(self, df, overwrite=False):
         """save df to curated file. merge if file exists
@@ -309,25 +703,10 @@ class ModelBase:
         :param overwrite: option to set overwrite
         :type overwrite: bool
         """
-        old_df = None
-        # try catch for first time run. ie - curated file does not exist
-        try:
-            old_df = self.read_curated().set_index("id")
-        except Exception as err:
-            print(str(err))
-
-        if old_df is not None and not overwrite:
-            df = self.merge(
-                old=old_df,
-                new=df
-            )
+        if overwrite:
+            self.store.write(df)
         else:
-            pass
-
-        df.to_csv(
-            self.curated_output,
-            sep=self.delim
-        )
+            self.store.upsert(df, self.merge)
         return
 
     def extract_tickers(self, df):
@@ -336,17 +715,9 @@ class ModelBase:
         :param df: pandas df
         :type df: obj
         """
-        # https://stackoverflow.com/questions/57483859/pandas-finding-matchany-between-list-of-strings-and-df-column-valuesas-list
-        ticker_pattern = "(\$*[A-Z]{1,5})(?=[\s\.\?\!\,])+"
-        # .str.join(', ').replace(r'^\s*$', np.nan, regex=True)
-
         for col in self.cols_with_ticker:
-            df[f"{col}_regex"] = df[col].str.findall(ticker_pattern)
-            df[f'{col}_ticker'] = [
-                [val.lstrip("$")
-                 for val in sublist if val.lstrip("$") in set(self.tickers)]
-                for sublist in df[f'{col}_regex'].values
-            ]
+            df[f"{col}_regex"], df[f"{col}_ticker"] = \
+                self.ticker_matcher.extract(df[col])
 
         return df
 
@@ -371,6 +742,8 @@ class ModelBase:
     def plot_tickers(self, df):
         """UNUSED. this creates a jpg using matplotlib / pandas plot
         """
+        from matplotlib import pyplot as plt
+
         plot_df = self.transform(df, min_count=11)
 
         # agg, unstack and plot
@@ -383,19 +756,7 @@ class ModelBase:
         return
 
     def read_curated(self):
-        converters = {}
-        for col in self.ticker_cols:
-            converters[col] = literal_eval
-
-        parse_dates = ["created", "last_updated"]
-        df = pd.read_csv(
-            self.curated_output,
-            sep=self.delim,
-            parse_dates=parse_dates,
-            converters=converters
-        )
-
-        return df
+        return self.store.read()
 
     def clean_curated(self, df=None):
         """altair seems to fuck up even after you filter the bad tickers
@@ -410,14 +771,8 @@ class ModelBase:
             overwrite = True
             df = self.read_curated()
 
-        # https://stackoverflow.com/questions/61035426/pandas-column-containing-lists-iterate-through-each-list-problem
         for col in self.ticker_cols:
-            df[col] = df[col].apply(
-                lambda x: [
-                    i.replace("'", "").replace('"', "").strip() for i in x
-                    if i.replace("'", "").replace('"', "").strip() not in self.words
-                ]
-            )
+            df[col] = self.ticker_matcher.clean(df[col])
 
         if overwrite:
             self.save(df, overwrite=overwrite)
@@ -434,15 +789,16 @@ class ModelBase:
         """need to explode the ticker columns because they are list type
         we don't drop duplicates at the end, in case we want to keep the category separation
         """
-        df = self.explode(df, self.ticker_cols)
-
         main_cols = ["id",
                      "title" if "title" in self.cols_with_ticker else "comment",
                      "permalink", "built_url", "score", "created"]
 
         all_dfs = []
         for col in self.ticker_cols:
-            temp_df = df[[*main_cols, col]]\
+            # explode one ticker column at a time into a long (id, ticker, category) table.
+            # exploding every ticker column first builds the cross product of the lists.
+            # ie - 20 title tickers x 40 text tickers = 800 rows for one post
+            temp_df = df[[*main_cols, col]].explode(col)\
                 .drop_duplicates(subset=['id', col])
             temp_df["category"] = col
             temp_df = temp_df.rename({col: "ticker"}, axis=1)
@@ -462,23 +818,106 @@ class ModelBase:
         df = df[df['ticker'].str.strip().astype(bool)]
         return df.dropna()
 
-    def chart(self):
+    @staticmethod
+    def format_dates(series, freq, fmt):
+        """strftime once per distinct freq period instead of once per row
+
+        :param series: datetime column without NaT
+        :type series: pandas series obj
+        :param freq: pandas floor freq. ie - min, D
+        :type freq: str
+        :param fmt: strftime format of freq
+        :type fmt: str
+        :return: numpy array of str
+        """
+        codes, uniques = pd.factorize(series.dt.floor(freq))
+        return uniques.strftime(fmt).values.astype(object).take(codes)
+
+    def chart_dates(self, df):
+        """date columns of the chart. clean_ticker already dropped NaT rows
+        """
+        # used in data table
+        df["date_str"] = self.format_dates(df["created"], "min", "%Y-%m-%d %H:%M")
+        # used for date filters
+        df["date"] = self.format_dates(df["created"], "D", "%Y-%m-%d")
+        df["date2"] = df["date"]
+        return df
+
+    def chart_input_hash(self, df):
+        """hash of everything the chart is built from. curated rows + chart settings.
+        row order does not matter
+
+        :param df: curated df
+        :type df: pandas df
+        """
+        text_col = "title" if "title" in self.cols_with_ticker else "comment"
+        cols = [col for col in ["id", text_col, "built_url", "score", "created",
+                                *self.ticker_cols] if col in df.columns]
+        frame = df[cols].sort_values(cols[0]) if cols else df[cols]
+        frame = frame.assign(**{col: encode_list_column(frame[col])
+                                for col in self.ticker_cols if col in frame.columns})
+
+        settings = compact_json([self.chart_mode, self.semantic_data, self.data_url,
+                                 CHART_TOP_N, sorted(self.ticker_matcher.words)])
+        rows = pd.util.hash_pandas_object(frame, index=False).values.tobytes()
+        return content_hash(settings.encode("utf-8") + rows)
+
+    def chart_data(self, df):
+        """pre-aggregated chart datasets. keeps the semantic json small
+        instead of embedding every exploded mention row.
+
+        bars: mentions per ticker per day. the date filter + sum(mentions) happen client side.
+        tables: top CHART_TOP_N rows by score, created per ticker per day.
+        any date range / ticker selection only ever shows rows from that subset.
+
+        :param df: exploded ticker df with date2 + date_str columns. see chart
+        :type df: pandas df
+        :return: tuple of (bar df, table df)
+        """
+        text_col = "title" if "title" in self.cols_with_ticker else "comment"
+
+        bar_df = df.groupby(["ticker", "date2"]).size()\
+            .rename("mentions").reset_index()
+
+        table_df = df.sort_values(["score", "created"], ascending=False)\
+            .groupby(["ticker", "date2"], sort=False).head(CHART_TOP_N)
+        table_df = table_df[["ticker", "date2", "date_str", "created",
+                             "score", text_col, "built_url"]]\
+            .reset_index(drop=True)
+
+        return bar_df, table_df
+
+    def chart(self, df=None, skip_unchanged=True):
+        """build the altair chart and save it to semantic_output.
+        chart_mode aggregate embeds chart_data instead of every exploded row
+
+        :param df: curated df. reads the curated file if None
+        :type df: obj
+        :param skip_unchanged: hash the input and skip the chart if it did not change.
+                    False when the caller knows it changed. ie - a daemon flush
+        :type skip_unchanged: bool
+        """
+        if df is None:
+            df = self.read_curated()
+
+        input_hash = None
+        if skip_unchanged:
+            input_hash = self.chart_input_hash(df)
+            if input_hash == read_hash(self.chart_hash_output) and \
+                    Path(self.semantic_output).exists():
+                print(f"{self._get_name()} chart input unchanged. skipping chart")
+                return
+
+        alt = load_altair()
         df = self.clean_ticker(
-            self.transform(
-                self.read_curated()
-            )
+            self.transform(df)
         )
 
-        # I don't think this even fucking works but whatever. cheesed
-        df = df.query("ticker not in @self.words")
+        # stoplist words are already dropped by clean_curated.
+        # guard for curated files written before that. set lookup, not a list scan
+        df = df[~df["ticker"].isin(self.ticker_matcher.words)]
 
-        # used in data table
-        df["date_str"] = df["created"].map(
-            lambda x: x.strftime("%Y-%m-%d %H:%M")
-        )
-        # used for date filters
-        df["date"] = df["created"].map(lambda x: x.strftime("%Y-%m-%d"))
-        df["date2"] = df["created"].map(lambda x: x.strftime("%Y-%m-%d"))
+        df = self.chart_dates(df)
         data_start = df["date"].min()
         data_end = df["date"].max()
 
@@ -533,22 +972,35 @@ class ModelBase:
             fields=['ticker']
         )
 
-        base = alt.Chart(df.reset_index()).transform_filter(
-            # slider_selection
-            (alt.datum.date2 >= select_range_start.date) & (
-                alt.datum.date2 <= select_range_end.date)
-        ).add_selection(
-            selector,
-            select_range_start,
-            select_range_end,
-            select_max_count,
-            select_min_count,
-        )
+        if self.chart_mode == "aggregate":
+            bar_data, table_data = self.chart_data(df)
+            bar_count = "sum(mentions)"
+            # one row per ticker per day. no submission ids left to color by
+            bar_color = alt.condition(selector, "ticker:N", alt.value(
+                "lightgray"), legend=None)
+        else:
+            bar_data = table_data = df.reset_index()
+            bar_count = "count()"
+            bar_color = alt.condition(selector, 'id:O', alt.value(
+                'lightgray'), legend=None)
+
+        def base(data):
+            return alt.Chart(data).transform_filter(
+                # slider_selection
+                (alt.datum.date2 >= select_range_start.date) & (
+                    alt.datum.date2 <= select_range_end.date)
+            ).add_selection(
+                selector,
+                select_range_start,
+                select_range_end,
+                select_max_count,
+                select_min_count,
+            )
 
         # BAR CHART
         # https://stackoverflow.com/questions/52385214/how-to-select-a-portion-of-data-by-a-condition-in-altair-chart
-        bars = base.mark_bar().transform_aggregate(
-            count='count()',
+        bars = base(bar_data).mark_bar().transform_aggregate(
+            count=bar_count,
             groupby=['ticker']
         ).encode(
             x=alt.X('ticker',
@@ -560,8 +1012,7 @@ class ModelBase:
                     axis=alt.Axis(title='Number of Mentions'),
                     # scale=alt.Scale(zero=False)
                     ),
-            color=alt.condition(selector, 'id:O', alt.value(
-                'lightgray'), legend=None),
+            color=bar_color,
             tooltip=['ticker', 'count:Q'],
         ).properties(
             # title="Stock Ticker mentions on r/wallstreetbets",
@@ -574,7 +1025,7 @@ class ModelBase:
 
         # base chart for data tables
         # href: https://altair-viz.github.io/gallery/scatter_href.html
-        ranked_text = base.transform_calculate(
+        ranked_text = base(table_data).transform_calculate(
             # url='https://www.reddit.com' + alt.datum.permalink
             url=alt.datum.built_url
         ).mark_text(
@@ -603,7 +1054,7 @@ class ModelBase:
             rank='rank(row_number)'
         ).transform_filter(
             # only shows up to 20 rows
-            alt.datum.rank < 20
+            alt.datum.rank < CHART_TOP_N
         ).properties(
             width=30,
             height=300
@@ -633,20 +1084,233 @@ class ModelBase:
             color="independent"
         )
 
-        self.save_semantic_chart(chart.to_json(indent=None))
+        if self.semantic_data == "external":
+            spec = externalize_datasets(chart.to_dict(), self.semantic_data_folder,
+                                        self.data_url, self._get_name())
+            self.save_semantic_chart(json.dumps(spec))
+        else:
+            self.save_semantic_chart(chart.to_json(indent=None))
+
+        if input_hash is not None:
+            write_hash(self.chart_hash_output, input_hash)
+        else:
+            # the next hashed run rebuilds
+            Path(self.chart_hash_output).unlink(missing_ok=True)
         return
 
+    @contextmanager
+    def timed(self, stage):
+        """record wall time of a pipeline stage in self.stage_timings,
+        and the full stage record in self.metrics.
+        yields the record. set record["rows_in"] / record["rows_out"]
+        """
+        start = time.perf_counter()
+        with self.metrics.stage(stage, **self.metric_labels) as record:
+            try:
+                yield record
+            finally:
+                self.stage_timings[stage] = round(time.perf_counter() - start, 3)
+
+    def _read_existing(self):
+        """curated history or None on the first run
+        """
+        if not self.store.exists():
+            return None
+        return self.read_curated().set_index("id")
+
     def model(self, df):
-        df = self.extract_tickers(df)
-        df = self.clean_curated(df)
-        self.save(df)
+        """single pass pipeline. the curated history is read once and written once:
+        extract -> read -> merge -> clean -> save -> chart
+
+        :param df: raw df, or raw chunk dfs. ie - submission_chunks()
+                    chunks are extracted as they arrive. see _extract_chunks
+        :type df: pandas df or iterable
+        """
+        if self.cpu_pool is not None:
+            return self._model_in_pool(df)
+
+        self.stage_timings = {}
+        if isinstance(df, pd.DataFrame):
+            with self.timed("extract_tickers") as record:
+                extracted = [self.extract_tickers(df)] if not df.empty else []
+                record["rows_in"] = record["rows_out"] = len(df)
+        else:
+            extracted = self._extract_chunks(df)
 
-        # do it twice just in case
-        self.clean_curated()
+        if not extracted:
+            # nothing new since the last incremental run
+            print("no new rows. skipping model")
+            return
 
-        # self.plot_tickers(df)  # basic jpg
-        self.chart()
+        df = extracted[0] if len(extracted) == 1 else \
+            pd.concat(extracted, ignore_index=True)
+        self.curate(df)
 
+        pp.pprint({"stage_timings": self.stage_timings})
+        return
+
+    def _extract_chunks(self, chunks):
+        """pull + extract raw chunk dfs. pulling a chunk pages the listing
+        (+ replace_more), so it is timed as the fetch stage. extraction as extract_tickers
+
+        :param chunks: raw chunk dfs. ie - submission_chunks()
+        :type chunks: iterable
+        :return: list of extracted dfs
+        """
+        fetch = self.metrics.new_record("fetch", **self.metric_labels)
+        extract = self.metrics.new_record("extract_tickers", **self.metric_labels)
+        fetch["rows_out"] = extract["rows_in"] = extract["rows_out"] = 0
+        extracted = []
+        chunks = iter(chunks)
+        try:
+            while True:
+                with self.metrics.timing(fetch):
+                    chunk = next(chunks, None)
+                if chunk is None:
+                    break
+                fetch["rows_out"] += len(chunk)
+                if chunk.empty:
+                    continue
+                with self.metrics.timing(extract):
+                    extracted.append(self.extract_tickers(chunk))
+                extract["rows_in"] = extract["rows_out"] = extract["rows_out"] + len(chunk)
+        finally:
+            for record in [fetch, extract]:
+                self.metrics.add(record)
+                self.stage_timings[record["stage"]] = record["wall_s"]
+
+        return extracted
+
+    def curate(self, df):
+        """read -> merge -> clean -> save -> chart of rows that went through extract_tickers
+
+        :param df: extracted rows
+        :type df: pandas df
+        """
+        with self.timed("read") as record:
+            old_df = self._read_existing()
+            record["rows_out"] = 0 if old_df is None else len(old_df)
+        with self.timed("merge") as record:
+            record["rows_in"] = len(df) + (0 if old_df is None else len(old_df))
+            if old_df is None:
+                merged = df.set_index("id")
+            else:
+                merged = self.merge(old=old_df, new=df)
+            record["rows_out"] = len(merged)
+        with self.timed("clean") as record:
+            if self.store.upserts_in_place:
+                tickers = self._encoded_tickers(merged)
+            # one stoplist pass over new rows + history. ie - words changed since the last run
+            merged = self.clean_curated(merged)
+            record["rows_in"] = record["rows_out"] = len(merged)
+        with self.timed("save") as record:
+            if self.store.upserts_in_place:
+                # the store merges on its own. only send the new rows
+                # + the history rows whose tickers the clean pass changed
+                send = merged.index.isin(df["id"]) | self._recleaned(merged, tickers)
+                new_rows = merged[send]
+                self.store.upsert(new_rows)
+                record["rows_out"] = len(new_rows)
+            else:
+                self.save(merged, overwrite=True)
+                record["rows_out"] = len(merged)
+        with self.timed("chart") as record:
+            # self.plot_tickers(df)  # basic jpg
+            record["rows_in"] = len(merged)
+            self.chart(merged.reset_index())
+
+        return
+
+    def _encoded_tickers(self, df):
+        return {col: encode_list_column(df[col]) for col in self.ticker_cols}
+
+    def _recleaned(self, df, tickers):
+        """rows whose ticker lists changed since _encoded_tickers
+
+        :return: numpy bool array
+        """
+        changed = np.zeros(len(df), dtype=bool)
+        for col, before in tickers.items():
+            changed |= (encode_list_column(df[col]) != before).values
+        return changed
+
+    def load_history(self):
+        """read + clean the curated history once, for a long running process (daemon.py).
+        curate_new then merges and persists only the new rows.
+        history rows the stoplist changed are saved here, once
+        """
+        with self.timed("read") as record:
+            history = self._read_existing()
+            record["rows_out"] = 0 if history is None else len(history)
+        if history is None:
+            self.history = None
+            return
+
+        with self.timed("clean") as record:
+            tickers = self._encoded_tickers(history)
+            history = self.clean_curated(history)
+            changed = self._recleaned(history, tickers)
+            record["rows_in"] = record["rows_out"] = len(history)
+        with self.timed("save") as record:
+            if not changed.any():
+                record["rows_out"] = 0
+            elif self.store.upserts_in_place:
+                self.store.upsert(history[changed])
+                record["rows_out"] = int(changed.sum())
+            else:
+                self.save(history, overwrite=True)
+                record["rows_out"] = len(history)
+
+        self.history = history
+
+    def curate_new(self, df):
+        """curate against the in memory history of load_history:
+        clean the new rows -> merge -> append them to the store -> chart.
+        the history is not read, re-cleaned, rewritten or hashed again
+
+        :param df: extracted rows with an id column
+        :type df: pandas df
+        """
+        with self.timed("clean") as record:
+            new = latest(self.clean_curated(df.set_index("id")))
+            record["rows_in"] = len(df)
+            record["rows_out"] = len(new)
+        with self.timed("merge") as record:
+            history_rows = 0 if self.history is None else len(self.history)
+            record["rows_in"] = len(new) + history_rows
+            merged = new if self.history is None else self.merge(old=self.history, new=new)
+            record["rows_out"] = len(merged)
+        with self.timed("save") as record:
+            # the merge winner of every new id. a lost update re-appends the old row
+            rows = merged.loc[new.index]
+            self.store.append(rows)
+            record["rows_out"] = len(rows)
+        with self.timed("chart") as record:
+            record["rows_in"] = len(merged)
+            self.chart(merged.reset_index(), skip_unchanged=False)
+
+        self.history = merged
+        return
+
+    def _model_in_pool(self, df):
+        """the fetch stays in this thread. extract -> chart run in self.cpu_pool,
+        so the GIL is free for the other models' fetches
+
+        :param df: raw df, or raw chunk dfs
+        :type df: pandas df or iterable
+        """
+        self.stage_timings = {}
+        with self.timed("fetch") as record:
+            if not isinstance(df, pd.DataFrame):
+                df = pd.concat(list(df), ignore_index=True)
+            record["rows_out"] = len(df)
+
+        future = self.cpu_pool.submit(run_model, self._get_name(),
+                                      self.worker_kwargs, df)
+        stage_timings, records = future.result()
+        self.stage_timings.update(stage_timings)
+        # the worker has no subreddit client to label its stages with
+        self.metrics.extend(records, **self.metric_labels)
         return
 
 
@@ -656,8 +1320,9 @@ class HTMLBase:
     otherwise the html would get overwritten with only a specific model.
     """
 
-    def __init__(self):
+    def __init__(self, metrics=None):
         self.last_updated = dt.now().strftime("%Y-%m-%d %I:%M %p %Z")
+        self.metrics = metrics or Metrics()
         # self._output = output
         # self.semantic_folder = f"{self._output}/semantic"
         self.semantic_folder = "output/semantic"
@@ -666,11 +1331,13 @@ class HTMLBase:
         # self.semantic_due_diligence = self.read_file(f"{self.semantic_folder}/DueDiligence.json")
         # self.semantic_daily_discussion = self.read_file(f"{self.semantic_folder}/DailyDiscussion.json")
 
-        self.base_url = f"https://raw.githubusercontent.com/kennybui-data-ai/wallstreetbets/master/{self.semantic_folder}"
+        self.base_url = f"{REPO_URL}/{self.semantic_folder}"
         self.stock_ticker_url = f"{self.base_url}/StockTicker.json"
         self.due_diligence_url = f"{self.base_url}/DueDiligence.json"
         self.daily_discussion_url = f"{self.base_url}/DailyDiscussion.json"
 
+        from jinja2 import Template
+
         self.html_template = Template(self.read_file("template.html"))
         self.html_output = "../index.html"
 
@@ -687,6 +1354,13 @@ class HTMLBase:
 
     def update_html(self):
         print("Updating index.html")
+        with self.metrics.stage("update_html"):
+            self._render_html()
+
+        return
+
+    def _render_html(self):
+        alt = load_altair()
         with open(self.html_output, "w", encoding="utf-8") as f:
             # jinja2 to render
             f.write(self.html_template.render(
@@ -0,0 +1,106 @@
+# INCREMENTAL FETCH CHECKPOINTS
+
+import json
+import os
+import threading
+from pathlib import Path
+
+# reddit listings top out at 1000 items. no point remembering more ids than that
+MAX_SEEN_IDS = 1000
+
+
+class Checkpoint:
+    """high-water marks for one model + search query.
+    persisted as json under {output}/checkpoints so the next run only pulls new content.
+
+    per sort: newest created_utc and the ids seen.
+    per submission: num_comments at the last comment fetch.
+    """
+
+    def __init__(self, path):
+        """init
+
+        :param path: checkpoint json file
+        :type path: str
+        """
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._state = {"sorts": {}, "num_comments": {}}
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                self._state.update(json.load(f))
+        except FileNotFoundError:
+            pass
+        except Exception as err:
+            print(f"ignoring bad checkpoint {self.path}: {err}")
+
+        self._seen = {sort: set(mark["ids"])
+                      for sort, mark in self._state["sorts"].items()}
+        self._observed = {}
+        self._observed_comments = {}
+
+    def high_water(self, sort):
+        """newest created_utc seen for a sort. None on first run
+        """
+        mark = self._state["sorts"].get(sort)
+        return mark["created_utc"] if mark else None
+
+    def is_known(self, submission, sort):
+        """True once a chronological listing reaches content from a previous run
+        """
+        high_water = self.high_water(sort)
+        if high_water is None:
+            return False
+        return submission.id in self._seen.get(sort, ()) or \
+            submission.created_utc < high_water
+
+    def comments_changed(self, submission):
+        """False if num_comments is the same as the last comment fetch
+        """
+        last = self._state["num_comments"].get(submission.id)
+        return last is None or last != submission.num_comments
+
+    def observe(self, submission, sort, comments=False):
+        """record a fetched submission. nothing is persisted until save()
+        """
+        with self._lock:
+            observed = self._observed.setdefault(sort, [])
+            observed.append((submission.created_utc, submission.id))
+            if comments:
+                self._observed_comments[submission.id] = submission.num_comments
+
+    def save(self):
+        """merge this run's observations into the high-water marks and persist
+        """
+        with self._lock:
+            for sort, observed in self._observed.items():
+                mark = self._state["sorts"].get(
+                    sort, {"created_utc": None, "ids": []})
+                newest = max(created for created, _ in observed)
+                if mark["created_utc"] is None or newest > mark["created_utc"]:
+                    mark["created_utc"] = newest
+
+                # keep the newest ids. listings are newest first
+                ids = [id for _, id in sorted(observed, reverse=True)]
+                fresh = set(ids)
+                ids += [id for id in mark["ids"] if id not in fresh]
+                mark["ids"] = ids[:MAX_SEEN_IDS]
+                self._state["sorts"][sort] = mark
+                self._seen[sort] = set(mark["ids"])
+
+            num_comments = self._state["num_comments"]
+            for id, count in self._observed_comments.items():
+                # re-insert so the most recently fetched ids are kept on trim
+                num_comments.pop(id, None)
+                num_comments[id] = count
+            if len(num_comments) > MAX_SEEN_IDS:
+                self._state["num_comments"] = dict(
+                    list(num_comments.items())[-MAX_SEEN_IDS:])
+
+            self._observed = {}
+            self._observed_comments = {}
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.path.with_suffix(".tmp")
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self._state, f)
+            os.replace(tmp_path, self.path)
@@ -0,0 +1,268 @@
+# STREAMING DAEMON
+
+import queue
+import threading
+from collections import OrderedDict
+import time
+import traceback
+from datetime import datetime as dt
+
+import pandas as pd
+
+# seconds between flushes of a model's rows to curated + chart
+FLUSH_INTERVAL = 60
+# rows that trigger a flush before the interval is up
+FLUSH_ROWS = 5000
+# stream items waiting for ticker extraction. full -> the streams stop polling reddit
+QUEUE_SIZE = 10000
+# stream items extracted together
+BATCH_SIZE = 500
+# raw files are named by the second. ie - StockTicker_101500.csv
+MIN_FLUSH_SECONDS = 1
+# recent submissions searched at startup for comment models. ie - today's Daily Discussion
+SEED_LIMIT = 10
+# comments held until their submission shows up on the other stream. oldest go first
+ORPHAN_LIMIT = 10000
+
+
+class Daemon:
+    """one warm process instead of a cold cron batch.
+    subreddit.stream.submissions() / comments() feed a bounded queue from producer threads.
+    the main thread extracts tickers from whatever is queued, and flushes each model
+    (raw file, then clean -> merge -> save -> chart) every flush_interval seconds
+    or once flush_rows rows are waiting.
+
+    the curated history is read once at startup and kept merged in memory.
+    a flush only appends its rows to the curated store. see ModelBase.curate_new
+
+    flushes happen in the main thread. while one runs the queue fills up, and the
+    producers block instead of paging the streams. streams only reach back ~100 items,
+    so a backlog that outlasts that loses items. raise flush_interval before queue_size.
+
+    comment models (ModelBase.from_comments) take the comments of the submissions
+    they match. those are learned from the submission stream + a search at startup.
+    comments that arrive before their submission wait in a bounded orphan buffer.
+    """
+
+    def __init__(self, models, flush_interval=FLUSH_INTERVAL, flush_rows=FLUSH_ROWS,
+                 queue_size=QUEUE_SIZE, on_flush=None):
+        """init
+
+        :param models: dict of (subreddit name, model name) -> model
+        :type models: dict
+        :param flush_interval: seconds between flushes of a model
+        :type flush_interval: float
+        :param flush_rows: rows that trigger an early flush
+        :type flush_rows: int
+        :param queue_size: stream items waiting for extraction
+        :type queue_size: int
+        :param on_flush: called with the flushed (subreddit, model) keys. ie - index.html
+        :type on_flush: callable
+        """
+        self.models = models
+        self.flush_interval = flush_interval
+        self.flush_rows = flush_rows
+        self.queue = queue.Queue(maxsize=max(1, queue_size))
+        self.on_flush = on_flush
+        self.stop_event = threading.Event()
+        self.subreddits = {name: model.subreddit for (name, _), model in models.items()}
+        # submission ids whose comments a comment model keeps
+        self.parents = {key: set() for key, model in models.items() if model.from_comments}
+        # subreddit -> submission id -> comments whose submission is not known yet
+        self.orphans = {name: OrderedDict() for name in self.subreddits}
+        self.orphan_count = 0
+        self.frames = {key: [] for key in models}
+        self.rows = {key: 0 for key in models}
+        self.last_flush = {key: time.monotonic() for key in models}
+        self.received = 0
+        self.blocked = 0
+        self.flushes = 0
+        self._threads = []
+
+    def stop(self, *args):
+        """graceful shutdown. the queue is drained and every model flushed once more.
+        signal handler signature, ie - signal.signal(signal.SIGTERM, daemon.stop)
+        """
+        self.stop_event.set()
+
+    def _put(self, item):
+        """backpressure. blocks while the queue is full, wakes up on stop
+        """
+        while not self.stop_event.is_set():
+            try:
+                self.queue.put(item, timeout=0.5)
+                return
+            except queue.Full:
+                self.blocked += 1
+
+    def _produce(self, name, kind):
+        """one stream of one subreddit. a failed stream is restarted after a pause
+        """
+        retry_seconds = 1
+        while not self.stop_event.is_set():
+            stream = getattr(self.subreddits[name].stream, kind)
+            try:
+                # pause_after=0: None after every poll without new items, to check for stop
+                for item in stream(pause_after=0, skip_existing=False):
+                    if self.stop_event.is_set():
+                        return
+                    if item is not None:
+                        self._put((name, kind, item))
+                        retry_seconds = 1
+            except Exception as err:
+                print(f"r/{name} {kind} stream failed, retrying in {retry_seconds}s: {err!r}")
+                self.stop_event.wait(retry_seconds)
+                retry_seconds = min(retry_seconds * 2, 60)
+
+    def seed(self):
+        """recent submissions of the comment models. their threads are older than the stream
+        """
+        for (name, m), model in self.models.items():
+            if not model.from_comments:
+                continue
+            for submission in model.subreddit.search(model.search_query, sort="new",
+                                                     time_filter="week", limit=SEED_LIMIT):
+                self.parents[(name, m)].add(submission.id)
+            print(f"r/{name} {m}: streaming comments of {len(self.parents[(name, m)])} submissions")
+
+    def start(self):
+        kinds = ["submissions"]
+        if self.parents:
+            kinds.append("comments")
+        for name in self.subreddits:
+            for kind in kinds:
+                thread = threading.Thread(target=self._produce, args=(name, kind),
+                                          name=f"{name}-{kind}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def _drain(self, timeout):
+        """up to BATCH_SIZE queued items. waits at most timeout for the first one
+        """
+        try:
+            items = [self.queue.get(timeout=timeout)]
+        except queue.Empty:
+            return []
+        while len(items) < BATCH_SIZE:
+            try:
+                items.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return items
+
+    def _orphan(self, name, link, comment):
+        self.orphans[name].setdefault(link, []).append(comment)
+        self.orphan_count += 1
+        while self.orphan_count > ORPHAN_LIMIT:
+            _, dropped = self.orphans[name].popitem(last=False)
+            self.orphan_count -= len(dropped)
+
+    def handle(self, items):
+        """stream items -> rows per model -> extract_tickers
+        """
+        rows = {key: [] for key in self.models}
+        for name, kind, item in items:
+            self.received += 1
+            keys = [key for key in self.models if key[0] == name]
+            if kind == "submissions":
+                orphans = self.orphans[name].pop(item.id, [])
+                self.orphan_count -= len(orphans)
+                for key in keys:
+                    model = self.models[key]
+                    if not model.matches(item):
+                        continue
+                    if model.from_comments:
+                        self.parents[key].add(item.id)
+                        rows[key].extend(model._comment_row(comment, "stream", None)
+                                         for comment in orphans)
+                    else:
+                        rows[key].append(model._submission_row(item, "stream", None))
+                continue
+
+            link = (item.link_id or "")[3:]
+            kept = False
+            for key in keys:
+                if link in self.parents.get(key, ()):
+                    rows[key].append(self.models[key]._comment_row(item, "stream", None))
+                    kept = True
+            if not kept:
+                self._orphan(name, link, item)
+
+        for key, key_rows in rows.items():
+            if key_rows:
+                self.frames[key].append(self.models[key].extract_tickers(pd.DataFrame(key_rows)))
+                self.rows[key] += len(key_rows)
+
+    def due(self, key, now):
+        """flush_interval is up, or flush_rows are waiting
+        """
+        if not self.rows[key]:
+            return False
+        waited = now - self.last_flush[key]
+        return waited >= self.flush_interval or \
+            (self.rows[key] >= self.flush_rows and waited >= MIN_FLUSH_SECONDS)
+
+    def load(self):
+        """curated history of every model. read once, flushes merge into it
+        """
+        for (name, m), model in self.models.items():
+            model.load_history()
+            rows = 0 if model.history is None else len(model.history)
+            print(f"r/{name} {m}: {rows:,} curated rows in memory")
+
+    def flush(self, key):
+        """raw file, then curated + chart. the raw rows are on disk first,
+        so a flush that fails can be rebuilt with replay.py
+        """
+        model = self.models[key]
+        frames, self.frames[key], self.rows[key] = self.frames[key], [], 0
+        self.last_flush[key] = time.monotonic()
+        df = pd.concat(frames, ignore_index=True)
+        # one stream item can be queued twice. ie - a restarted stream
+        df = df.drop_duplicates(subset="id", keep="last")
+        try:
+            df["raw_filename"] = model.new_run_context().raw_filename
+            model._raw_save(df[[col for col in df.columns
+                                if not col.endswith(("_regex", "_ticker"))]])
+            model.stage_timings = {}
+            model.curate_new(df)
+            print(f"r/{key[0]} {key[1]}: flushed {len(df):,} rows. "
+                  f"queue {self.queue.qsize():,}/{self.queue.maxsize:,}, "
+                  f"{self.blocked:,} blocked puts, {model.stage_timings}")
+        except Exception:
+            print(f"r/{key[0]} {key[1]}: flush failed")
+            traceback.print_exc()
+        finally:
+            # rows from now on are the next raw file + last_updated
+            model.set_run_time(dt.now())
+        self.flushes += 1
+
+    def flush_due(self, force=False):
+        now = time.monotonic()
+        flushed = [key for key in self.models if (force and self.rows[key]) or self.due(key, now)]
+        for key in flushed:
+            self.flush(key)
+        if flushed and self.on_flush is not None:
+            self.on_flush(flushed)
+
+    def run(self):
+        """until stop(). then the queued items are extracted and every model flushed
+        """
+        self.load()
+        self.seed()
+        self.start()
+        while not self.stop_event.is_set():
+            self.handle(self._drain(timeout=0.5))
+            self.flush_due()
+
+        while True:
+            items = self._drain(timeout=0)
+            if not items:
+                break
+            self.handle(items)
+        self.flush_due(force=True)
+
+        for thread in self._threads:
+            # producers blocked in a request are daemon threads. they go with the process
+            thread.join(timeout=1)
+        print(f"daemon stopped: {self.received:,} stream items, {self.flushes:,} flushes")
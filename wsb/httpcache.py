@@ -0,0 +1,197 @@
+# ON-DISK HTTP RESPONSE CACHE
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from urllib.parse import urlsplit
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+# seconds a response stays fresh per endpoint. endpoints not listed are never cached.
+# reddit sends api responses as no-store / max-age=0, so freshness comes from here.
+# 15 minute cron runs reuse top / controversial / search pages of the previous run
+CACHE_TTLS = {
+    "new": 60,
+    "hot": 300,
+    "rising": 300,
+    "top": 1800,
+    "controversial": 1800,
+    "search": 900,
+    "comments": 600,
+}
+DEFAULT_MAX_BYTES = 256 * 2**20
+# per response, not per page. a cached page must not move the rate limit state
+RATELIMIT_HEADERS = ("x-ratelimit-remaining", "x-ratelimit-reset", "x-ratelimit-used")
+
+
+def endpoint(url):
+    """endpoint of a reddit api url. ie - /r/wallstreetbets/top -> top,
+    /comments/abc -> comments (one submission's forest),
+    /r/wallstreetbets/comments -> comment_listing (newest comments, never cached)
+    """
+    parts = urlsplit(url).path.rstrip("/").split("/")
+    last = parts[-1]
+    last = last[:-len(".json")] if last.endswith(".json") else last
+    if last == "comments":
+        return "comment_listing"
+    if "comments" in parts:
+        return "comments"
+    return last
+
+
+def cache_key(method, url, params=None):
+    """method + url + query params. the auth header is left out, tokens rotate
+    """
+    query = json.dumps(sorted((str(k), str(v)) for k, v in (params or {}).items()))
+    return hashlib.sha1(f"{method.upper()} {url} {query}".encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """GET responses in one sqlite file, bounded by max_bytes.
+    the least recently used responses are evicted first.
+    stale responses with an ETag / Last-Modified are revalidated with a conditional request.
+    """
+    table = "responses"
+
+    def __init__(self, path, ttls=None, max_bytes=DEFAULT_MAX_BYTES, clock=time.time):
+        """init
+
+        :param path: sqlite file
+        :type path: str
+        :param ttls: seconds fresh per endpoint (default: CACHE_TTLS)
+        :type ttls: dict
+        :param max_bytes: response bodies kept on disk (default: 256 MiB)
+        :type max_bytes: int
+        :param clock: wall clock. entries outlive the process. swapped in tests
+        """
+        self.path = path
+        self.ttls = CACHE_TTLS if ttls is None else ttls
+        self.max_bytes = max_bytes
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self.revalidated = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        with self._connect() as conn:
+            conn.execute(f'''
+                CREATE TABLE IF NOT EXISTS "{self.table}" (
+                    "key" TEXT PRIMARY KEY, "url" TEXT, "headers" TEXT, "body" BLOB,
+                    "expires" REAL, "etag" TEXT, "last_modified" TEXT,
+                    "size" INTEGER, "accessed" REAL)
+            ''')
+
+    @contextmanager
+    def _connect(self):
+        """commit on success and always close. one thread at a time
+        """
+        Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        with self._lock:
+            conn = sqlite3.connect(self.path)
+            try:
+                with conn:
+                    yield conn
+            finally:
+                conn.close()
+
+    def ttl(self, url, params=None):
+        """seconds fresh. 0 is never cached.
+        polls of subreddit.stream are listings with before=, they must always be live
+        """
+        if params and params.get("before"):
+            return 0
+        return self.ttls.get(endpoint(url), 0)
+
+    def get(self, key):
+        """cached entry or None. marks it as used
+
+        :return: dict of headers, body, fresh, etag, last_modified
+        """
+        with self._connect() as conn:
+            row = conn.execute(
+                f'SELECT "headers", "body", "expires", "etag", "last_modified" '
+                f'FROM "{self.table}" WHERE "key" = ?', (key,)).fetchone()
+            if row is None:
+                return None
+            now = self.clock()
+            conn.execute(f'UPDATE "{self.table}" SET "accessed" = ? WHERE "key" = ?',
+                         (now, key))
+
+        headers, body, expires, etag, last_modified = row
+        return {"headers": json.loads(headers), "body": body, "fresh": expires > now,
+                "etag": etag, "last_modified": last_modified}
+
+    def put(self, key, url, response, ttl):
+        """store a 200 response, then evict down to max_bytes
+
+        :param ttl: seconds fresh
+        :type ttl: float
+        """
+        body = response.content
+        if len(body) > self.max_bytes:
+            return
+
+        headers = {k: v for k, v in response.headers.items()
+                   if k.lower() not in RATELIMIT_HEADERS}
+        now = self.clock()
+        with self._connect() as conn:
+            conn.execute(
+                f'INSERT OR REPLACE INTO "{self.table}" VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (key, url, json.dumps(headers), body, now + ttl,
+                 response.headers.get("etag"), response.headers.get("last-modified"),
+                 len(body), now))
+            self._evict(conn)
+
+    def refresh(self, key, ttl):
+        """304 not modified: the cached body is fresh for another ttl
+        """
+        now = self.clock()
+        with self._connect() as conn:
+            conn.execute(f'UPDATE "{self.table}" SET "expires" = ?, "accessed" = ? '
+                         f'WHERE "key" = ?', (now + ttl, now, key))
+
+    def _evict(self, conn):
+        total = conn.execute(f'SELECT COALESCE(SUM("size"), 0) FROM "{self.table}"').fetchone()[0]
+        if total <= self.max_bytes:
+            return
+
+        rows = conn.execute(f'SELECT "key", "size" FROM "{self.table}" '
+                            f'ORDER BY "accessed"').fetchall()
+        evicted = []
+        for key, size in rows:
+            if total <= self.max_bytes:
+                break
+            evicted.append((key,))
+            total -= size
+        conn.executemany(f'DELETE FROM "{self.table}" WHERE "key" = ?', evicted)
+        self.evictions += len(evicted)
+
+    def stats(self):
+        with self._connect() as conn:
+            entries, size = conn.execute(
+                f'SELECT COUNT(*), COALESCE(SUM("size"), 0) FROM "{self.table}"').fetchone()
+        return {"hits": self.hits, "misses": self.misses, "revalidated": self.revalidated,
+                "evictions": self.evictions, "entries": entries, "bytes": size}
+
+
+def cached_response(entry, url, live_headers=None):
+    """requests.Response of a cache entry. prawcore reads status_code, headers, json()
+
+    :param entry: see ResponseCache.get
+    :param live_headers: headers of the 304 that revalidated it. keeps the ratelimit headers
+    """
+    response = requests.Response()
+    response.status_code = 200
+    response._content = entry["body"]
+    response.headers = CaseInsensitiveDict(entry["headers"])
+    for header in RATELIMIT_HEADERS:
+        if live_headers and header in live_headers:
+            response.headers[header] = live_headers[header]
+    response.url = url
+    response.encoding = "utf-8"
+    return response
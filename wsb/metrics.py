@@ -0,0 +1,185 @@
+# RUN METRICS
+
+import csv
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime as dt
+from pathlib import Path
+
+try:
+    import resource
+except ImportError:  # windows
+    resource = None
+
+# one row per stage in the csv report. the json report has the same records
+FIELDS = ["stage", "subreddit", "model", "started", "wall_s", "cpu_s",
+          "api_requests", "rows_in", "rows_out", "peak_rss_mb", "pid", "thread"]
+
+
+def peak_rss_mb():
+    """peak resident memory of this process so far. None where it is not available
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on linux, bytes on macos
+    if sys.platform == "darwin":
+        peak /= 1024
+    return round(peak / 1024, 1)
+
+
+class Metrics:
+    """per stage wall / cpu time, api requests, rows in / out and peak rss of a run.
+    thread safe. every model, the html page and MoneyPrinter share one instance.
+
+    cpu time is the cpu time of the thread that ran the stage.
+    api requests are read from a shared counter, so a stage that overlaps other
+    fetches also counts their requests. the run total is exact.
+    """
+
+    def __init__(self, requests=None):
+        """init
+
+        :param requests: returns the api requests made so far. ie - TokenBucket.acquired
+        :type requests: callable
+        """
+        self.requests = requests or (lambda: 0)
+        self.started = dt.now()
+        self.records = []
+        self._lock = threading.Lock()
+
+    def new_record(self, stage, **labels):
+        """record of a stage that is timed in parts. see timing + add
+
+        :param stage: stage name. ie - fetch_hot, extract_tickers, chart
+        :type stage: str
+        :param labels: subreddit, model
+        """
+        return {"stage": stage, "subreddit": None, "model": None,
+                "rows_in": None, "rows_out": None, **labels,
+                "started": dt.now().isoformat(timespec="seconds"),
+                "wall_s": 0.0, "cpu_s": 0.0, "api_requests": 0}
+
+    @contextmanager
+    def timing(self, record):
+        """add the wall / cpu time + api requests of a block to record.
+        ie - fetch and extract_tickers of raw chunks take turns in one loop
+        """
+        wall = time.perf_counter()
+        cpu = time.thread_time()
+        requests = self.requests()
+        try:
+            yield record
+        finally:
+            record["wall_s"] += time.perf_counter() - wall
+            record["cpu_s"] += time.thread_time() - cpu
+            record["api_requests"] += self.requests() - requests
+
+    def add(self, record):
+        """finish a record from new_record
+        """
+        record.update({
+            "wall_s": round(record["wall_s"], 3),
+            "cpu_s": round(record["cpu_s"], 3),
+            "peak_rss_mb": peak_rss_mb(),
+            "pid": os.getpid(),
+            "thread": threading.current_thread().name,
+        })
+        with self._lock:
+            self.records.append(record)
+
+    @contextmanager
+    def stage(self, stage, **labels):
+        """record one stage. yields the record, so the caller can set rows_in / rows_out
+
+        :param stage: stage name. ie - fetch_hot, extract_tickers, chart
+        :type stage: str
+        :param labels: subreddit, model
+        """
+        record = self.new_record(stage, **labels)
+        try:
+            with self.timing(record):
+                yield record
+        finally:
+            self.add(record)
+
+    def extend(self, records, **labels):
+        """add records of another process. ie - a worker of the cpu pool
+
+        :param records: Metrics.records
+        :type records: list
+        :param labels: overrides. ie - the subreddit, which the worker does not know
+        """
+        with self._lock:
+            self.records.extend({**record, **labels} for record in records)
+
+    def reset(self):
+        """start a new report. ie - every hour of a daemon
+        """
+        with self._lock:
+            self.started = dt.now()
+            self.records = []
+
+    def report(self):
+        return {
+            "started": self.started.isoformat(timespec="seconds"),
+            "argv": sys.argv,
+            "api_requests": self.requests(),
+            "peak_rss_mb": peak_rss_mb(),
+            "stages": self.records,
+        }
+
+    def write(self, folder, name):
+        """{folder}/{name}.json + {folder}/{name}.csv
+
+        :param folder: ie - output/metrics/YYYY/MM/DD
+        :type folder: str
+        :param name: ie - run_HHMMSS
+        :type name: str
+        :return: json path
+        """
+        Path(folder).mkdir(parents=True, exist_ok=True)
+        json_path = Path(folder, f"{name}.json")
+        with open(json_path, "w", encoding="utf-8") as f:
+            json.dump(self.report(), f, indent=2)
+
+        with open(Path(folder, f"{name}.csv"), "w", encoding="utf-8", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=FIELDS, extrasaction="ignore")
+            writer.writeheader()
+            writer.writerows(self.records)
+
+        return str(json_path)
+
+
+@contextmanager
+def profiled(path):
+    """cProfile the calling thread into path. no-op if path is None.
+    pstats: python -m pstats {path}
+
+    :param path: .prof file
+    :type path: str
+    """
+    if path is None:
+        yield
+        return
+
+    import cProfile
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError as err:
+        # python 3.12+ allows one active profiler. ie - another model thread has it
+        print(f"not profiling {path}: {err}")
+        yield
+        return
+
+    try:
+        yield
+    finally:
+        profiler.disable()
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        profiler.dump_stats(path)
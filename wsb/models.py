@@ -33,9 +33,8 @@ class DueDiligence(ModelBase):
 /____/\_,_/\__/ /____/_/_/_/\_, /\__/_//_/\__/\__/ 
                            /___/                   
         """)
-        df = self.submissions()
-
-        self.model(df)
+        # extract tickers chunk by chunk while the fetch is still running
+        self.model(self.submission_chunks())
 
         return
 
@@ -46,6 +45,7 @@ class DailyDiscussion(ModelBase):
     always get new Daily Discussion
     TODO sentiment analysis?
     """
+    from_comments = True
 
     def __init__(self, **kwargs):
         """init
@@ -67,9 +67,8 @@ class DailyDiscussion(ModelBase):
 /____/\_,_/_/_/\_, / /____/_/___/\__/\_,_/___/___/_/\___/_//_/
               /___/                                           
         """)
-        df = self.submissions(comments=True)
-
-        self.model(df)
+        # comments are written to the raw file and extracted chunk by chunk
+        self.model(self.submission_chunks(comments=True))
 
         return
 
@@ -100,13 +99,18 @@ class StockTicker(ModelBase):
 /___/\__/\___/\__/_/\_\   /_/ /_/\__/_/\_\\__/_/   
                                                    
         """)
-        all_dfs = []
-        for sort in ["hot", "top", "new", "controversial"]:
-            df = self.submissions(sort=sort)
-            all_dfs.append(df)
-
-        df = pd.concat(all_dfs, ignore_index=True).drop_duplicates(
-            subset=['id'])
+        sorts = ["hot", "top", "new", "controversial"]
+        if self.max_workers > 1:
+            df = self.concurrent_submissions(sorts,
+                                             max_workers=self.max_workers)
+        else:
+            all_dfs = []
+            for sort in sorts:
+                df = self.submissions(sort=sort)
+                all_dfs.append(df)
+
+            df = pd.concat(all_dfs, ignore_index=True).drop_duplicates(
+                subset=['id'])
 
         self.model(df)
 
@@ -1,10 +1,18 @@
-import praw
-import models
 import argparse
 import json
+import multiprocessing
+import sys
+import traceback
+from datetime import datetime as dt
 from timeit import default_timer as timer
 import humanize
 
+# praw, pandas and the models are imported after the args are parsed.
+# keeps -h and bad args fast
+
+# the subreddit behind the github pages site. its output stays at the top of --output
+MAIN_SUBREDDIT = "wallstreetbets"
+
 
 class MoneyPrinter:
     """BRRRRRRRRRRRRRRRRR
@@ -15,20 +23,55 @@ class MoneyPrinter:
         :param args: cmdline args
         :type args: argparse obj
         """
+        import praw
+        from httpcache import ResponseCache
+        from metrics import Metrics
+        from ratelimit import RateLimitedRequestor, TokenBucket
+
         with open(args.credentials, "r") as f:
             self.credentials = json.loads(f.read())
 
+        # one token bucket for every request of every model and subreddit
+        self.limiter = TokenBucket(rate=args.rate)
+        # fresh listing / comment pages are served from disk without spending a token
+        self.cache = None
+        if args.http_cache:
+            self.cache = ResponseCache(args.http_cache,
+                                       max_bytes=int(args.http_cache_mb * 2**20))
         self.reddit = praw.Reddit(client_id=self.credentials["client_id"],
                                   client_secret=self.credentials["client_secret"],
                                   refresh_token=self.credentials["refresh_token"],
-                                  user_agent=self.credentials["user_agent"]
+                                  user_agent=self.credentials["user_agent"],
+                                  requestor_class=RateLimitedRequestor,
+                                  requestor_kwargs={"limiter": self.limiter,
+                                                    "cache": self.cache}
                                   )
-        self.subreddit = self.reddit.subreddit("wallstreetbets")
+        self.subreddits = {name: self.reddit.subreddit(name)
+                           for name in args.subreddits}
+        self.subreddit = self.subreddits[args.subreddits[0]]
+        self.jobs = args.jobs
+        self.processes = args.processes
+        self.cpu_pool = None
+        self.profile = args.profile
+        # every stage of every model + index.html. written to metrics_folder after the run
+        self.metrics = Metrics(requests=lambda: self.limiter.acquired)
         self.timefilter = args.timefilter
         self.output = args.output
         self.limit = args.limit
+        self.workers = args.workers
+        self.replace_more = args.replace_more
+        self.comment_budget = args.comment_budget
+        self.incremental = args.incremental
+        self.storage = args.storage
+        self.chart_mode = args.chart_mode
+        self.semantic_data = args.semantic_data
 
-        not_models = {"timefilter", "output", "credentials", "limit", "all"}
+        not_models = {"timefilter", "output", "credentials", "limit", "all",
+                      "subreddits", "jobs", "processes", "rate", "profile",
+                      "http_cache", "http_cache_mb",
+                      "daemon", "flush_interval", "flush_rows", "queue_size",
+                      "workers", "replace_more", "comment_budget", "incremental",
+                      "storage", "chart_mode", "semantic_data"}
         if args.all:
             self.modelnames = [a for a in vars(args) if a not in not_models]
         else:
@@ -60,25 +103,159 @@ Welcome to
         #     print(submission.id)
         #     print(submission.url)
 
+    def output_for(self, name):
+        """output folder of a subreddit. ie - ../output/r/stocks
+        """
+        if name == MAIN_SUBREDDIT:
+            return self.output
+        return f"{self.output}/r/{name}"
+
+    @property
+    def metrics_folder(self):
+        return f"{self.output}/metrics/{self.metrics.started:%Y/%m/%d}"
+
+    @property
+    def metrics_name(self):
+        """run_HHMMSS. the report is {name}.json + {name}.csv,
+        --profile dumps are {name}_{subreddit}_{model}.prof
+        """
+        return f"run_{self.metrics.started:%H%M%S}"
+
+    def make_model(self, name, m):
+        """model of one (subreddit, model) pair
+        """
+        import models
+
+        return getattr(models, m)(
+            subreddit=self.subreddits[name],
+            timefilter=self.timefilter,
+            limit=self.limit,
+            output=self.output_for(name),
+            max_workers=self.workers,
+            replace_more_limit=self.replace_more,
+            comment_budget=self.comment_budget,
+            incremental=self.incremental,
+            storage=self.storage,
+            chart_mode=self.chart_mode,
+            semantic_data=self.semantic_data,
+            cpu_pool=self.cpu_pool,
+            metrics=self.metrics
+        )
+
+    def run_model(self, name, m):
+        """one (subreddit, model) pair
+        """
+        # tendies is main method of model
+        self.make_model(name, m).tendies()
+
+    def _run_pair(self, name, m):
+        """run_model, timed. a crash is printed and returned instead of raised,
+        so one broken model does not stop the others
+
+        :return: (wall seconds, exception or None)
+        """
+        from metrics import profiled
+
+        profile = None
+        if self.profile:
+            profile = f"{self.metrics_folder}/{self.metrics_name}_{name}_{m}.prof"
+
+        err = None
+        with self.metrics.stage("model", subreddit=name, model=m) as record, \
+                profiled(profile):
+            try:
+                self.run_model(name, m)
+            except Exception as exc:
+                print(f"r/{name} {m} failed")
+                traceback.print_exc()
+                err = exc
+
+        return record["wall_s"], err
+
     def go_brrr(self):
         """ pump out them tendies
         """
+        from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+        import models
+
         self.pump()
 
-        # dynamically pull the models based on modelnames
-        for m in self.modelnames:
-            model = getattr(models, m)(
-                subreddit=self.subreddit,
-                timefilter=self.timefilter,
-                limit=self.limit,
-                output=self.output
-            )
-            # tendies is main method of model
-            model.tendies()
+        # every (subreddit, model) pair on one thread pool for the network work.
+        # the shared token bucket keeps them all under the api rate limit.
+        # with --processes, ticker extraction + charts run in a process pool
+        if self.processes > 0:
+            # not fork: the model threads hold the token bucket / cache / metrics locks.
+            # a forked worker that inherits a held lock deadlocks.
+            # workers.py rebuilds its models from worker_kwargs, so spawn is enough
+            self.cpu_pool = ProcessPoolExecutor(max_workers=self.processes,
+                                                mp_context=multiprocessing.get_context("spawn"))
+        pairs = [(name, m) for name in self.subreddits for m in self.modelnames]
+        try:
+            with ThreadPoolExecutor(max_workers=max(1, self.jobs)) as pool:
+                futures = [pool.submit(self._run_pair, name, m) for name, m in pairs]
+                results = [future.result() for future in futures]
+        finally:
+            if self.cpu_pool is not None:
+                self.cpu_pool.shutdown()
+                self.cpu_pool = None
+            # also written for runs cut short. ie - ctrl+c
+            print("metrics:", self.metrics.write(self.metrics_folder, self.metrics_name))
 
-        models.HTML().tendies()
+        failed = []
+        for (name, m), (seconds, err) in zip(pairs, results):
+            if err is None:
+                print(f"r/{name} {m}: {seconds:.1f}s")
+            else:
+                print(f"r/{name} {m}: FAILED after {seconds:.1f}s ({err!r})")
+                failed.append((name, m))
+
+        print(f"api requests: {self.limiter.acquired}, "
+              f"rate limit waits: {self.limiter.waited:.1f}s")
+        if self.cache is not None:
+            print("http cache:", self.cache.stats())
+        # every model has joined. the charts of the failed ones are left as they were
+        if MAIN_SUBREDDIT in self.subreddits:
+            models.HTML(metrics=self.metrics).tendies()
+            # again, with the update_html stage
+            self.metrics.write(self.metrics_folder, self.metrics_name)
 
         print("BRRRRRR")
+        return failed
+
+    def daemon(self, flush_interval, flush_rows, queue_size):
+        """stream every (subreddit, model) pair until SIGINT / SIGTERM. see daemon.py
+        """
+        import signal
+        import models
+        from daemon import Daemon
+
+        self.pump()
+        pairs = {(name, m): self.make_model(name, m)
+                 for name in self.subreddits for m in self.modelnames}
+
+        def on_flush(keys):
+            if any(name == MAIN_SUBREDDIT for name, _ in keys):
+                models.HTML(metrics=self.metrics).tendies()
+            self.metrics.write(self.metrics_folder, self.metrics_name)
+            # one report per hour instead of one ever growing report
+            if (dt.now() - self.metrics.started).total_seconds() >= 3600:
+                self.metrics.reset()
+
+        daemon = Daemon(pairs, flush_interval=flush_interval, flush_rows=flush_rows,
+                        queue_size=queue_size, on_flush=on_flush)
+        signal.signal(signal.SIGINT, daemon.stop)
+        signal.signal(signal.SIGTERM, daemon.stop)
+        daemon.run()
+        return daemon
+
+
+def replace_more_limit(value):
+    """--replace-more value. none or a negative number expands every MoreComments
+    """
+    if value.lower() == "none":
+        return None
+    limit = int(value)
+    return None if limit < 0 else limit
 
 
 def parse_args():
@@ -89,6 +266,35 @@ def parse_args():
     parser = argparse.ArgumentParser(description='Money Printer Go BRRRRRRR')
     parser.add_argument('-c', '--credentials', type=str, default="./credentials.json",
                         help='Credentials file. Default is ./credentials.json')
+    parser.add_argument('-r', '--subreddits', type=str, nargs="+", default=[MAIN_SUBREDDIT],
+                        help=f"""Subreddits to run the models on. {MAIN_SUBREDDIT} writes to OUTPUT,
+                        the others to OUTPUT/r/<subreddit>. Default is {MAIN_SUBREDDIT}""")
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help='(subreddit, model) pairs run at once. 1 runs them one after another. Default is 1')
+    parser.add_argument('-p', '--processes', type=int, default=0,
+                        help="""Worker processes for ticker extraction, merge and charts.
+                        0 runs them in the model threads. Default is 0""")
+    parser.add_argument('--http-cache', type=str, default=None, dest="http_cache",
+                        help="""sqlite file that caches listing / comment pages between requests and runs.
+                        ie - ./.http_cache.sqlite. Default is None (no cache)""")
+    parser.add_argument('--http-cache-mb', type=float, default=256, dest="http_cache_mb",
+                        help='Size bound of the http cache. Least recently used pages go first. Default is 256')
+    parser.add_argument('--daemon', action='store_true',
+                        help="""Keep running and follow the subreddit streams instead of fetching the listings once.
+                        Stops on SIGINT / SIGTERM after a last flush. Default is False""")
+    parser.add_argument('--flush-interval', type=float, default=60, dest="flush_interval",
+                        help='Daemon: seconds between curated / chart updates of a model. Default is 60')
+    parser.add_argument('--flush-rows', type=int, default=5000, dest="flush_rows",
+                        help='Daemon: waiting rows that trigger an early update. Default is 5000')
+    parser.add_argument('--queue-size', type=int, default=10000, dest="queue_size",
+                        help="""Daemon: stream items waiting for ticker extraction.
+                        A full queue pauses the streams. Default is 10000""")
+    parser.add_argument('--profile', action='store_true',
+                        help="""cProfile every model into OUTPUT/metrics/YYYY/MM/DD/run_HHMMSS_<subreddit>_<model>.prof.
+                        Default is False""")
+    parser.add_argument('--rate', type=float, default=1.0,
+                        help="""Requests per second until reddit's ratelimit headers take over.
+                        Shared by every subreddit and model. Default is 1.0""")
     parser.add_argument('-t', '--timefilter', type=str, default="day",
                         help='Choose time filter for Reddit search query. Only used for top and search methods. Default is day',
                         choices=["all", "day", "hour", "month", "week", "year"])
@@ -97,6 +303,28 @@ def parse_args():
                         Most of reddit’s listings contain a maximum of 1000 items, and are returned 100 at a time. Default is None""")
     parser.add_argument('-o', '--output', type=str, default="../output",
                         help='output folder for model. Default is ../output')
+    parser.add_argument('-w', '--workers', type=int, default=1,
+                        help='Concurrent listing / comment fetches per model. 1 fetches serially. Default is 1')
+    parser.add_argument('--replace-more', type=replace_more_limit, default=32, dest="replace_more",
+                        help="""MoreComments to expand per submission. none or -1 expands all (slow).
+                        0 expands none and drops the "load more" stubs. Default is 32""")
+    parser.add_argument('--comment-budget', type=float, default=None, dest="comment_budget",
+                        help='Seconds to spend fetching comments before skipping the rest. Default is None (unbounded)')
+
+    parser.add_argument('-i', '--incremental', action='store_true',
+                        help='Only fetch submissions / comments that are new since the last run. Default is False')
+
+    parser.add_argument('-s', '--storage', type=str, default="csv",
+                        help='Curated storage backend. Default is csv',
+                        choices=["csv", "sqlite"])
+    parser.add_argument('--chart-mode', type=str, default="aggregate", dest="chart_mode",
+                        help="""Semantic chart data. aggregate embeds mention counts per ticker per day + the top rows for the tables.
+                        rows embeds every mention row. Default is aggregate""",
+                        choices=["aggregate", "rows"])
+    parser.add_argument('--semantic-data', type=str, default="inline", dest="semantic_data",
+                        help="""Chart datasets inline in the semantic json, or external files named by content hash.
+                        Default is inline""",
+                        choices=["inline", "external"])
 
     # enable models.py
     parser.add_argument('--all', action='store_true', help='Runs all models. Overrides the model flags. Default is False')
@@ -120,11 +348,18 @@ if __name__ == "__main__":
     start = timer()
     args = parse_args()
     mp = MoneyPrinter(args)
+    failed = []
     try:
-        mp.go_brrr()
+        if args.daemon:
+            mp.daemon(args.flush_interval, args.flush_rows, args.queue_size)
+        else:
+            failed = mp.go_brrr()
     except KeyboardInterrupt:
         print("[CTRL+C detected]")
     finally:
         end = timer()
 
         print("Total execution time:", humanize.naturaldelta(end-start))
+
+    if failed:
+        sys.exit(1)
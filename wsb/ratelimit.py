@@ -0,0 +1,138 @@
+# SHARED REDDIT RATE LIMIT
+
+import threading
+import time
+
+from prawcore import Requestor
+
+from httpcache import cache_key, cached_response
+
+# reddit oauth clients get 600 requests per 10 minute window.
+# the ratelimit headers of every response take over from these defaults
+DEFAULT_RATE = 1.0
+DEFAULT_BURST = 10
+
+
+class TokenBucket:
+    """token bucket shared by every thread that talks to reddit.
+    acquire() blocks until a request is allowed.
+    update() syncs the bucket with the x-ratelimit-* response headers, so the
+    rest of the window is spread evenly instead of bursting into a 429.
+    """
+
+    def __init__(self, rate=DEFAULT_RATE, capacity=DEFAULT_BURST,
+                 clock=time.monotonic, sleep=time.sleep):
+        """init
+
+        :param rate: tokens per second until the first response headers
+        :type rate: float
+        :param capacity: burst size
+        :type capacity: int
+        :param clock: monotonic clock. swapped in tests
+        :param sleep: sleep function. swapped in tests
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.clock = clock
+        self.sleep = sleep
+        self.updated = clock()
+        self.acquired = 0
+        self.waited = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity,
+                          self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self):
+        """take one token. sleeps outside the lock until one is available
+        """
+        while True:
+            with self._lock:
+                self._refill(self.clock())
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    self.acquired += 1
+                    return
+                wait_seconds = (1 - self.tokens) / self.rate
+
+            self.waited += wait_seconds
+            self.sleep(wait_seconds)
+
+    def update(self, remaining, reset_seconds):
+        """sync with the ratelimit headers of a response
+
+        :param remaining: requests left in the window
+        :type remaining: float
+        :param reset_seconds: seconds until the window resets
+        :type reset_seconds: float
+        """
+        with self._lock:
+            self._refill(self.clock())
+            # at least one token per window, so an exhausted window waits for the reset
+            self.rate = max(remaining, 1) / max(reset_seconds, 1)
+            self.tokens = min(self.tokens, max(remaining, 0))
+
+    def update_from_headers(self, headers):
+        """x-ratelimit-remaining / x-ratelimit-reset. ignored if missing. ie - auth requests
+        """
+        remaining = headers.get("x-ratelimit-remaining")
+        reset = headers.get("x-ratelimit-reset")
+        if remaining is None or reset is None:
+            return
+        self.update(float(remaining), float(reset))
+
+
+class RateLimitedRequestor(Requestor):
+    """prawcore requestor that takes a token before every http request.
+    pass to praw.Reddit(requestor_class=..., requestor_kwargs={"limiter": bucket})
+
+    with a cache (httpcache.ResponseCache), fresh GET responses are served from disk
+    without a token. stale ones are revalidated with If-None-Match / If-Modified-Since
+    """
+
+    def __init__(self, *args, limiter=None, cache=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.limiter = limiter or TokenBucket()
+        self.cache = cache
+
+    def _send(self, *args, **kwargs):
+        self.limiter.acquire()
+        response = super().request(*args, **kwargs)
+        self.limiter.update_from_headers(response.headers)
+        return response
+
+    def request(self, method, url, *args, **kwargs):
+        ttl = 0
+        if self.cache is not None and method.upper() == "GET":
+            ttl = self.cache.ttl(url, kwargs.get("params"))
+        if not ttl:
+            return self._send(method, url, *args, **kwargs)
+
+        key = cache_key(method, url, kwargs.get("params"))
+        entry = self.cache.get(key)
+        if entry is not None and entry["fresh"]:
+            self.cache.hits += 1
+            return cached_response(entry, url)
+
+        if entry is not None:
+            # conditional request where the response had a validator
+            headers = dict(kwargs.get("headers") or {})
+            if entry["etag"]:
+                headers["If-None-Match"] = entry["etag"]
+            if entry["last_modified"]:
+                headers["If-Modified-Since"] = entry["last_modified"]
+            kwargs["headers"] = headers
+
+        response = self._send(method, url, *args, **kwargs)
+        if response.status_code == 304 and entry is not None:
+            self.cache.revalidated += 1
+            self.cache.refresh(key, ttl)
+            return cached_response(entry, url, response.headers)
+
+        self.cache.misses += 1
+        if response.status_code == 200:
+            self.cache.put(key, url, response, ttl)
+        return response
@@ -0,0 +1,83 @@
+# STREAMING RAW CAPTURE
+
+import os
+from pathlib import Path
+
+import pandas as pd
+
+# row dicts held in memory before a chunk is appended to the raw file
+CHUNK_ROWS = 5000
+# raw files are written under this suffix and renamed once complete
+PARTIAL_SUFFIX = ".part"
+
+
+class RawWriter:
+    """append raw rows to a pipe delimited csv, one chunk at a time.
+    same file layout as DataFrame.to_csv of the whole fetch.
+
+    the file is written as {path}.part and renamed to path once the fetch is done.
+    a crash leaves the .part file with every flushed chunk. chunks are whole csv lines,
+    so a partial file reads like any other raw file.
+    """
+
+    def __init__(self, path, delim="|", chunk_rows=CHUNK_ROWS):
+        """init
+
+        :param path: raw file
+        :type path: str
+        :param delim: csv delimiter
+        :type delim: str
+        :param chunk_rows: rows per chunk (default: CHUNK_ROWS)
+        :type chunk_rows: int
+        """
+        self.path = Path(path)
+        self.partial_path = Path(f"{path}{PARTIAL_SUFFIX}")
+        self.delim = delim
+        self.chunk_rows = max(1, chunk_rows)
+        self.rows_written = 0
+        self._columns = None
+
+    def write(self, rows):
+        """append row dicts to the partial file
+
+        :param rows: row dicts
+        :type rows: list
+        :return: chunk df. index continues from the previous chunk
+        """
+        df = pd.DataFrame(rows)
+        df.index = pd.RangeIndex(self.rows_written, self.rows_written + len(df))
+        if self._columns is None:
+            self._columns = list(df.columns)
+        elif len(df):
+            df = df.reindex(columns=self._columns)
+
+        with open(self.partial_path, "a", encoding="utf-8", newline="") as f:
+            df.to_csv(f, sep=self.delim, header=self.rows_written == 0)
+            f.flush()
+            os.fsync(f.fileno())
+
+        self.rows_written += len(df)
+        return df
+
+    def chunks(self, rows):
+        """stream row dicts into the raw file.
+        yields each chunk df once it is on disk. the file is complete once exhausted
+
+        :param rows: row dicts
+        :type rows: iterable
+        """
+        buffer = []
+        for row in rows:
+            buffer.append(row)
+            if len(buffer) >= self.chunk_rows:
+                yield self.write(buffer)
+                buffer = []
+
+        if buffer or self.rows_written == 0:
+            # an empty fetch still leaves an (empty) raw file
+            yield self.write(buffer)
+
+        self.close()
+
+    def close(self):
+        os.replace(self.partial_path, self.path)
@@ -0,0 +1,133 @@
+"""Rebuild curated + semantic outputs from the raw archives. no Reddit API calls.
+ie - after changing the stoplist words or the ticker regex
+
+Run from the wsb folder:
+    python replay.py --all
+"""
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from timeit import default_timer as timer
+
+import humanize
+import pandas as pd
+
+from archive import day_folders, read_day
+from storage import DATE_COLS, latest
+from workers import worker_model
+
+# raw columns that are numbers. the archives keep every column as str
+NUMERIC_COLS = ["upvote_ratio", "ups", "downs", "score", "num_comments",
+                "total_awards_received"]
+MODELS = ["StockTicker", "DueDiligence", "DailyDiscussion"]
+
+
+def typed(df):
+    """archive str columns -> the dtypes of a fresh fetch
+    """
+    # empty cells were None / NaN before the csv round trip
+    df = df.where(df != "")
+    for col in DATE_COLS:
+        if col in df.columns:
+            df[col] = pd.to_datetime(df[col])
+    for col in NUMERIC_COLS:
+        if col in df.columns:
+            df[col] = pd.to_numeric(df[col])
+    return df
+
+
+def replay_day(name, day_folder, model_kwargs):
+    """extract + clean one day of raw rows for one model
+
+    :param name: model class name
+    :type name: str
+    :param day_folder: output/raw/YYYY/MM/DD
+    :type day_folder: str
+    :param model_kwargs: output, storage, etc.
+    :type model_kwargs: dict
+    :return: curated rows indexed by id, or None
+    """
+    # only this model's archive + snapshots are parsed
+    raw = read_day(day_folder, name).get(name)
+    if raw is None or raw.empty:
+        return None
+
+    model = worker_model(name, model_kwargs)
+    df = model.extract_tickers(typed(raw))
+    return model.clean_curated(df.set_index("id"))
+
+
+def replay(name, model_kwargs, max_workers=None):
+    """rebuild one model's curated store and chart from output/raw
+
+    days are extracted in a process pool, then reduced into the curated history
+    in one write. curated rows with no raw snapshot left are kept and re-cleaned.
+
+    :param name: model class name
+    :type name: str
+    :param model_kwargs: output, storage, etc.
+    :type model_kwargs: dict
+    :param max_workers: process pool size. None is the cpu count
+    :type max_workers: int
+    :return: rows in the curated store
+    """
+    model = worker_model(name, model_kwargs)
+    folders = [str(folder) for folder in day_folders(model_kwargs["output"])]
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        frames = [df for df in pool.map(replay_day, [name] * len(folders), folders,
+                                        [model_kwargs] * len(folders))
+                  if df is not None]
+
+    if not frames:
+        print(f"{name}: no raw snapshots")
+        return 0
+
+    # one row per id across days. same rule as ModelBase.merge
+    df = latest(pd.concat(frames))
+    if model.store.exists():
+        old_df = model.read_curated().set_index("id")
+        # replayed rows replace their curated rows
+        df = pd.concat([old_df[~old_df.index.isin(df.index)], df])
+        df = model.clean_curated(df)
+
+    model.save(df, overwrite=True)
+    model.chart(df.reset_index())
+    print(f"{name}: {len(folders):,} days -> {len(df):,} curated rows")
+    return len(df)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Rebuild curated + semantic outputs from raw')
+    parser.add_argument('-o', '--output', type=str, default="../output",
+                        help='output folder for model. Default is ../output')
+    parser.add_argument('-w', '--workers', type=int, default=None,
+                        help='days replayed in parallel. Default is the cpu count')
+    parser.add_argument('-s', '--storage', type=str, default="csv",
+                        help='Curated storage backend. Default is csv',
+                        choices=["csv", "sqlite"])
+    parser.add_argument('--chart-mode', type=str, default="aggregate", dest="chart_mode",
+                        help='Semantic chart data. Default is aggregate',
+                        choices=["aggregate", "rows"])
+    parser.add_argument('--semantic-data', type=str, default="inline", dest="semantic_data",
+                        help='Chart datasets inline or external. Default is inline',
+                        choices=["inline", "external"])
+
+    parser.add_argument('--all', action='store_true', help='Replays all models. Default is False')
+    parser.add_argument('-st', '--stockticker', action='store_true', dest="StockTicker",
+                        help='Stock Ticker search. Default is False')
+    parser.add_argument('-dd', '--duediligence', action='store_true', dest="DueDiligence",
+                        help='Due Diligence flair. Default is False')
+    parser.add_argument('-d', '--dailydiscussion', action='store_true', dest="DailyDiscussion",
+                        help='Daily Discussion flair. Default is False')
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    start = timer()
+    args = parse_args()
+    model_kwargs = {"output": args.output, "storage": args.storage,
+                    "chart_mode": args.chart_mode, "semantic_data": args.semantic_data}
+    for name in MODELS:
+        if args.all or getattr(args, name):
+            replay(name, model_kwargs, max_workers=args.workers)
+
+    print("Total execution time:", humanize.naturaldelta(timer() - start))
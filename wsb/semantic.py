@@ -0,0 +1,93 @@
+# SEMANTIC CHART OUTPUT
+
+import hashlib
+import json
+import os
+from pathlib import Path
+
+# vega-lite data format for the external dataset files
+DATA_FORMAT = {"type": "json"}
+
+
+def compact_json(obj):
+    """json without whitespace. same bytes for the same data
+    """
+    return json.dumps(obj, separators=(",", ":"), sort_keys=True)
+
+
+def content_hash(data):
+    """sha1 hex digest of bytes / str
+    """
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    return hashlib.sha1(data).hexdigest()
+
+
+def _replace_data_names(node, urls):
+    """swap {"name": dataset} references for {"url": ...} in place
+    """
+    if isinstance(node, dict):
+        data = node.get("data")
+        if isinstance(data, dict) and data.get("name") in urls:
+            node["data"] = {"url": urls[data["name"]], "format": dict(DATA_FORMAT)}
+        for value in node.values():
+            _replace_data_names(value, urls)
+    elif isinstance(node, list):
+        for value in node:
+            _replace_data_names(value, urls)
+
+
+def externalize_datasets(spec, data_folder, data_url, prefix):
+    """move the inline datasets of a vega-lite spec to content addressed files.
+    files are named {prefix}-{sha1}.json, so an unchanged dataset is never rewritten
+    and browsers can cache it. files of older runs with the same prefix are removed.
+
+    :param spec: vega-lite spec dict. ie - chart.to_dict()
+    :type spec: dict
+    :param data_folder: folder for the dataset files
+    :type data_folder: str
+    :param data_url: url of data_folder as seen by the browser
+    :type data_url: str
+    :param prefix: file prefix. ie - model name
+    :type prefix: str
+    :return: spec referencing the dataset files by url
+    """
+    data_folder = Path(data_folder)
+    data_folder.mkdir(parents=True, exist_ok=True)
+
+    urls = {}
+    keep = set()
+    for name, values in spec.pop("datasets", {}).items():
+        payload = compact_json(values)
+        filename = f"{prefix}-{content_hash(payload)}.json"
+        path = data_folder / filename
+        if not path.exists():
+            tmp_path = path.with_suffix(".tmp")
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(payload)
+            os.replace(tmp_path, path)
+        urls[name] = f"{data_url}/{filename}"
+        keep.add(filename)
+
+    _replace_data_names(spec, urls)
+
+    for path in data_folder.glob(f"{prefix}-*.json"):
+        if path.name not in keep:
+            path.unlink()
+
+    return spec
+
+
+def read_hash(path):
+    """stored input hash or None
+    """
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return f.read().strip()
+    except FileNotFoundError:
+        return None
+
+
+def write_hash(path, value):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(value)
@@ -0,0 +1,376 @@
+# CURATED STORAGE BACKENDS
+
+import json
+import sqlite3
+from contextlib import contextmanager
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+DATE_COLS = ["created", "last_updated"]
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S.%f"
+# tickers never contain ; or the | csv delimiter
+LIST_DELIM = ";"
+
+
+def encode_list_column(series):
+    """ticker lists -> "GME;AMC" strings. empty list is an empty string
+
+    :param series: column of lists
+    :type series: pandas series obj
+    """
+    return series.str.join(LIST_DELIM).fillna("")
+
+
+def decode_list_column(series):
+    """decode "GME;AMC" strings -> ticker lists. no per cell eval.
+    also reads the old python repr / json formats. ie - "['GME', 'AMC']"
+
+    :param series: column of strings
+    :type series: pandas series obj
+    :return: list of lists
+    """
+    series = series.fillna("").astype(str)
+    legacy = series.str.startswith("[")
+    if legacy.any():
+        # "['GME', 'AMC']" -> "GME;AMC". same quote stripping as clean_curated
+        series = series.where(
+            ~legacy,
+            series.str.strip("[]").str.replace("'", "", regex=False)
+            .str.replace('"', "", regex=False).str.replace(", ", LIST_DELIM, regex=False)
+            .str.strip()
+        )
+
+    return [value.split(LIST_DELIM) if value else [] for value in series.values]
+
+
+def latest(df):
+    """one row per id. latest last_updated wins, tie-break by score.
+    full ties go to the row further down
+
+    :param df: rows indexed by id
+    :type df: pandas df
+    """
+    if not df.index.has_duplicates:
+        return df
+    df = df.sort_values(["last_updated", "score"], kind="mergesort")
+    return df[~df.index.duplicated(keep="last")]
+
+
+def latest_in_order(df):
+    """one row per id of an id column. the same winner as latest,
+    but only the duplicated ids are sorted. every id keeps the position of its first row
+
+    :param df: rows with an id column and a RangeIndex. ie - CsvStore.read
+    :type df: pandas df
+    """
+    ids = df["id"]
+    duplicated = ids.duplicated(keep=False).values
+    if not duplicated.any():
+        return df
+
+    # stable. full ties go to the row further down
+    winners = df[duplicated].sort_values(["last_updated", "score"], kind="mergesort")
+    winners = winners[~winners["id"].duplicated(keep="last")]
+    winner_positions = pd.Series(winners.index, index=winners["id"].values)
+
+    positions = np.arange(len(df))
+    positions[duplicated] = winner_positions.loc[ids[duplicated].values].values
+    first = ~ids.duplicated().values
+    return df.take(positions[first]).reset_index(drop=True)
+
+
+def merge_latest(old, new):
+    """upsert new rows into the curated history. same rule as SqliteStore.upsert:
+    latest last_updated wins, tie-break by score, full ties go to the new row.
+    only the ids of the new batch are looked up. the history is never sorted
+
+    :param old: curated history indexed by unique id
+    :type old: pandas df
+    :param new: new rows, indexed by id or with an id column
+    :type new: pandas df
+    :return: merged df indexed by id. updated rows keep their position, new ids go last
+    """
+    if "id" in new.columns:
+        new = new.set_index("id")
+    new = latest(new)
+
+    # hash lookup of the batch ids in the history index
+    positions = old.index.get_indexer(new.index)
+    known = positions >= 0
+    updates, positions = new[known], positions[known]
+
+    old_updated = old["last_updated"].values[positions]
+    new_updated = updates["last_updated"].values
+    newer = (new_updated > old_updated) \
+        | ((new_updated == old_updated)
+           & (updates["score"].values >= old["score"].values[positions])) \
+        | pd.isna(old_updated)
+    updates, positions = updates[newer], positions[newer]
+    fresh = new[~known]
+
+    if not len(updates):
+        return pd.concat([old, fresh]) if len(fresh) else old
+
+    merged = pd.concat([old, updates, fresh])
+    # swap the updated rows into their history positions
+    order = np.arange(len(old) + len(updates) + len(fresh))
+    order[positions] = np.arange(len(old), len(old) + len(updates))
+    order = np.delete(order, np.arange(len(old), len(old) + len(updates)))
+    return merged.take(order)
+
+
+class CsvStore:
+    """pipe delimited csv. the original curated format.
+    every save reads the whole history, merges and rewrites it.
+    a long running process (daemon.py) appends instead. read keeps the latest row per id
+    """
+    extension = "csv"
+    # upsert is a full read + rewrite. ModelBase.model merges in memory instead
+    upserts_in_place = False
+
+    def __init__(self, path, ticker_cols, delim="|"):
+        """init
+
+        :param path: curated file
+        :type path: str
+        :param ticker_cols: list columns. ie - title_ticker
+        :type ticker_cols: list
+        :param delim: csv delimiter
+        :type delim: str
+        """
+        self.path = path
+        self.ticker_cols = list(ticker_cols)
+        self.delim = delim
+
+    def exists(self):
+        return Path(self.path).exists()
+
+    def read(self):
+        df = pd.read_csv(
+            self.path,
+            sep=self.delim,
+            parse_dates=DATE_COLS,
+            dtype={col: str for col in self.ticker_cols},
+        )
+        for col in self.ticker_cols:
+            if col in df.columns:
+                df[col] = decode_list_column(df[col])
+
+        # leftovers of saving a frame without the id index
+        df = df.drop(columns=[c for c in df.columns if c.startswith("Unnamed:")])
+        if "id" in df.columns:
+            # ids appended again. see append
+            df = latest_in_order(df)
+        return df
+
+    def _encode(self, df):
+        if "id" in df.columns:
+            df = df.set_index("id")
+
+        df = df.copy()
+        for col in self.ticker_cols:
+            if col in df.columns:
+                df[col] = encode_list_column(df[col])
+        return df
+
+    def write(self, df):
+        """overwrite the whole curated file
+        """
+        df = self._encode(df)
+        Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        df.to_csv(
+            self.path,
+            sep=self.delim,
+            date_format=DATE_FORMAT
+        )
+
+    def append(self, df):
+        """add rows to the end of the curated file without reading or rewriting it.
+        known ids are appended again. rows with a column the file does not have,
+        or a file in a legacy layout, fall back to a full upsert
+
+        :param df: rows that won the merge. see ModelBase.curate_new
+        :type df: pandas df
+        """
+        if not self.exists():
+            self.write(df)
+            return
+
+        # the header only
+        header = pd.read_csv(self.path, sep=self.delim, nrows=0).columns
+        columns = header[1:]
+        if header[0] != "id" or any(col.startswith("Unnamed:") for col in header) or \
+                not set(df.columns) - {"id"} <= set(columns):
+            # a new column, or a legacy layout. ie - a blank index column before id.
+            # rewritten once in the current layout, later appends line up
+            self.upsert(df, merge_latest)
+            return
+
+        self._encode(df).reindex(columns=columns).to_csv(
+            self.path,
+            sep=self.delim,
+            date_format=DATE_FORMAT,
+            mode="a",
+            header=False
+        )
+
+    def upsert(self, df, merge):
+        """merge new rows into the curated file
+
+        :param df: new rows
+        :type df: pandas df
+        :param merge: merge(old, new) -> df indexed by id
+        :type merge: function
+        """
+        old_df = None
+        # try catch for first time run. ie - curated file does not exist
+        try:
+            old_df = self.read().set_index("id")
+        except Exception as err:
+            print(str(err))
+
+        if old_df is not None:
+            df = merge(old=old_df, new=df)
+
+        self.write(df)
+
+
+class SqliteStore:
+    """sqlite table with id as primary key.
+    a save only upserts the new rows: latest last_updated wins, tie-break by score.
+    ticker lists use the same ; delimited encoding as CsvStore.
+    """
+    extension = "sqlite"
+    table = "curated"
+    upserts_in_place = True
+
+    def __init__(self, path, ticker_cols, delim=None):
+        """init
+
+        :param path: sqlite file
+        :type path: str
+        :param ticker_cols: list columns. ie - title_ticker
+        :type ticker_cols: list
+        :param delim: unused. same signature as CsvStore
+        """
+        self.path = path
+        self.ticker_cols = list(ticker_cols)
+
+    def exists(self):
+        if not Path(self.path).exists():
+            return False
+        with self._connect() as conn:
+            return bool(self._columns(conn))
+
+    @contextmanager
+    def _connect(self):
+        """commit on success and always close
+        """
+        Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(self.path)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _columns(self, conn):
+        rows = conn.execute(f'PRAGMA table_info("{self.table}")').fetchall()
+        return [row[1] for row in rows]
+
+    def _encode(self, df):
+        """pandas -> sqlite friendly values.
+        lists to json, datetimes to sortable iso strings, objects (ie - praw Redditor) to str
+        """
+        df = df.copy()
+        if df.index.name == "id":
+            df = df.reset_index()
+
+        for col in self.ticker_cols:
+            if col in df.columns:
+                df[col] = encode_list_column(df[col])
+
+        for col in df.columns:
+            series = df[col]
+            if pd.api.types.is_datetime64_any_dtype(series):
+                df[col] = series.dt.strftime(DATE_FORMAT).astype(object)
+                df.loc[series.isna(), col] = None
+            elif series.dtype == object:
+                df[col] = [
+                    json.dumps(v) if isinstance(v, list)
+                    else v if v is None or isinstance(v, (str, int, float))
+                    else str(v)
+                    for v in series
+                ]
+
+        return df.astype(object).where(df.notna(), None)
+
+    def _ensure_table(self, conn, columns):
+        existing = self._columns(conn)
+        if not existing:
+            cols = ", ".join(f'"{c}"' for c in columns if c != "id")
+            conn.execute(
+                f'CREATE TABLE "{self.table}" ("id" TEXT PRIMARY KEY, {cols})')
+            return
+
+        for col in columns:
+            if col not in existing:
+                conn.execute(f'ALTER TABLE "{self.table}" ADD COLUMN "{col}"')
+
+    def read(self):
+        with self._connect() as conn:
+            df = pd.read_sql_query(f'SELECT * FROM "{self.table}"', conn)
+
+        for col in DATE_COLS:
+            if col in df.columns:
+                df[col] = pd.to_datetime(df[col], format=DATE_FORMAT)
+
+        for col in self.ticker_cols:
+            if col in df.columns:
+                df[col] = decode_list_column(df[col])
+
+        return df
+
+    def write(self, df):
+        """overwrite the whole table
+        """
+        with self._connect() as conn:
+            conn.execute(f'DROP TABLE IF EXISTS "{self.table}"')
+        self.upsert(df)
+
+    def append(self, df):
+        """same as upsert. rows are merged in place
+        """
+        self.upsert(df)
+
+    def upsert(self, df, merge=None):
+        """insert new ids, update known ids if the new row is newer
+
+        :param df: new rows
+        :type df: pandas df
+        :param merge: unused. the merge happens in sql
+        """
+        df = self._encode(df)
+        columns = list(df.columns)
+        quoted = ", ".join(f'"{c}"' for c in columns)
+        params = ", ".join("?" for _ in columns)
+        updates = ", ".join(f'"{c}" = excluded."{c}"' for c in columns if c != "id")
+
+        sql = f'''
+            INSERT INTO "{self.table}" ({quoted}) VALUES ({params})
+            ON CONFLICT("id") DO UPDATE SET {updates}
+            WHERE excluded.last_updated > "{self.table}".last_updated
+            OR (excluded.last_updated = "{self.table}".last_updated
+                AND excluded.score >= "{self.table}".score)
+        '''
+        with self._connect() as conn:
+            self._ensure_table(conn, columns)
+            conn.executemany(sql, df.itertuples(index=False, name=None))
+
+
+STORES = {
+    "csv": CsvStore,
+    "sqlite": SqliteStore,
+}
@@ -0,0 +1,221 @@
+# TICKER MATCHING
+
+import hashlib
+import pickle
+import re
+import threading
+from pathlib import Path
+
+# https://stackoverflow.com/questions/57483859/pandas-finding-matchany-between-list-of-strings-and-df-column-valuesas-list
+TICKER_PATTERN = re.compile(r"(\$*[A-Z]{1,5})(?=[\s\.\?\!\,])+")
+
+
+class TickerMatcher:
+    """compiled ticker matcher.
+    build it once from the listings + stoplist, then reuse it for every column.
+    the regex is compiled once and lookups hit a frozenset instead of
+    rebuilding a set of ~6k symbols for every token.
+    """
+
+    def __init__(self, tickers, words=()):
+        """init
+
+        :param tickers: all listed symbols (nyse + nasdaq)
+        :type tickers: iterable
+        :param words: stoplist. symbols that are also common words
+        :type words: iterable
+        """
+        self.pattern = TICKER_PATTERN
+        self.words = frozenset(words)
+        self.tickers = frozenset(t for t in tickers if t not in self.words)
+
+    def __contains__(self, ticker):
+        return ticker in self.tickers
+
+    def __len__(self):
+        return len(self.tickers)
+
+    def findall(self, series):
+        """regex candidates for a whole column
+
+        :param series: text column
+        :type series: pandas series obj
+        :return: series of lists. same as str.findall
+        """
+        return series.str.findall(self.pattern)
+
+    def match(self, candidates):
+        """keep only the candidates that are listed tickers
+
+        :param candidates: iterable of lists, ie - output of findall
+        :type candidates: iterable
+        :return: list of lists of tickers with the $ stripped
+        """
+        tickers = self.tickers
+        return [
+            [t for t in (val.lstrip("$") for val in sublist) if t in tickers]
+            if isinstance(sublist, list) else []
+            for sublist in candidates
+        ]
+
+    def clean(self, series):
+        """strip quotes / whitespace and drop stoplist words from a column of ticker lists.
+        the exploded column is factorized, so the string cleanup and the stoplist isin
+        only run once per distinct ticker. then it is split back into one list per row
+
+        :param series: column of lists
+        :type series: pandas series obj
+        :return: list of lists, same length as series
+        """
+        import numpy as np
+        import pandas as pd
+
+        n = len(series)
+        exploded = pd.Series(series.values, index=pd.RangeIndex(n)).explode()
+        # empty lists explode to NaN -> code -1
+        codes, uniques = pd.factorize(exploded.values)
+        uniques = pd.Series(uniques, dtype=object)\
+            .str.replace(r"['\"]", "", regex=True).str.strip()
+        keep_unique = (uniques.notna() & ~uniques.isin(self.words)).values
+
+        keep = codes >= 0
+        keep[keep] = keep_unique[codes[keep]]
+        tickers = uniques.values[codes[keep]].tolist()
+
+        ends = np.cumsum(np.bincount(exploded.index.values[keep],
+                                     minlength=n)).tolist()
+        return [tickers[start:end] for start, end in zip([0] + ends[:-1], ends)]
+
+    def extract(self, series):
+        """findall + match in one batch
+
+        :param series: text column
+        :type series: pandas series obj
+        :return: tuple of (regex candidates, tickers)
+        """
+        candidates = self.findall(series)
+        return candidates, self.match(candidates.values)
+
+
+class TickerUniverse:
+    """immutable nyse + nasdaq listings.
+    one instance per process is shared by every model. see load_universe
+    """
+    __slots__ = ("nyse_tickers", "nasdaq_tickers", "_matchers", "_lock")
+
+    def __init__(self, nyse_tickers, nasdaq_tickers):
+        object.__setattr__(self, "nyse_tickers", tuple(nyse_tickers))
+        object.__setattr__(self, "nasdaq_tickers", tuple(nasdaq_tickers))
+        object.__setattr__(self, "_matchers", {})
+        object.__setattr__(self, "_lock", threading.Lock())
+
+    def __setattr__(self, name, value):
+        raise AttributeError("TickerUniverse is immutable")
+
+    @property
+    def tickers(self):
+        return self.nyse_tickers + self.nasdaq_tickers
+
+    def matcher(self, words=()):
+        """TickerMatcher for a stoplist. memoized per stoplist
+
+        :param words: stoplist
+        :type words: iterable
+        """
+        key = frozenset(words)
+        with self._lock:
+            if key not in self._matchers:
+                self._matchers[key] = TickerMatcher(self.tickers, key)
+            return self._matchers[key]
+
+
+_UNIVERSES = {}
+_UNIVERSES_LOCK = threading.Lock()
+
+SNAPSHOT_VERSION = 1
+
+
+def _fingerprint(path):
+    """(mtime, sha1) of a listing csv
+    """
+    path = Path(path)
+    return path.stat().st_mtime_ns, hashlib.sha1(path.read_bytes()).hexdigest()
+
+
+def _parse_listings(nyse_path, nasdaq_path):
+    # pandas is only needed on a cold start
+    import pandas as pd
+
+    nyse = pd.read_csv(nyse_path)["ACT Symbol"].tolist()
+    nasdaq = pd.read_csv(nasdaq_path)["Symbol"].tolist()
+    return nyse, nasdaq
+
+
+def _read_snapshot(snapshot_path, paths):
+    """return listings from the snapshot if it still matches the csvs
+    mtime match is the fast path. fall back to the content hash for
+    touched but unchanged files. ie - fresh git checkout
+    """
+    try:
+        with open(snapshot_path, "rb") as f:
+            snapshot = pickle.load(f)
+    except Exception:
+        return None
+
+    if snapshot.get("version") != SNAPSHOT_VERSION:
+        return None
+
+    for path, (mtime, sha1) in zip(paths, snapshot["fingerprints"]):
+        if Path(path).stat().st_mtime_ns != mtime and \
+                _fingerprint(path)[1] != sha1:
+            return None
+
+    return snapshot["nyse"], snapshot["nasdaq"]
+
+
+def _write_snapshot(snapshot_path, paths, nyse, nasdaq):
+    snapshot = {
+        "version": SNAPSHOT_VERSION,
+        "fingerprints": [_fingerprint(path) for path in paths],
+        "nyse": nyse,
+        "nasdaq": nasdaq,
+    }
+    try:
+        with open(snapshot_path, "wb") as f:
+            pickle.dump(snapshot, f, protocol=pickle.HIGHEST_PROTOCOL)
+    except Exception as err:
+        # read only checkout. still works, just cold every time
+        print(str(err))
+
+
+def load_universe(nyse_path="./nyse-listed.csv",
+                  nasdaq_path="./nasdaq-listed.csv", snapshot_path=None):
+    """load the ticker universe once per process
+
+    warm starts read a pickle snapshot instead of parsing the csvs.
+    the snapshot is keyed by the csv mtimes + content hashes.
+
+    :param nyse_path: nyse listing csv
+    :type nyse_path: str
+    :param nasdaq_path: nasdaq listing csv
+    :type nasdaq_path: str
+    :param snapshot_path: pickle snapshot. (default: .tickers.pkl next to nyse csv)
+    :type snapshot_path: str
+    :return: shared TickerUniverse
+    """
+    paths = (str(Path(nyse_path).resolve()), str(Path(nasdaq_path).resolve()))
+    with _UNIVERSES_LOCK:
+        if paths in _UNIVERSES:
+            return _UNIVERSES[paths]
+
+        if snapshot_path is None:
+            snapshot_path = Path(paths[0]).parent / ".tickers.pkl"
+
+        listings = _read_snapshot(snapshot_path, paths)
+        if listings is None:
+            listings = _parse_listings(*paths)
+            _write_snapshot(snapshot_path, paths, *listings)
+
+        universe = TickerUniverse(*listings)
+        _UNIVERSES[paths] = universe
+        return universe
@@ -0,0 +1,41 @@
+# PROCESS POOL WORKERS
+
+# one model per worker process and model settings.
+# the ticker universe + matcher are built once per process, not once per task
+_models = {}
+
+
+def worker_model(name, model_kwargs):
+    """model without a reddit client. the rows are already fetched
+
+    :param name: model class name
+    :type name: str
+    :param model_kwargs: output, storage, etc. see ModelBase.worker_kwargs
+    :type model_kwargs: dict
+    """
+    key = (name, *sorted(model_kwargs.items()))
+    if key not in _models:
+        import models
+        _models[key] = getattr(models, name)(subreddit=None, timefilter="day",
+                                             limit=None, **model_kwargs)
+    return _models[key]
+
+
+def run_model(name, model_kwargs, df):
+    """ModelBase.model in a worker process: extract -> read -> merge -> clean -> save -> chart
+
+    :param name: model class name
+    :type name: str
+    :param model_kwargs: see ModelBase.worker_kwargs
+    :type model_kwargs: dict
+    :param df: raw df
+    :type df: pandas df
+    :return: stage timings, metrics records
+    """
+    from metrics import Metrics
+
+    model = worker_model(name, model_kwargs)
+    # fresh records per task. the cached model outlives it
+    model.metrics = Metrics()
+    model.model(df)
+    return model.stage_timings, model.metrics.records